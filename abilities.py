@@ -1,10 +1,70 @@
 import os
 import sys
+import json
 import psutil
 import shutil
+import itertools
 import subprocess
+import time
 from datetime import datetime
-from assistant import Assistant, json
+from typing import Dict, List, Optional, Sequence
+from assistant import Assistant
+from sampler import system_sampler as sampler
+from shell import ShellPool
+from workers import cancel_token
+from diskusage import DiskUsageScanner
+from fileindex import EntryKind, FileIndex
+from reader import MappedFile, hex_dump, read_bytes, read_lines, search
+from listing import (SortBy, count_children_parallel, entry_stat, entry_type,
+                     list_entries)
+from snapshot import ProcessSortBy, SnapshotCache, top_processes
+from portscan import (MAX_PROBES, PortState, is_local_address, parse_hosts,
+                      parse_ports, resolve_hosts, scan)
+from partitions import PARTITION_FIELDS, PartitionInfo, PartitionUsageReader
+
+# keep sampling the system usage so get_system_usage returns instantly
+sampler.start()
+
+# the shell of the abilities called without an assistant
+shell_pool = ShellPool()
+disk_usage_scanner = DiskUsageScanner()
+file_index = FileIndex()
+# the abilities called in the same turn share one snapshot of the processes,
+# sockets and interfaces
+system_snapshots = SnapshotCache()
+# a stale network mount costs its timeout instead of hanging the call
+partition_usage = PartitionUsageReader()
+
+# directories with more entries are listed as 1000+ files
+CHILDREN_COUNT_CAP = 1000
+
+# the most bytes read_file returns at once
+READ_LIMIT = 1024 * 1024
+
+# long command lines are cut to keep the processes list short
+COMMAND_LIMIT = 120
+
+# a scan stops and returns what it found after this many seconds
+SCAN_DEADLINE = 300
+
+# longer environment values are cut unless the variable is asked by name
+ENV_VALUE_LIMIT = 200
+
+SYSTEM_USAGE_SECTIONS = ("cpu", "memory", "disks", "disk_io", "load")
+SYSTEM_USAGE_WINDOWS = {"1min": 60, "5min": 5 * 60, "15min": 15 * 60}
+
+
+def current_shell() -> ShellPool:
+    """The shell of the assistant running the ability, so the sessions of
+    the server never see the directory or the variables of each other"""
+    assistant = Assistant.current()
+    return shell_pool if assistant is None else assistant.shell
+
+
+def resolve_path(path: str) -> str:
+    """Resolve a path given by the model against the working directory of the
+    shell, so a relative path means the same to every ability"""
+    return os.path.join(current_shell().cwd, os.path.expanduser(path))
 
 
 @Assistant.ability()
@@ -17,11 +77,11 @@ def get_date_and_time():
     )
 
 
-@Assistant.ability(path="the path to get its type")
+@Assistant.ability(cache_ttl=60, path="the path to get its type")
 def get_path_type(path: str) -> str:
     """Returns the type of the path: file, directory or link"""
     try:
-        path = os.path.expanduser(path)
+        path = resolve_path(path)
         if os.path.isfile(path):
             return "file"
         elif os.path.isdir(path):
@@ -39,7 +99,7 @@ def get_path_size(path: str) -> str:
     """Returns the size in bytes of the file
     or the number of files in the directory depends on the path type"""
     try:
-        path = os.path.expanduser(path)
+        path = resolve_path(path)
         if os.path.isfile(path):
             return f"{os.path.getsize(path)} bytes"
         elif os.path.isdir(path):
@@ -50,37 +110,241 @@ def get_path_size(path: str) -> str:
         return "Error: Failed to get path size/count"
 
 
-@Assistant.ability(path="the path where the files to list are located")
-def get_files(path: str) -> str:
+@Assistant.ability(
+    path="the path where the files to list are located",
+    offset="the number of entries to skip, used to get the next pages",
+    limit="the maximum number of entries to list",
+    sort="the order of the entries, none is the fastest for huge directories",
+    pattern="a glob pattern to filter the entries by their names, like: *.py",
+    count_children="count the entries of the listed directories, the count "
+                   "stops at 1000")
+def get_files(path: str,
+              offset: int = 0,
+              limit: int = 100,
+              sort: SortBy = SortBy.name,
+              pattern: str = "*",
+              count_children: bool = True) -> str:
     """Get a list of files/directories in specific path each one in a new line
     each line is formatted as the following:
 
     filetype: file, directory or link
     filesize: the size of the file in bytes or number of files in the directory
     in case of a directory
-    filename: the name of the file/directory"""
-    try:
-        files = os.listdir(os.path.expanduser(path))
-        formatted_files = []
-
-        for file in files:
-            filepath = os.path.join(path, file)
-            filetype = get_path_type(filepath)
-            filesize = get_path_size(filepath)
-            formatted_files.append(f"{filetype}, {filesize}, {file}")
-        return "\n".join(formatted_files)
-    except Exception:
-        return "Error: Failed to get files list"
+    filename: the name of the file/directory
 
+    the last line tells the listed range and the offset of the next page"""
+    try:
+        page = list_entries(resolve_path(path), int(offset), int(limit),
+                            SortBy(sort), pattern)
+    except Exception as e:
+        return f"Error: Failed to get files list: {e}"
+
+    types = [entry_type(entry) for entry in page.entries]
+    counts: Dict[str, Optional[int]] = {}
+    if count_children:
+        counts = count_children_parallel([
+            entry.path
+            for entry, filetype in zip(page.entries, types)
+            if filetype == "directory"
+        ], CHILDREN_COUNT_CAP)
+
+    formatted_files = []
+    for entry, filetype in zip(page.entries, types):
+        if filetype == "directory":
+            count = counts.get(entry.path)
+            if not count_children:
+                filesize = "not counted"
+            elif count is None:
+                filesize = "unknown"
+            elif count >= CHILDREN_COUNT_CAP:
+                filesize = f"{count}+ files"
+            else:
+                filesize = f"{count} files"
+        else:
+            stat = entry_stat(entry)
+            filesize = f"{stat.st_size} bytes" if stat else "unknown"
+        formatted_files.append(f"{filetype}, {filesize}, {entry.name}")
+
+    start = max(int(offset), 0)
+    if len(page.entries) == 0:
+        footer = f"[no entries after offset {start}"
+    else:
+        footer = f"[entries {start + 1}-{start + len(page.entries)}"
+    if page.total is not None:
+        footer += f" of {page.total}"
+    if page.has_more:
+        footer += f", next offset: {start + len(page.entries)}"
+    formatted_files.append(footer + "]")
+    return "\n".join(formatted_files)
+
+
+@Assistant.ability(
+    timeout=300, cache_ttl=60,
+    path="the directory to compute its disk usage",
+    top="the number of the largest directories and files to return")
+def get_disk_usage(path: str, top: int = 10) -> str:
+    """Get the recursive disk usage in bytes of a directory and its largest
+    subdirectories and files, used to find what is using the disk space,
+    other file systems mounted inside the directory are not counted"""
+    try:
+        report = disk_usage_scanner.scan(resolve_path(path), int(top))
+    except Exception as e:
+        return f"Error: Failed to get disk usage: {e}"
 
-@Assistant.ability(path="The path of the file to read")
-def read_file(path: str) -> str:
-    """Read a file using its path"""
-    with open(os.path.expanduser(path), "r") as f:
-        return f.read()
+    return json.dumps({
+        "total_bytes": report.total,
+        "largest_directories": report.directories,
+        "largest_files": report.files,
+        "scanned_directories": report.scanned,
+        "unchanged_directories": report.reused,
+        "unreadable_directories": report.errors,
+        "complete": report.complete,
+        "elapsed_seconds": report.elapsed,
+    })
 
 
-@Assistant.ability()
+@Assistant.ability(
+    timeout=300,
+    path="the directory to search in with all its subdirectories",
+    name="a part of the names to find, ignoring the case",
+    pattern="a glob pattern matching the whole names, like: *.py",
+    extension="the extension of the files to find without the dot, like: pdf",
+    min_size="the minimum size in bytes, 0 for no minimum",
+    max_size="the maximum size in bytes, 0 for no maximum",
+    kind="the kind of the entries to find",
+    include_hidden="search inside the hidden files and directories too",
+    limit="the maximum number of entries to return")
+def find_files(path: str = "~",
+               name: str = "",
+               pattern: str = "",
+               extension: str = "",
+               min_size: int = 0,
+               max_size: int = 0,
+               kind: EntryKind = EntryKind.any,
+               include_hidden: bool = False,
+               limit: int = 100) -> str:
+    """Find files and directories anywhere under a path by their name, glob
+    pattern, extension, size or kind in one call, the paths are kept in an
+    index so it is much faster than walking the directories or running find.
+    Other file systems mounted inside the path are not searched, every match
+    is its path, kind, size in bytes and modification time"""
+    try:
+        search = file_index.find(
+            resolve_path(path), name, pattern, extension, int(min_size),
+            int(max_size), EntryKind(kind), include_hidden, int(limit))
+    except Exception as e:
+        return f"Error: Failed to find files: {e}"
+
+    result: Dict[str, object] = {
+        "matches": [
+            [match.path, match.kind.value, match.size,
+             datetime.fromtimestamp(match.mtime).strftime("%Y-%m-%d %H:%M")]
+            for match in search.matches
+        ],
+        "more_matches": search.truncated,
+        "indexed_entries": search.indexed_entries,
+        "index_bytes": search.index_bytes,
+        "elapsed_seconds": search.elapsed,
+    }
+    if search.refresh is not None:
+        result["refreshed_directories"] = search.refresh.scanned
+        result["unchanged_directories"] = search.refresh.reused
+        result["unreadable_directories"] = search.refresh.errors
+        result["refresh_complete"] = search.refresh.complete
+        result["refresh_seconds"] = search.refresh.elapsed
+    return json.dumps(result)
+
+
+@Assistant.ability(
+    path="The path of the file to read",
+    start_line="the number of the first line to read, starting from 1",
+    line_count="the number of lines to read",
+    offset="the byte offset to start reading from when length is set",
+    length="the number of bytes to read, reads bytes instead of lines")
+def read_file(path: str,
+              start_line: int = 1,
+              line_count: int = 100,
+              offset: int = 0,
+              length: int = 0) -> str:
+    """Read a range of lines or bytes of a file, huge files are not loaded in
+    memory so read them page by page, binary files are read as hex dumps
+    the last line tells the encoding and where the next page starts"""
+    try:
+        with MappedFile(resolve_path(path)) as file:
+            encoding = file.encoding or "binary"
+
+            if length > 0 or file.is_binary:
+                offset = max(int(offset), 0)
+                if file.is_binary:
+                    # a hex dump line is about 4 times the bytes it shows
+                    content, end = hex_dump(
+                        file, offset, min(int(length) or 512, READ_LIMIT // 4))
+                else:
+                    content, end = read_bytes(
+                        file, offset, min(int(length), READ_LIMIT))
+                footer = f"[bytes {offset}-{end} of {file.size}"
+                if end < file.size:
+                    footer += f", next offset: {end}"
+                return f"{content}\n{footer}, encoding: {encoding}]"
+
+            start_line = max(int(start_line), 1)
+            lines, position = read_lines(
+                file, start_line, max(int(line_count), 1), READ_LIMIT)
+            if len(lines) == 0:
+                return f"[no lines from line {start_line}, " \
+                       f"the file has {file.size} bytes]"
+
+            footer = f"[lines {start_line}-{start_line + len(lines) - 1}"
+            if position is not None:
+                if file.data[position - 1] == ord("\n"):
+                    footer += f", next line: {start_line + len(lines)}"
+                else:
+                    footer += f", the last line was cut, next offset: " \
+                              f"{position}"
+            return "\n".join(lines) + f"\n{footer}, encoding: {encoding}]"
+    except Exception as e:
+        return f"Error: Failed to read file: {e}"
+
+
+@Assistant.ability(
+    path="The path of the file to search",
+    pattern="the text to search for",
+    is_regex="whether the pattern is a regular expression",
+    ignore_case="whether to ignore the case of the letters",
+    max_matches="the maximum number of matching lines to return")
+def search_file(path: str,
+                pattern: str,
+                is_regex: bool = False,
+                ignore_case: bool = False,
+                max_matches: int = 50) -> str:
+    """Search a file for the lines matching a pattern like grep, returns the
+    matching lines with their line numbers, huge files are searched without
+    loading them in memory"""
+    try:
+        max_matches = max(int(max_matches), 1)
+        with MappedFile(resolve_path(path)) as file:
+            # one more match tells if there are more
+            matches = list(itertools.islice(
+                search(file, pattern, ignore_case, is_regex),
+                max_matches + 1))
+    except Exception as e:
+        return f"Error: Failed to search file: {e}"
+
+    if len(matches) == 0:
+        return "no matches"
+
+    results = [
+        f"offset {match.offset}" if file.is_binary
+        else f"{match.line}: {match.text}"
+        for match in matches[:max_matches]
+    ]
+    if len(matches) > max_matches:
+        results.append(f"[more than {max_matches} matches, "
+                       "use a more specific pattern]")
+    return "\n".join(results)
+
+
+@Assistant.ability(cache_ttl=600)
 def get_package_managers() -> str:
     """Get a list of known package managers and its paths on the system if
     any of them is installed on the system"""
@@ -94,7 +358,8 @@ def get_package_managers() -> str:
         return "Error: Failed to get package managers list"
 
 
-@Assistant.ability(command_name="the name of the command to check")
+@Assistant.ability(cache_ttl=600,
+                   command_name="the name of the command to check")
 def is_command_installed(command_name: str) -> str:
     """Check if a command is installed on the system"""
     try:
@@ -106,99 +371,412 @@ def is_command_installed(command_name: str) -> str:
         return "Error: Failed to check if command is installed"
 
 
-@Assistant.ability(command="The shell command to execute")
-def execute(command: str) -> str:
-    """Execute a shell command and returns the returned code, stdout and stderr
-    """
+# commands that only read the system state and never invalidate the cache
+READ_ONLY_COMMANDS = {
+    "cat", "date", "df", "du", "echo", "env", "file", "find", "free", "grep",
+    "head", "hostname", "id", "ip", "ls", "lsblk", "lscpu", "printenv", "ps",
+    "pwd", "stat", "tail", "uname", "uptime", "wc", "which", "whoami",
+}
 
-    try:
-        result = subprocess.run(
-            command, shell=True, text=True,
-            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
-        stdout = result.stdout.strip()
-        stderr = result.stderr.strip()
 
-        if len(stderr) > 0:
-            print(stderr, file=sys.stderr)
+def may_change_system(command: str) -> bool:
+    """Check if a shell command could change the results of the cached
+    abilities, like installing a package or creating a file"""
+    if any(token in command for token in (">", "`", "$(", "&", "|", ";")):
+        return True
+    words = command.split()
+    return len(words) == 0 or words[0] not in READ_ONLY_COMMANDS
 
-        return json.dumps({
-            "return_code": result.returncode,
-            "stdout": stdout,
-            "stderr": stderr,
-        })
-    except subprocess.CalledProcessError as e:
-        print(e)
-        return json.dumps({
-            "return_code": e.returncode,
-            "stdout": e.stdout,
-            "stderr": e.stderr,
-        })
-
-
-@Assistant.ability()
-def get_environment_variables():
-    """Get all environment variables"""
-    return json.dumps(dict(os.environ))
 
+@Assistant.ability(invalidates_cache=may_change_system,
+                   command="The shell command to execute")
+async def execute(command: str) -> str:
+    """Execute a shell command and returns the returned code, stdout and stderr
+    the shell keeps its working directory and variables between commands and
+    the relative paths of the other abilities start from its directory, a
+    command run while another one is running starts in the same directory
+    without the variables, long outputs keep only their beginning and end,
+    the command is killed if it runs for too long or prints too much and the
+    shell is restarted in the same directory"""
+
+    result = await current_shell().run_async(command, cancel_token())
+    if may_change_system(command):
+        # the command may have created or removed files
+        file_index.invalidate()
+
+    if len(result.stderr) > 0:
+        assistant = Assistant.current()
+        if assistant is not None:
+            assistant.output_stderr(result.stderr)
+        else:
+            print(result.stderr, file=sys.stderr)
 
-@Assistant.ability()
-def get_disk_partitions():
-    """Get all system disks, their information and usage"""
-    results = list()
-
-    for partition in psutil.disk_partitions():
-        usage = psutil.disk_usage(partition.device)
-
-        results.append({
-            "disk": partition.device,
-            "usage_total": usage.total,
-            "usage_used": usage.used,
-            "usage_free": usage.free,
-            "usage_percent": usage.percent,
-            "mountpoint": partition.mountpoint,
-            "fstype": partition.fstype,
-            "mount_options": partition.opts,
-        })
-
-    return json.dumps(results)
+    return json.dumps({
+        "return_code": result.return_code,
+        "stdout": result.stdout,
+        "stderr": result.stderr,
+        "stdout_dropped_bytes": result.stdout_dropped,
+        "stderr_dropped_bytes": result.stderr_dropped,
+        "elapsed_seconds": result.elapsed,
+        "killed": result.killed,
+        "shell_restarted": result.restarted,
+    })
 
 
-@Assistant.ability()
-def get_system_usage():
-    """Get system usage like: cpu, memory, disk"""
-    # Get CPU usage in 1 minutes
-    cpu_percent_1 = psutil.cpu_percent(interval=1)
-    # Get CPU usage in 5 minutes
-    cpu_percent_5 = psutil.cpu_percent(interval=5)
-    # Get CPU usage in 15 minutes
-    cpu_percent_15 = psutil.cpu_percent(interval=15)
-
-    # Get memory usage
-    memory_info = psutil.virtual_memory()
+def parse_fields(fields: str, available: Sequence[str],
+                 default: Sequence[str]) -> List[str]:
+    """Parse a projection of comma separated fields, empty for the default
+    ones, raises ValueError on unknown fields"""
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in available]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}, the fields "
+                         f"are: {', '.join(available)}")
+    return list(dict.fromkeys(selected)) or list(default)
+
+
+def to_table(columns: Sequence[str], rows: List) -> Dict[str, list]:
+    """Tabulate named tuples, the names are sent once instead of per row"""
+    return {
+        "columns": list(columns),
+        "rows": [[getattr(row, column) for column in columns]
+                 for row in rows],
+    }
+
+
+@Assistant.ability(
+    names="the names of the variables to get separated by commas, their "
+          "values are never cut",
+    prefix="only the variables starting with this prefix, like: XDG_",
+    search="only the variables with this text in their name, ignoring the "
+           "case",
+    values="include the values, false to list the names only")
+def get_environment_variables(names: str = "",
+                              prefix: str = "",
+                              search: str = "",
+                              values: bool = True) -> str:
+    """Get the environment variables as a table of names and values sorted
+    by name, long values are cut so get a variable by its name for its full
+    value"""
+    selected = [name.strip() for name in names.split(",") if name.strip()]
+    search = search.lower()
+
+    rows = []
+    cut = 0
+    for name in sorted(selected or os.environ):
+        if name not in os.environ or not name.startswith(prefix) or \
+                search not in name.lower():
+            continue
+        if not values:
+            rows.append([name])
+            continue
+
+        value = os.environ[name]
+        if not selected and len(value) > ENV_VALUE_LIMIT:
+            value = value[:ENV_VALUE_LIMIT] + "..."
+            cut += 1
+        rows.append([name, value])
+
+    result: Dict[str, object] = {
+        "columns": ["name", "value"] if values else ["name"],
+        "rows": rows,
+    }
+    missing = [name for name in selected if name not in os.environ]
+    if missing:
+        result["not_set"] = missing
+    if cut:
+        result["cut_values"] = cut
+    return json.dumps(result)
+
+
+def read_partitions(mountpoint: str = "",
+                    device: str = "",
+                    fstype: str = "") -> List[PartitionInfo]:
+    mountpoint = mountpoint.rstrip("/")
+    partitions = [
+        partition for partition in psutil.disk_partitions()
+        if (not mountpoint or partition.mountpoint == mountpoint or
+            partition.mountpoint.startswith(mountpoint + "/")) and
+        (not device or device in partition.device) and
+        (not fstype or partition.fstype == fstype)
+    ]
+    return partition_usage.read(partitions)
+
+
+@Assistant.ability(
+    cache_ttl=30,
+    fields="the columns to get separated by commas, from: "
+           f"{', '.join(PARTITION_FIELDS)}, all of them but options by "
+           "default",
+    mountpoint="only the partitions mounted on this path or under it",
+    device="only the partitions with this text in their device",
+    fstype="only the partitions of this file system type, like: ext4")
+def get_disk_partitions(fields: str = "",
+                        mountpoint: str = "",
+                        device: str = "",
+                        fstype: str = "") -> str:
+    """Get the mounted disk partitions and their usage in bytes as a table,
+    the usage of a partition not answering in time, like a stale network
+    mount, is null"""
+    try:
+        columns = parse_fields(
+            fields, PARTITION_FIELDS,
+            [field for field in PARTITION_FIELDS if field != "options"])
+        partitions = read_partitions(mountpoint, device, fstype)
+    except Exception as e:
+        return f"Error: Failed to get disk partitions: {e}"
+
+    result: Dict[str, object] = to_table(columns, partitions)
+    hanging = partition_usage.hanging
+    unresponsive = [partition.mountpoint for partition in partitions
+                    if partition.mountpoint in hanging]
+    if unresponsive:
+        result["unresponsive"] = unresponsive
+    return json.dumps(result)
+
+
+@Assistant.ability(
+    sections="the parts of the usage to get separated by commas, from: "
+             f"{', '.join(SYSTEM_USAGE_SECTIONS)}, all of them by default")
+def get_system_usage(sections: str = "") -> str:
+    """Get system usage like: cpu, memory, disks usage, disk io rates in
+    bytes per second and load average, the cpu, memory and disk io are
+    averages over the last 1, 5 and 15 minutes"""
+    try:
+        selected = parse_fields(
+            sections, SYSTEM_USAGE_SECTIONS, SYSTEM_USAGE_SECTIONS)
+    except ValueError as e:
+        return f"Error: {e}"
+
+    usage: Dict[str, object] = {}
+    windows = SYSTEM_USAGE_WINDOWS
+    if "cpu" in selected:
+        usage["cpu_percent"] = {
+            name: sampler.cpu_percent(seconds)
+            for name, seconds in windows.items()
+        }
+    if "memory" in selected:
+        memory_info = sampler.memory or psutil.virtual_memory()
+        usage["memory_percent"] = {
+            name: sampler.memory_percent(seconds)
+            for name, seconds in windows.items()
+        }
+        usage["memory"] = {
+            field: getattr(memory_info, field)
+            for field in ("total", "available", "used", "free", "percent",
+                          "active", "inactive", "buffers", "cached", "shared",
+                          "slab")
+        }
+    if "disk_io" in selected:
+        usage["disk_rates"] = {
+            name: sampler.disk_rates(seconds)
+            for name, seconds in windows.items()
+        }
+    if {"cpu", "memory", "disk_io"} & set(selected):
+        usage["sampled_seconds"] = {
+            name: sampler.covered_seconds(seconds)
+            for name, seconds in windows.items()
+        }
+    if "load" in selected:
+        usage["load_average"] = [
+            round(load, 2) for load in psutil.getloadavg()]
+    if "disks" in selected:
+        usage["disks"] = to_table(
+            ("mountpoint", "total", "used", "percent"), read_partitions())
+
+    return json.dumps(usage)
+
+
+@Assistant.ability(
+    sort="the usage to sort the processes by, io is the disk read and write "
+         "rate and connections is the number of open network connections",
+    top="the number of processes to return",
+    name="only the processes with this text in their name or command",
+    user="only the processes of this user")
+def get_processes(sort: ProcessSortBy = ProcessSortBy.cpu,
+                  top: int = 10,
+                  name: str = "",
+                  user: str = "") -> str:
+    """Get the top processes by cpu, memory, disk io, threads or network
+    connections. cpu_percent is a percent of one core, rss is the memory in
+    bytes and the io rates are bytes per second"""
+    try:
+        sort = ProcessSortBy(sort)
+        snapshot = system_snapshots.get()
+        processes = snapshot.processes().values()
+        connections = snapshot.connection_counts() \
+            if sort == ProcessSortBy.connections else {}
+    except Exception as e:
+        return f"Error: Failed to get processes: {e}"
+
+    name = name.lower()
+    matched = [
+        process for process in processes
+        if (not name or name in process.name.lower() or
+            name in process.command.lower()) and
+        (not user or process.user == user)
+    ]
+
+    results = []
+    for process in top_processes(matched, sort, max(int(top), 1),
+                                 connections):
+        result = {
+            "pid": process.pid,
+            "name": process.name,
+            "user": process.user,
+            "cpu_percent": round(process.cpu_percent, 1),
+            "rss": process.rss,
+            "memory_percent": round(process.memory_percent, 1),
+            "read_rate": round(process.read_rate or 0),
+            "write_rate": round(process.write_rate or 0),
+            "threads": process.threads,
+            "command": process.command[:COMMAND_LIMIT],
+        }
+        if sort == ProcessSortBy.connections:
+            result["connections"] = connections.get(process.pid, 0)
+        results.append(result)
 
     return json.dumps({
-        "disks": get_disk_partitions(),
-        "cpu_1min": cpu_percent_1,
-        "cpu_5min": cpu_percent_5,
-        "cpu_15min": cpu_percent_15,
-        "memory_free": memory_info.free,
-        "memory_used": memory_info.used,
-        "memory_total": memory_info.total,
-        "memory_percent": memory_info.percent,
-        "memory_slab": memory_info.slab,
-        "memory_active": memory_info.active,
-        "memory_inactive": memory_info.inactive,
-        "memory_buffers": memory_info.buffers,
-        "memory_cached": memory_info.cached,
-        "memory_shared": memory_info.shared,
-        "memory_available": memory_info.available,
+        "total": len(processes),
+        "matched": len(matched),
+        "processes": results,
     })
 
 
-# !TODO: check processes network usage
-# !TODO: check listening process and their ports
+@Assistant.ability(
+    port="only the sockets on this port, 0 for all of them",
+    process="only the sockets of processes with this text in their name")
+def get_listening_sockets(port: int = 0, process: str = "") -> str:
+    """Get the listening tcp and udp sockets with their address, port and
+    the pid and name of the process owning them"""
+    try:
+        sockets = system_snapshots.get().listening_sockets()
+    except Exception as e:
+        return f"Error: Failed to get listening sockets: {e}"
+
+    process = process.lower()
+    results = [
+        item._asdict() for item in sockets
+        if (not port or item.port == int(port)) and
+        (not process or process in (item.process or "").lower())
+    ]
+
+    result: Dict[str, object] = {"sockets": results}
+    if any(item["pid"] is None for item in results):
+        result["note"] = "the owners of the sockets of other users are " \
+                         "only known when running as root"
+    return json.dumps(result)
+
+
+@Assistant.ability(
+    name="only the interfaces with this text in their name",
+    include_down="include the interfaces that are down")
+def get_network_interfaces(name: str = "", include_down: bool = False) -> str:
+    """Get the network interfaces with their addresses, state, speed in Mbps,
+    traffic counters in bytes, errors and drops and their send and receive
+    rates in bytes per second since the previous call"""
+    try:
+        interfaces = system_snapshots.get().interfaces()
+    except Exception as e:
+        return f"Error: Failed to get network interfaces: {e}"
+
+    return json.dumps([
+        {
+            **interface._asdict(),
+            "send_rate": None if interface.send_rate is None
+            else round(interface.send_rate),
+            "recv_rate": None if interface.recv_rate is None
+            else round(interface.recv_rate),
+        }
+        for interface in interfaces.values()
+        if (include_down or interface.is_up) and
+        (not name or name in interface.name)
+    ])
+
+
+@Assistant.ability(
+    timeout=SCAN_DEADLINE + 30,
+    targets="the hosts to scan separated by commas, addresses, networks in "
+            "CIDR notation or host names of the machine or its local "
+            "networks, like: 192.168.1.0/24,10.0.0.5",
+    ports="the ports to scan separated by commas, ports or ranges like: "
+          "22,80,8000-8100, common is a list of the common services ports",
+    probe_timeout="seconds to wait for every port to answer",
+    concurrency="the number of ports tried at once",
+    max_results="stop after finding this many open ports")
+async def scan_ports(targets: str,
+                     ports: str = "common",
+                     probe_timeout: float = 1.0,
+                     concurrency: int = 256,
+                     max_results: int = 200) -> str:
+    """Scan hosts for open tcp ports, finds the devices of a local network
+    too as a host answering on any port is up. Only loopback, private and
+    link local addresses are scanned. Returns the hosts that are up with
+    their open ports"""
+    try:
+        hosts = parse_hosts(targets)
+        port_list = parse_ports(ports)
+    except ValueError as e:
+        return f"Error: {e}"
+
+    probes = len(hosts) * len(port_list)
+    if probes > MAX_PROBES:
+        return f"Error: The scan has {probes} probes, the limit is " \
+               f"{MAX_PROBES}, scan fewer hosts or ports"
+
+    start = time.monotonic()
+    addresses = await resolve_hosts(hosts)
+    # never probe the hosts out of the machine and its local networks
+    rejected = [host for host, address in addresses.items()
+                if address is not None and not is_local_address(address)]
+    if rejected:
+        return "Error: Only the machine and its local networks can be " \
+               f"scanned, not: {', '.join(rejected[:10])}"
+
+    # the resolved addresses are probed so the names are not resolved again
+    resolved: Dict[str, str] = {}
+    for host, address in addresses.items():
+        if address is not None:
+            resolved.setdefault(address, host)
+
+    found: Dict[str, list] = {}
+    scanned = opened = 0
+    stopped = None
+    results = scan(list(resolved), port_list, int(concurrency),
+                   float(probe_timeout))
+    try:
+        async for result in results:
+            scanned += 1
+            if result.state != PortState.filtered:
+                ports_found = found.setdefault(resolved[result.host], [])
+                if result.state == PortState.open:
+                    ports_found.append(result.port)
+                    opened += 1
+
+            if opened >= max(int(max_results), 1):
+                stopped = "found max_results open ports"
+                break
+            if time.monotonic() - start > SCAN_DEADLINE:
+                stopped = f"reached the {SCAN_DEADLINE} seconds deadline"
+                break
+    finally:
+        await results.aclose()
+
+    summary: Dict[str, object] = {
+        "probes": scanned,
+        "of": probes,
+        "seconds": round(time.monotonic() - start, 2),
+        "hosts_up": len(found),
+        "hosts": {host: sorted(ports) for host, ports in found.items()},
+    }
+    if stopped is not None:
+        summary["stopped"] = stopped
+    unresolved = [host for host, address in addresses.items()
+                  if address is None]
+    if unresolved:
+        summary["unresolved"] = unresolved
+    return json.dumps(summary)
+
+
 # !TODO: check network connectivity
 # !TODO: ping addresses
-# !TODO: get network interfaces
-# !TODO: scan for devices and open ports in the local network
@@ -1,20 +1,41 @@
+import sys
+import json
+import time
 import inspect
+import functools
 import importlib
+import contextvars
 from pathlib import Path
+from concurrent.futures import Executor, Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from enum import EnumType
 from termcolor import colored
-from typing import Callable, Dict, List, Union, cast
-
-from openai import audio, chat
-from openai.types.chat.chat_completion_tool_message_param import ChatCompletionToolMessageParam
-from openai.types.chat import (ChatCompletion,
-                               ChatCompletionMessageParam,
-                               ChatCompletionMessageToolCall,
-                               ChatCompletionToolParam)
-
-from pydub import AudioSegment
-from pydub.playback import play
-from pydub.utils import json
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator,
+                    List, Optional, Tuple, Union, cast)
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_tool_message_param import ChatCompletionToolMessageParam
+    from openai.types.chat import (ChatCompletionMessage,
+                                   ChatCompletionMessageParam,
+                                   ChatCompletionMessageToolCall,
+                                   ChatCompletionToolParam)
+
+from audio import AudioCache, AudioPlayer, speech_key
+from cache import AbilityCache, CacheStats
+from client import ClientStats, ModelClient
+from compaction import Compactor
+from history import History, TurnStats, measure_message, message_to_dict
+from metrics import CACHED, ERROR, INTERRUPTED, INVALID, OK, TIMEOUT, Metrics
+from selection import AbilityIndex
+from sessions import SessionStore
+from shell import ShellPool
+from streaming import SentenceSplitter, SpeechPipeline, StreamedMessage
+from workers import AbilityExecutor, CancelToken, _current_token
+
+# the assistant running the ability in this thread or task, the abilities
+# reach the state of their session through it like its shell
+_current_assistant: "contextvars.ContextVar[Optional[Assistant]]" = \
+    contextvars.ContextVar("current_assistant", default=None)
 
 
 class AbilityArgument:
@@ -63,10 +84,17 @@ class AbilityArgument:
 
 
 class AssistantAbility:
-    def __init__(self, name: str, description: str, action: Callable):
+    def __init__(self, name: str, description: str, action: Callable,
+                 timeout: Optional[float] = None,
+                 cache_ttl: Optional[float] = None,
+                 invalidates_cache: Union[
+                     bool, Callable[..., bool]] = False):
         self._name = name
         self._description = description
         self._action = action
+        self._timeout = timeout
+        self._cache_ttl = cache_ttl
+        self._invalidates_cache = invalidates_cache
         self._arguments: Dict[str, AbilityArgument] = {}
 
     @property
@@ -77,6 +105,33 @@ class AssistantAbility:
     def description(self) -> str:
         return self._description
 
+    @property
+    def is_coroutine(self) -> bool:
+        return inspect.iscoroutinefunction(self._action)
+
+    @property
+    def timeout(self) -> Optional[float]:
+        """Max seconds to wait for the ability, None to use the assistant
+        default"""
+        return self._timeout
+
+    @property
+    def cache_ttl(self) -> Optional[float]:
+        """Seconds to keep the results in the cache, None if the ability is
+        not cacheable"""
+        return self._cache_ttl
+
+    @property
+    def is_cacheable(self) -> bool:
+        return self._cache_ttl is not None
+
+    def invalidates_cache(self, **kwargs) -> bool:
+        """Check if running the ability with these arguments could change
+        the cached results of the other abilities"""
+        if callable(self._invalidates_cache):
+            return self._invalidates_cache(**kwargs)
+        return self._invalidates_cache
+
     @property
     def arguments(self) -> Dict[str, Dict[str, object]]:
         return {
@@ -98,7 +153,43 @@ class AssistantAbility:
     def add_argument_object(self, argument: AbilityArgument):
         self._arguments[argument.name] = argument
 
-    def generate_ability_description(self) -> ChatCompletionToolParam:
+    def generate_manifest(self) -> Dict[str, object]:
+        """Describe the ability to register it later without importing its
+        module"""
+        invalidates_cache = self._invalidates_cache
+        if callable(invalidates_cache):
+            invalidates_cache = \
+                f"{invalidates_cache.__module__}:{invalidates_cache.__name__}"
+
+        return {
+            "name": self._name,
+            "description": self._description,
+            "function": f"{self._action.__module__}:{self._action.__name__}",
+            "coroutine": self.is_coroutine,
+            "timeout": self._timeout,
+            "cache_ttl": self._cache_ttl,
+            "invalidates_cache": invalidates_cache,
+            "arguments": [
+                {
+                    "name": arg.name,
+                    "type": arg.type,
+                    "description": arg.description,
+                    "is_required": arg.is_required,
+                    "enum": arg.enum,
+                }
+                for arg in self._arguments.values()
+            ],
+        }
+
+    def generate_search_text(self) -> str:
+        """The text used to find the ability relevant to a request"""
+        return " ".join([
+            self._name.replace("_", " "),
+            self._description,
+            *(arg.description for arg in self._arguments.values()),
+        ])
+
+    def generate_ability_description(self) -> "ChatCompletionToolParam":
         return {
             "type": "function",
             "function": {
@@ -119,16 +210,39 @@ class AssistantAbility:
         }
 
     def __call__(self, *args, **kwargs):
+        if self.is_coroutine:
+            import asyncio
+            return asyncio.run(self._action(*args, **kwargs))
         return self._action(*args, **kwargs)
 
+    async def call_async(self, executor: Optional[Executor], *args, **kwargs):
+        """Await the ability, plain functions are offloaded to the executor
+        so they never block the event loop"""
+        import asyncio
+
+        if self.is_coroutine:
+            return await self._action(*args, **kwargs)
+
+        # the ability sees the context of its caller like the assistant
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor,
+            functools.partial(context.run, self._action, *args, **kwargs))
+
     @staticmethod
     def generate_from_function(
+            timeout: Optional[float] = None,
+            cache_ttl: Optional[float] = None,
+            invalidates_cache: Union[bool, Callable[..., bool]] = False,
             **descriptions: str) -> Callable[[Callable], "AssistantAbility"]:
         def wrapper(func: Callable[..., str]) -> AssistantAbility:
             if func.__doc__ is None:
                 raise ValueError("Ability function must has docstring")
 
-            ability = AssistantAbility(func.__name__, func.__doc__, func)
+            ability = AssistantAbility(
+                func.__name__, func.__doc__, func,
+                timeout, cache_ttl, invalidates_cache)
             ability_signature = inspect.signature(func)
             params = ability_signature.parameters
 
@@ -162,79 +276,419 @@ class AssistantAbility:
 
 class Assistant:
     _MESSAGE_LIMIT_ = 4096
-
-    def __init__(self, instructions: str):
+    _MAX_WORKERS_ = 8
+    _ABILITY_TIMEOUT_ = 120.0
+    _PINNED_ABILITIES_ = ("execute", "read_result")
+    # the reasons an ability is stopped, every tool call in the history needs
+    # a response or the next requests are rejected
+    _INTERRUPTED_ = "interrupted by the user"
+    _TIMED_OUT_ = "timed out"
+    _SPEECH_MODEL_ = "tts-1-hd"
+    _VOICE_ = "nova"
+    # raw samples are played as they arrive without decoding
+    _AUDIO_FORMAT_ = "pcm"
+
+    def __init__(self, instructions: str,
+                 max_workers: int = _MAX_WORKERS_,
+                 ability_timeout: float = _ABILITY_TIMEOUT_,
+                 token_budget: int = History._TOKEN_BUDGET_,
+                 compactor: Optional[Compactor] = None,
+                 cache: Optional[AbilityCache] = None,
+                 tools_limit: Optional[int] = None,
+                 pinned_abilities: Iterable[str] = _PINNED_ABILITIES_,
+                 store: Optional[SessionStore] = None,
+                 client: Optional[ModelClient] = None,
+                 audio_cache: Optional[AudioCache] = None,
+                 audio_format: str = _AUDIO_FORMAT_,
+                 metrics: Optional[Metrics] = None,
+                 executor: Optional[AbilityExecutor] = None):
         self._instructions = instructions
-        self._history: List[ChatCompletionMessageParam] = []
+        self._client = client
+        self._audio_cache = audio_cache
+        self._audio_format = audio_format
+        self._player: Optional[AudioPlayer] = None
+        self._shell: Optional[ShellPool] = None
+        self._store = store
+        self._session: Optional[int] = None
+        self._history = History(instructions, token_budget)
         self._abilities: Dict[str, AssistantAbility] = {}
+        self._tools: Optional[List[ChatCompletionToolParam]] = None
+        self._tools_by_name: Dict[str, ChatCompletionToolParam] = {}
+        self._tools_limit = tools_limit
+        self._pinned_abilities = list(dict.fromkeys(pinned_abilities))
+        if store is not None:
+            self._pinned_abilities.append("remember_machine_fact")
+        self._index: Optional[AbilityIndex] = None
+        self._selected_abilities: Optional[List[str]] = None
+        self._compactor = compactor or Compactor(Assistant._MESSAGE_LIMIT_)
+        self._cache = cache or AbilityCache()
+        self._ability_timeout = ability_timeout
+        # an executor shared by many assistants bounds all their abilities
+        self._executor = executor or AbilityExecutor(
+            max_workers=max_workers, thread_name_prefix="ability")
+        if metrics is None:
+            # shared metrics get their collectors from their owner
+            metrics = Metrics()
+            metrics.add_collector("client", lambda: self.client.stats)
+            metrics.add_collector("cache", lambda: self._cache.stats)
+        self._metrics = metrics
         self.reset()
+        self._add_read_result_ability()
+        if store is not None:
+            self._add_remember_fact_ability(store)
 
     @property
     def instructions(self) -> str:
-        return self._instructions
+        """The instructions and the facts known about the machine from the
+        previous sessions"""
+        if self._store is None:
+            return self._instructions
+
+        facts = self._store.facts()
+        if len(facts) == 0:
+            return self._instructions
+        return "\n".join([
+            self._instructions,
+            "Known facts about this machine, no need to collect them again:",
+            *(f"- {name}: {value}" for name, value in facts.items()),
+        ])
 
     @property
-    def history(self) -> List[ChatCompletionMessageParam]:
+    def session(self) -> Optional[int]:
+        return self._session
+
+    @property
+    def history(self) -> "List[ChatCompletionMessageParam]":
         return [*self._history]
 
+    @property
+    def history_stats(self) -> List[TurnStats]:
+        """The number of messages, tokens and bytes sent on every request"""
+        return self._history.stats
+
+    @property
+    def client(self) -> ModelClient:
+        if self._client is None:
+            self._client = ModelClient()
+        return self._client
+
+    @client.setter
+    def client(self, client: ModelClient):
+        self._client = client
+
+    @property
+    def client_stats(self) -> ClientStats:
+        """Requests, retries and latencies of the model API calls"""
+        return self.client.stats
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def cache_stats(self) -> CacheStats:
+        """Hits and misses of the abilities results cache"""
+        return self._cache.stats
+
+    @property
+    def shell(self) -> ShellPool:
+        """The shells of this assistant, the working directory and variables
+        of a session are never seen by the others"""
+        if self._shell is None:
+            self._shell = self._create_shell()
+        return self._shell
+
+    def _create_shell(self) -> ShellPool:
+        # the coroutine abilities run on a worker, a command waiting for
+        # another worker could wait for itself
+        return ShellPool()
+
+    @staticmethod
+    def current() -> "Optional[Assistant]":
+        """The assistant running the current ability"""
+        return _current_assistant.get()
+
+    def close(self):
+        """Kill the shells of the assistant"""
+        if self._shell is not None:
+            self._shell.close()
+
     def reset(self):
-        self._history = [
-            {"role": "system", "content": self.instructions},
-        ]
+        self._history.reset(self.instructions)
+        self._session = None
 
-    def generate_audio(self, text: str, path: Path):
-        response = audio.speech.create(
-            model="tts-1-hd",
-            voice="nova",
-            input=text,
-        )
+    def resume(self, session: Optional[int] = None) -> int:
+        """Load the last messages of a stored session, the latest session by
+        default, returns the number of loaded messages"""
+        if self._store is None:
+            raise ValueError("Assistant has no session store")
 
-        response.stream_to_file(path)
+        if session is None:
+            session = self._store.latest_session()
+        self.reset()
+        if session is None or not self._store.has_session(session):
+            return 0
 
-    def use_gpt(self,
-                messages: List[ChatCompletionMessageParam]) -> ChatCompletion:
-        args = {
+        messages = self._store.load(session)
+        for message in messages:
+            self._history.append(cast("ChatCompletionMessageParam", message))
+        self._session = session
+        return len(messages)
+
+    def _append(self, message: "ChatCompletionMessageParam"):
+        """Add a message to the history and the session store"""
+        self._history.append(message)
+        if self._store is None:
+            return
+
+        if self._session is None:
+            self._session = self._store.create_session()
+        self._store.append(self._session, message_to_dict(message))
+
+    @property
+    def audio_cache(self) -> AudioCache:
+        if self._audio_cache is None:
+            self._audio_cache = AudioCache()
+        return self._audio_cache
+
+    @property
+    def player(self) -> AudioPlayer:
+        if self._player is None:
+            self._player = AudioPlayer(self._audio_format)
+        return self._player
+
+    def _speech_args(self, text: str, format: str) -> Dict[str, Any]:
+        return {
+            "model": Assistant._SPEECH_MODEL_,
+            "voice": Assistant._VOICE_,
+            "input": text,
+            "response_format": format,
+        }
+
+    def _speech_key(self, text: str, format: str) -> str:
+        return speech_key(text, Assistant._VOICE_,
+                          Assistant._SPEECH_MODEL_, format)
+
+    def generate_audio(self, text: str, path: Path, format: str = "mp3"):
+        path.write_bytes(self.generate_audio_bytes(text, format))
+
+    def generate_audio_bytes(self, text: str,
+                             format: Optional[str] = None) -> bytes:
+        """Synthesize the text, the same text is synthesized only once"""
+        format = format or self._audio_format
+        key = self._speech_key(text, format)
+        data = self.audio_cache.get(key)
+
+        if data is None:
+            data = self.client.speech(**self._speech_args(text, format)).content
+            self.audio_cache.put(key, data)
+        return data
+
+    def stream_audio(self, text: str) -> Iterator[bytes]:
+        """Get the speech of the text as it is downloaded, the complete
+        speech is cached"""
+        key = self._speech_key(text, self._audio_format)
+        data = self.audio_cache.get(key)
+        if data is not None:
+            yield data
+            return
+
+        chunks: List[bytes] = []
+        response = self.client.speech_stream(
+            **self._speech_args(text, self._audio_format))
+        try:
+            for chunk in response.iter_bytes():
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            response.close()
+        self.audio_cache.put(key, b"".join(chunks))
+
+    def play_audio(self, data: bytes):
+        self.player.play(data)
+
+    @property
+    def tools(self) -> "List[ChatCompletionToolParam]":
+        """The tools schema of the abilities, it is compiled once and kept
+        until the abilities change"""
+        if self._tools is None:
+            self._compile_tools()
+        return cast("List[ChatCompletionToolParam]", self._tools)
+
+    def _compile_tools(self):
+        self._tools_by_name = {
+            name: ability.generate_ability_description()
+            for name, ability in self._abilities.items()
+        }
+        self._tools = list(self._tools_by_name.values())
+
+    @property
+    def selected_abilities(self) -> Optional[List[str]]:
+        """The abilities sent to the model in the current turn, None when
+        all of them are sent"""
+        return self._selected_abilities
+
+    def _select_abilities(self, query: str):
+        """Select the most relevant abilities to the query with the pinned
+        abilities, all the abilities are selected if there is no limit"""
+        limit = self._tools_limit
+        if limit is None or len(self._abilities) <= limit:
+            self._selected_abilities = None
+            return
+
+        if self._index is None:
+            self._index = AbilityIndex(
+                (name, ability.generate_search_text())
+                for name, ability in self._abilities.items())
+
+        pinned = [
+            name for name in self._pinned_abilities if name in self._abilities
+        ]
+        ranked = [
+            name for name in self._index.rank(query, limit + len(pinned))
+            if name not in self._pinned_abilities
+        ]
+        self._selected_abilities = pinned + ranked[:limit]
+
+    def _selected_tools(self) -> "List[ChatCompletionToolParam]":
+        tools = self.tools
+        if self._selected_abilities is None:
+            return tools
+        return [
+            self._tools_by_name[name] for name in self._selected_abilities
+        ]
+
+    def _request_args(self,
+                      messages: "List[ChatCompletionMessageParam]",
+                      stream: bool) -> Dict[str, Any]:
+        args: Dict[str, Any] = {
             "model": "gpt-3.5-turbo",
             "messages": messages,
+            "stream": stream,
         }
 
         if len(self._abilities) > 0:
-            args["tools"] = [
-                ability.generate_ability_description()
-                for ability in self._abilities.values()
-            ]
-        return chat.completions.create(**args)
+            args["tools"] = self._selected_tools()
+        return args
 
-    def say(self, text: str):
-        audio_file = Path(__file__).parent / "speech.mp3"
-        self.generate_audio(text, audio_file)
-        sound = AudioSegment.from_mp3(audio_file)
+    def use_gpt(self,
+                messages: "List[ChatCompletionMessageParam]",
+                stream: bool = False):
+        start = time.monotonic()
+        try:
+            response = self.client.chat(**self._request_args(messages, stream))
+        except Exception:
+            self._metrics.observe_model(time.monotonic() - start, failed=True)
+            raise
+        self._observe_model(start, response)
+        return response
+
+    def _observe_model(self, start: float, response: Any):
+        # a stream has no usage, its tokens are counted when it ends
+        usage = getattr(response, "usage", None)
+        self._metrics.observe_model(
+            time.monotonic() - start,
+            usage.prompt_tokens if usage is not None else 0,
+            usage.completion_tokens if usage is not None else 0)
+
+    def _count_stream_tokens(self, message: "ChatCompletionMessage"):
+        """Estimate the tokens of a streamed response, the prompt is the
+        history sent with the request"""
+        self._metrics.count_tokens(
+            self._history.tokens, measure_message(message).tokens)
 
+    def say(self, text: str):
         try:
-            play(sound)
+            self.player.play_stream(self.stream_audio(text))
         except KeyboardInterrupt:
             print("System: Speech Interrupted!")
 
+    def stream_gpt(self,
+                   messages: "List[ChatCompletionMessageParam]",
+                   with_output: bool = True,
+                   assistant_name="Assistant",
+                   speech: Optional[SpeechPipeline] = None
+                   ) -> "ChatCompletionMessage":
+        """Stream the response of the model, print its text as it arrives
+        and pass its complete sentences to the speech pipeline if any"""
+        message = StreamedMessage()
+        splitter = SentenceSplitter()
+
+        for chunk in self.use_gpt(messages, stream=True):
+            text = message.feed(chunk)
+            if len(text) == 0:
+                continue
+
+            if with_output:
+                self._output_text(
+                    text, assistant_name, message.content == text)
+
+            if speech is not None:
+                for sentence in splitter.feed(text):
+                    speech.put(sentence)
+
+        if with_output and len(message.content) > 0:
+            self._output_end()
+
+        if speech is not None:
+            for sentence in splitter.flush():
+                speech.put(sentence)
+
+        result = message.to_message()
+        self._count_stream_tokens(result)
+        return result
+
+    def _output_text(self, text: str, assistant_name: str, is_first: bool):
+        """Show a piece of the streamed response, overridden to send the
+        output somewhere else than the terminal"""
+        if is_first:
+            print(f"{assistant_name}: ", end="")
+        print(text, end="", flush=True)
+
+    def _output_end(self):
+        print()
+
+    def _output_ability(self, name: str, arguments: str):
+        print(colored(f"Use Ability: {name} {arguments}", "green"))
+
+    def _output_interrupted(self):
+        print(colored("System: Ability Interrupted!", "red"))
+
+    def output_stderr(self, text: str):
+        """Show the error output of an ability, it may be called from the
+        workers running the abilities"""
+        print(text, file=sys.stderr)
+
     def add_ability(self, ability: Union[AssistantAbility, object]):
         ability = Assistant.get_injected_ability(ability)
         self._abilities[ability.name] = ability
+        self._tools = None
+        self._index = None
         return ability
 
-    def use(self, **descriptions: str):
+    def use(self,
+            timeout: Optional[float] = None,
+            cache_ttl: Optional[float] = None,
+            invalidates_cache: Union[bool, Callable[..., bool]] = False,
+            **descriptions: str):
         """Generate assistant ability from a function and inject inside
         then add it."""
         def wrapper(func: Callable[..., str]):
-            Assistant.ability(**descriptions)(func)
+            Assistant.ability(
+                timeout, cache_ttl, invalidates_cache, **descriptions)(func)
             self.add_ability(func)
             return func
         return wrapper
 
     @staticmethod
-    def ability(**descriptions: str):
+    def ability(timeout: Optional[float] = None,
+                cache_ttl: Optional[float] = None,
+                invalidates_cache: Union[bool, Callable[..., bool]] = False,
+                **descriptions: str):
         """Generate assistant ability from a function and inject inside"""
         def wrapper(func: Callable[..., str]):
             ability = AssistantAbility.generate_from_function(
-                **descriptions)(func)
+                timeout, cache_ttl, invalidates_cache, **descriptions)(func)
             setattr(func, "__assistant_ability__", ability)
             return func
         return wrapper
@@ -257,79 +711,264 @@ class Assistant:
         obj = getattr(obj, "__assistant_ability__", None)
         return obj is not None and isinstance(obj, AssistantAbility)
 
-    def import_abilities_module(self, path: str):
+    def import_abilities_module(self, path: str) -> List[AssistantAbility]:
         module = importlib.import_module(path)
         members = inspect.getmembers(module)
         abilities = [
             member[1] for member in members
             if Assistant.has_injected_ability(member[1])
         ]
-        for ability in abilities:
-            self.add_ability(ability)
+        return [self.add_ability(ability) for ability in abilities]
 
-    def _execute_abilities(self, call: ChatCompletionMessageToolCall):
+    def import_abilities_manifest(self, path: str):
+        """Load the abilities of a module from its manifest without importing
+        the module, it is imported on the first call of any of its abilities.
+        The manifest is generated again whenever the module or one of the
+        modules it imports changes."""
+        from manifest import (generate_manifest, get_manifest_path,
+                              load_manifest, write_manifest)
+
+        manifest_path = get_manifest_path(path)
+        abilities = load_manifest(manifest_path)
+
+        if abilities is not None:
+            for ability in abilities:
+                self.add_ability(ability)
+            return
+
+        abilities = self.import_abilities_module(path)
+        try:
+            write_manifest(manifest_path, generate_manifest(path, abilities))
+        except OSError:
+            # a read only installation works too, just without the manifest
+            pass
+
+    def _execute_abilities(self, calls: "List[ChatCompletionMessageToolCall]"
+                           ) -> "List[ChatCompletionToolMessageParam]":
+        """Run all the tool calls of a turn concurrently and return their
+        responses in the same order of the calls"""
+        results: List[Union[Tuple[Future, Future, CancelToken], str]] = [
+            self._submit_ability(call) for call in calls
+        ]
+
+        responses: List[ChatCompletionToolMessageParam] = []
+        try:
+            for call, result in zip(calls, results):
+                if not isinstance(result, str):
+                    result = self._wait_ability(
+                        *result, self._get_timeout(call), call.function.name)
+                responses.append(tool_response(call, result))
+        except KeyboardInterrupt:
+            self._output_interrupted()
+            for call, result in zip(calls[len(responses):],
+                                    results[len(responses):]):
+                if not isinstance(result, str):
+                    future, _, cancel = result
+                    result = Assistant._stopped_response(
+                        Assistant._INTERRUPTED_,
+                        self._stop_ability(future, cancel))
+                    self._metrics.count_ability(
+                        call.function.name, INTERRUPTED)
+                responses.append(tool_response(call, result))
+        return responses
+
+    def _get_timeout(self, call: "ChatCompletionMessageToolCall") -> float:
+        ability = self._abilities.get(call.function.name)
+        if ability is None or ability.timeout is None:
+            return self._ability_timeout
+        return ability.timeout
+
+    def _submit_ability(self, call: "ChatCompletionMessageToolCall"
+                        ) -> Union[Tuple[Future, Future, CancelToken], str]:
+        """Start the ability on a worker, returns its future, the one of the
+        time it starts running at and its cancel token, or the result without
+        running it"""
+        prepared = self._prepare_ability(call)
+        if isinstance(prepared, str):
+            return prepared
+
+        ability, args = prepared
+        cached = self._get_cached(ability, args)
+        if cached is not None:
+            return cached
+        started: Future = Future()
+        cancel = CancelToken()
+        future = self._executor.submit(
+            self._run_ability, ability, args, started, cancel)
+        # a future canceled before it starts never sets its start
+        future.add_done_callback(lambda _: started.cancel())
+        return future, started, cancel
+
+    def _run_ability(self, ability: AssistantAbility, args: Dict[str, Any],
+                     started: Optional[Future] = None,
+                     cancel: Optional[CancelToken] = None):
+        start = time.monotonic()
+        if started is not None:
+            started.set_result(start)
+        if cancel is not None and not cancel.start():
+            return Assistant._stopped_response(Assistant._INTERRUPTED_, True)
+
+        token = _current_assistant.set(self)
+        cancel_token = _current_token.set(cancel)
+        try:
+            results = ability(**args)
+        except BaseException:
+            self._metrics.observe_ability(
+                ability.name, time.monotonic() - start)
+            raise
+        finally:
+            _current_token.reset(cancel_token)
+            _current_assistant.reset(token)
+        self._observe_ability(ability.name, start, results)
+        self._update_cache(ability, args, results)
+        return results
+
+    def _observe_ability(self, name: str, start: float, results: object):
+        self._metrics.observe_ability(
+            name, time.monotonic() - start,
+            len(results) if isinstance(results, str) else None)
+
+    def _count_result(self, name: str, results: object):
+        is_error = isinstance(results, str) and results.startswith("Error")
+        self._metrics.count_ability(name, ERROR if is_error else OK)
+
+    def _cache_args(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        # relative paths depend on the directory of the shell and the cache
+        # may be shared with assistants in other directories
+        return dict(args, __cwd__=self.shell.cwd)
+
+    def _get_cached(self, ability: AssistantAbility,
+                    args: Dict[str, Any]) -> Optional[str]:
+        if not ability.is_cacheable:
+            return None
+        cached = self._cache.get(ability.name, self._cache_args(args))
+        if cached is not None:
+            self._metrics.count_ability(ability.name, CACHED)
+        return cached
+
+    def _update_cache(self, ability: AssistantAbility,
+                      args: Dict[str, Any], results: object):
+        if ability.invalidates_cache(**args):
+            self._cache.invalidate()
+        elif ability.is_cacheable and isinstance(results, str) \
+                and not results.startswith("Error"):
+            self._cache.put(ability.name, self._cache_args(args), results,
+                            cast(float, ability.cache_ttl))
+
+    def _prepare_ability(self, call: "ChatCompletionMessageToolCall"
+                         ) -> Union[Tuple[AssistantAbility, Dict[str, Any]],
+                                    str]:
+        """Find the called ability and parse its arguments, returns an error
+        message on failure"""
         ability_call = call.function
+        self._output_ability(ability_call.name, ability_call.arguments)
 
-        print(
-            colored(
-                f"Use Ability: {ability_call.name} {ability_call.arguments}",
-                "green"))
-
-        def response(content: str) -> ChatCompletionToolMessageParam:
-            # if len(response.content) > Assistant._MESSAGE_LIMIT_:
-            return {
-                "role": "tool",
-                "tool_call_id": call.id,
-                "content": content,
-            }
+        # the model is looking for an ability that was not selected for this
+        # turn, send all of them on the next request
+        if self._selected_abilities is not None and \
+                ability_call.name not in self._selected_abilities:
+            self._selected_abilities = None
 
         if ability_call.name not in self._abilities:
-            return response(
-                f"Error: function {ability_call.name} does not exist"
-            )
+            # one label for all the unknown names the model makes up
+            self._metrics.count_ability("unknown", INVALID)
+            return f"Error: function {ability_call.name} does not exist"
 
-        args = json.loads(ability_call.arguments)
-        ability = self._abilities[ability_call.name]
         try:
-            results = ability(**args)
-        except KeyboardInterrupt:
-            print(colored("System: Ability Interrupted!", "red"))
-            return response(
-                "Error: Ability execution interrupted by the user!")
-        except Exception as e:
-            return response(f"Error: {e}")
-        return response(results)
-
-    def __send_tool_responses(self, response: ChatCompletionToolMessageParam):
-        tool_call_id = response.get("tool_call_id")
-        content = response.get("content")
-
-        while len(content) > 0:
-            piece: ChatCompletionToolMessageParam = {
-                "role": "tool",
-                "tool_call_id": tool_call_id,
-                "content": content[:Assistant._MESSAGE_LIMIT_],
-            }
+            args = json.loads(ability_call.arguments or "{}")
+        except ValueError as e:
+            self._metrics.count_ability(ability_call.name, INVALID)
+            return f"Error: invalid arguments: {e}"
 
-            self._history.append(piece)
-            content = content[Assistant._MESSAGE_LIMIT_:]
+        return self._abilities[ability_call.name], args
+
+    def _stop_ability(self, future: Future, cancel: CancelToken) -> bool:
+        """Stop an ability that is not waited anymore, its worker is replaced
+        and False is returned when it keeps running in the background"""
+        if future.cancel():
+            return True
+        stopped = cancel.cancel()
+        self._executor.abandon(future)
+        return stopped or future.done()
+
+    @staticmethod
+    def _stopped_response(reason: str, stopped: bool) -> str:
+        if stopped:
+            return f"Error: Ability execution {reason}!"
+        # the model must not take its side effects as never happening
+        return f"Error: Ability execution {reason}, it was abandoned and " \
+               "may still be running!"
+
+    def _wait_ability(self, future: Future, started: Future,
+                      cancel: CancelToken, timeout: float, name: str) -> str:
+        try:
+            # the clock starts when a worker picks the ability up, the time
+            # in the queue behind the other abilities does not count
+            deadline = started.result() + timeout
+            results = future.result(
+                timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            self._metrics.count_ability(name, TIMEOUT)
+            return Assistant._stopped_response(
+                Assistant._TIMED_OUT_, self._stop_ability(future, cancel))
+        except Exception as e:
+            self._metrics.count_ability(name, ERROR)
+            return f"Error: {e}"
+        self._count_result(name, results)
+        return results
+
+    def _add_read_result_ability(self):
+        def read_result(handle: str, offset: int = 0) -> str:
+            """Read a page of the full output of an ability that was
+            compacted, the page ends with the offset of the next page"""
+            return self._compactor.read(handle, offset)
+
+        self.add_ability(AssistantAbility.generate_from_function(
+            handle="the handle of the stored output, like: result-1",
+            offset="the character offset to start reading from",
+        )(read_result))
+
+    def _add_remember_fact_ability(self, store: SessionStore):
+        def remember_machine_fact(name: str, value: str) -> str:
+            """Save a fact about the machine, like the distribution or the
+            package manager, the saved facts are given in the next sessions
+            so they are not collected again"""
+            store.set_fact(name.strip(), value.strip())
+            return "saved"
+
+        self.add_ability(AssistantAbility.generate_from_function(
+            name="the name of the fact, like: distribution",
+            value="the value of the fact, like: Arch Linux",
+        )(remember_machine_fact))
+
+    def _send_tool_responses(self, response: "ChatCompletionToolMessageParam"):
+        self._append({
+            "role": "tool",
+            "tool_call_id": response.get("tool_call_id"),
+            "content": self._compactor(str(response.get("content"))),
+        })
 
     def __call__(self, input: str,
                  with_output: bool = True,
                  assistant_name="Assistant",
-                 with_speech: bool = True) -> str:
+                 with_speech: bool = True,
+                 stream: bool = False) -> str:
+
+        self._append({"role": "user", "content": input})
+        self._select_abilities(input)
 
-        self._history.append({"role": "user", "content": input})
+        if stream:
+            return self._call_stream(with_output, assistant_name, with_speech)
 
         while True:
-            response = self.use_gpt(self._history)
+            response = self.use_gpt(self._history.messages())
             message = response.choices[0].message
-            self._history.append(message)
+            self._append(message)
 
             calls = message.tool_calls
             if calls is not None:
-                response = self._execute_abilities(calls[0])
-                self.__send_tool_responses(response)
+                for response in self._execute_abilities(calls):
+                    self._send_tool_responses(response)
                 continue
 
             text = cast(str, response.choices[0].message.content)
@@ -342,6 +981,44 @@ class Assistant:
 
             return text
 
+    def _call_stream(self,
+                      with_output: bool,
+                      assistant_name: str,
+                      with_speech: bool) -> str:
+        speech = None
+        if with_speech:
+            speech = SpeechPipeline(self.generate_audio_bytes, self.play_audio)
+
+        try:
+            while True:
+                message = self.stream_gpt(self._history.messages(),
+                                          with_output, assistant_name, speech)
+                self._append(message)
+
+                calls = message.tool_calls
+                if calls is not None:
+                    for response in self._execute_abilities(calls):
+                        self._send_tool_responses(response)
+                    continue
+
+                if speech is not None:
+                    speech.close()
+                return cast(str, message.content)
+        except KeyboardInterrupt:
+            if speech is not None:
+                speech.stop()
+                print("System: Speech Interrupted!")
+            raise
+
+
+def tool_response(call: "ChatCompletionMessageToolCall",
+                  content: str) -> "ChatCompletionToolMessageParam":
+    return {
+        "role": "tool",
+        "tool_call_id": call.id,
+        "content": content,
+    }
+
 
 def type_to_text(obj: object) -> str:
     if obj is str:
@@ -0,0 +1,341 @@
+import time
+import asyncio
+import contextvars
+from pathlib import Path
+from concurrent.futures import CancelledError as FutureCancelledError
+from typing import (Any, AsyncIterator, Dict, Iterable, Iterator, List,
+                    Optional, cast)
+
+from openai.types.chat import (ChatCompletionMessage,
+                               ChatCompletionMessageParam,
+                               ChatCompletionMessageToolCall)
+from openai.types.chat.chat_completion_tool_message_param import ChatCompletionToolMessageParam
+
+from assistant import (Assistant, AssistantAbility, _current_assistant,
+                       tool_response)
+from audio import AudioCache
+from cache import AbilityCache
+from client import AsyncModelClient
+from compaction import Compactor
+from history import History
+from metrics import ERROR, INTERRUPTED, TIMEOUT, Metrics
+from sessions import SessionStore
+from shell import ShellPool
+from streaming import SentenceSplitter, SpeechPipeline, StreamedMessage
+from workers import AbilityExecutor, CancelToken, _current_token
+
+
+class AsyncAssistant(Assistant):
+    """Assistant running on asyncio, abilities are awaited concurrently and
+    plain function abilities are offloaded to the assistant executor so one
+    process can serve many sessions at once"""
+
+    def __init__(self, instructions: str,
+                 max_workers: int = Assistant._MAX_WORKERS_,
+                 ability_timeout: float = Assistant._ABILITY_TIMEOUT_,
+                 token_budget: int = History._TOKEN_BUDGET_,
+                 compactor: Optional[Compactor] = None,
+                 cache: Optional[AbilityCache] = None,
+                 tools_limit: Optional[int] = None,
+                 pinned_abilities: Iterable[str] = Assistant._PINNED_ABILITIES_,
+                 store: Optional[SessionStore] = None,
+                 client: Optional[AsyncModelClient] = None,
+                 audio_cache: Optional[AudioCache] = None,
+                 audio_format: str = Assistant._AUDIO_FORMAT_,
+                 metrics: Optional[Metrics] = None,
+                 executor: Optional[AbilityExecutor] = None):
+        super().__init__(instructions, max_workers, ability_timeout,
+                         token_budget, compactor, cache,
+                         tools_limit, pinned_abilities, store,
+                         audio_cache=audio_cache, audio_format=audio_format,
+                         metrics=metrics, executor=executor)
+        self._async_client = client
+
+    @property
+    def client(self) -> AsyncModelClient:  # type: ignore[override]
+        if self._async_client is None:
+            self._async_client = AsyncModelClient()
+        return self._async_client
+
+    async def use_gpt(self,
+                      messages: List[ChatCompletionMessageParam],
+                      stream: bool = False):
+        start = time.monotonic()
+        try:
+            response = await self.client.chat(
+                **self._request_args(messages, stream))
+        except Exception:
+            self._metrics.observe_model(time.monotonic() - start, failed=True)
+            raise
+        self._observe_model(start, response)
+        return response
+
+    async def stream_gpt(self,
+                         messages: List[ChatCompletionMessageParam],
+                         with_output: bool = True,
+                         assistant_name="Assistant",
+                         speech: Optional[SpeechPipeline] = None
+                         ) -> ChatCompletionMessage:
+        message = StreamedMessage()
+        splitter = SentenceSplitter()
+
+        async for chunk in await self.use_gpt(messages, stream=True):
+            text = message.feed(chunk)
+            if len(text) == 0:
+                continue
+
+            if with_output:
+                self._output_text(
+                    text, assistant_name, message.content == text)
+                await self._flush_output()
+
+            if speech is not None:
+                for sentence in splitter.feed(text):
+                    speech.put(sentence)
+
+        if with_output and len(message.content) > 0:
+            self._output_end()
+
+        if speech is not None:
+            for sentence in splitter.flush():
+                speech.put(sentence)
+
+        result = message.to_message()
+        self._count_stream_tokens(result)
+        return result
+
+    async def generate_audio(self, text: str, path: Path,  # type: ignore
+                             format: str = "mp3"):
+        path.write_bytes(await self.generate_audio_bytes(text, format))
+
+    async def generate_audio_bytes(self, text: str,  # type: ignore
+                                   format: Optional[str] = None) -> bytes:
+        """Synthesize the text, the same text is synthesized only once"""
+        format = format or self._audio_format
+        key = self._speech_key(text, format)
+        data = self.audio_cache.get(key)
+
+        if data is None:
+            response = await self.client.speech(
+                **self._speech_args(text, format))
+            data = response.content
+            self.audio_cache.put(key, data)
+        return data
+
+    async def stream_audio(self, text: str  # type: ignore[override]
+                           ) -> AsyncIterator[bytes]:
+        """Get the speech of the text as it is downloaded, the complete
+        speech is cached"""
+        key = self._speech_key(text, self._audio_format)
+        data = self.audio_cache.get(key)
+        if data is not None:
+            yield data
+            return
+
+        chunks: List[bytes] = []
+        response = await self.client.speech_stream(
+            **self._speech_args(text, self._audio_format))
+        try:
+            async for chunk in response.iter_bytes():
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            await response.close()
+        self.audio_cache.put(key, b"".join(chunks))
+
+    async def say(self, text: str):  # type: ignore[override]
+        """Play the speech on the executor while it is downloaded on the
+        event loop"""
+        loop = asyncio.get_running_loop()
+        chunks = self.stream_audio(text)
+
+        def iterate() -> Iterator[bytes]:
+            try:
+                while True:
+                    try:
+                        yield asyncio.run_coroutine_threadsafe(
+                            chunks.__anext__(), loop).result()
+                    except StopAsyncIteration:
+                        return
+            finally:
+                asyncio.run_coroutine_threadsafe(
+                    chunks.aclose(), loop).result()
+
+        await loop.run_in_executor(
+            self._executor, self.player.play_stream, iterate())
+
+    def _speech_pipeline(self) -> SpeechPipeline:
+        loop = asyncio.get_running_loop()
+
+        def synthesize(text: str) -> bytes:
+            # the async client is used from the event loop of the turn
+            return asyncio.run_coroutine_threadsafe(
+                self.generate_audio_bytes(text), loop).result()
+
+        return SpeechPipeline(synthesize, self.play_audio)
+
+    def _create_shell(self) -> ShellPool:
+        # the coroutine abilities run on the loop, their commands take a
+        # worker like the plain abilities
+        return ShellPool(executor=self._executor)
+
+    async def _flush_output(self):
+        """Wait for the output to be written, like to a slow client"""
+        pass
+
+    async def _execute_abilities(
+            self, calls: List[ChatCompletionMessageToolCall]
+    ) -> List[ChatCompletionToolMessageParam]:
+        """Run all the tool calls of a turn concurrently, when the turn is
+        cancelled the calls are answered with the finished results or as
+        interrupted before the cancellation goes on, so the history stays
+        valid for the next turns"""
+        cancels = [CancelToken() for _ in calls]
+        tasks = [asyncio.ensure_future(self._run_ability_async(call, cancel))
+                 for call, cancel in zip(calls, cancels)]
+        try:
+            results = await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for call, task, cancel in zip(calls, tasks, cancels):
+                if task.done() and not task.cancelled() and \
+                        task.exception() is None:
+                    result = task.result()
+                else:
+                    result = Assistant._stopped_response(
+                        Assistant._INTERRUPTED_,
+                        self._is_stopped(call, cancel))
+                task.cancel()
+                self._send_tool_responses(tool_response(call, result))
+            raise
+        return [
+            tool_response(call, result) for call, result in zip(calls, results)
+        ]
+
+    def _is_stopped(self, call: ChatCompletionMessageToolCall,
+                    cancel: CancelToken) -> bool:
+        """Cancel an ability, a coroutine is stopped by its cancellation
+        while a plain function is stopped only by its cancel token"""
+        ability = self._abilities.get(call.function.name)
+        return cancel.cancel() or ability is None or ability.is_coroutine
+
+    async def _run_ability_async(self, call: ChatCompletionMessageToolCall,
+                                 cancel: Optional[CancelToken] = None
+                                 ) -> str:
+        cancel = cancel or CancelToken()
+        prepared = self._prepare_ability(call)
+        if isinstance(prepared, str):
+            return prepared
+
+        ability, args = prepared
+        cached = self._get_cached(ability, args)
+        if cached is not None:
+            return cached
+
+        start = time.monotonic()
+        token = _current_assistant.set(self)
+        cancel_token = _current_token.set(cancel)
+        try:
+            results = await self._call_ability(
+                ability, args, self._get_timeout(call), cancel)
+            self._observe_ability(ability.name, start, results)
+            self._count_result(ability.name, results)
+            self._update_cache(ability, args, results)
+            return results
+        except asyncio.TimeoutError:
+            self._metrics.count_ability(ability.name, TIMEOUT)
+            return Assistant._stopped_response(
+                Assistant._TIMED_OUT_, self._is_stopped(call, cancel))
+        except asyncio.CancelledError:
+            self._metrics.count_ability(ability.name, INTERRUPTED)
+            self._output_interrupted()
+            raise
+        except Exception as e:
+            self._observe_ability(ability.name, start, None)
+            self._metrics.count_ability(ability.name, ERROR)
+            return f"Error: {e}"
+        finally:
+            _current_token.reset(cancel_token)
+            _current_assistant.reset(token)
+
+    async def _call_ability(self, ability: AssistantAbility,
+                            args: Dict[str, Any], timeout: float,
+                            cancel: CancelToken) -> str:
+        """Await the ability with its timeout, the clock of a plain function
+        starts when a worker picks it up, it is stopped through its cancel
+        token and the worker of a function that timed out is replaced"""
+        if ability.is_coroutine:
+            return await asyncio.wait_for(
+                ability.call_async(self._executor, **args), timeout)
+
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def set_started():
+            if not started.done():
+                started.set_result(None)
+
+        def run():
+            loop.call_soon_threadsafe(set_started)
+            if not cancel.start():
+                raise FutureCancelledError()
+            return ability(**args)
+
+        # the ability sees the context of the turn like the assistant
+        future = self._executor.submit(contextvars.copy_context().run, run)
+        wrapped = asyncio.wrap_future(future)
+        try:
+            await asyncio.wait([started, wrapped],
+                               return_when=asyncio.FIRST_COMPLETED)
+            return await asyncio.wait_for(wrapped, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            cancel.cancel()
+            self._executor.abandon(future)
+            raise
+
+    async def __call__(self, input: str,
+                       with_output: bool = True,
+                       assistant_name="Assistant",
+                       with_speech: bool = True,
+                       stream: bool = False) -> str:
+
+        self._append({"role": "user", "content": input})
+        self._select_abilities(input)
+
+        speech = None
+        if stream and with_speech:
+            speech = self._speech_pipeline()
+
+        try:
+            while True:
+                if stream:
+                    message = await self.stream_gpt(
+                        self._history.messages(),
+                        with_output, assistant_name, speech)
+                else:
+                    response = await self.use_gpt(
+                        self._history.messages())
+                    message = response.choices[0].message
+                self._append(message)
+
+                calls = message.tool_calls
+                if calls is not None:
+                    for response in await self._execute_abilities(calls):
+                        self._send_tool_responses(response)
+                    continue
+
+                text = cast(str, message.content)
+
+                if with_output and not stream:
+                    print(f"{assistant_name}: {text}")
+
+                if speech is not None:
+                    await asyncio.get_running_loop().run_in_executor(
+                        self._executor, speech.close)
+                elif with_speech:
+                    await self.say(text)
+
+                return text
+        except asyncio.CancelledError:
+            if speech is not None:
+                speech.stop()
+            raise
@@ -0,0 +1,175 @@
+import os
+import io
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from collections import OrderedDict
+from typing import IO, Iterable, List, Optional
+
+from paths import cache_path
+
+# the pcm format of the speech API, 16 bit samples at 24kHz mono
+PCM_RATE = 24000
+PCM_WIDTH = 2
+PCM_CHANNELS = 1
+
+# players reading raw pcm or encoded audio from their stdin
+_PCM_PLAYERS = (
+    ("aplay", "-q", "-t", "raw", "-f", "S16_LE", "-r", str(PCM_RATE),
+     "-c", str(PCM_CHANNELS), "-"),
+    ("pw-play", "--format", "s16", "--rate", str(PCM_RATE),
+     "--channels", str(PCM_CHANNELS), "-"),
+    ("paplay", "--raw", "--format=s16le", f"--rate={PCM_RATE}",
+     f"--channels={PCM_CHANNELS}"),
+    ("ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-f", "s16le",
+     "-ar", str(PCM_RATE), "-ac", str(PCM_CHANNELS), "-"),
+)
+_ENCODED_PLAYERS = (
+    ("ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-"),
+    ("mpv", "--no-video", "--really-quiet", "-"),
+)
+
+
+def default_audio_cache_path() -> Path:
+    return cache_path("audio")
+
+
+def speech_key(text: str, voice: str, model: str, format: str) -> str:
+    content = "\0".join((model, voice, format, text))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class AudioCache:
+    """Content addressed cache of the synthesized speech, the least recently
+    played files are removed when the cache is over its size
+
+    Files are written to a temporary file first and renamed, so sessions
+    sharing the cache never read a half written file"""
+
+    _MAX_BYTES_ = 64 * 1024 * 1024
+
+    def __init__(self,
+                 directory: Optional[Path] = None,
+                 max_bytes: int = _MAX_BYTES_):
+        self._directory = directory or default_audio_cache_path()
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+
+        # the files of the previous sessions, the oldest used first
+        files = sorted(
+            (entry for entry in os.scandir(self._directory)
+             if entry.is_file() and not entry.name.startswith(".")),
+            key=lambda entry: entry.stat().st_mtime)
+        for entry in files:
+            self._entries[entry.name] = entry.stat().st_size
+            self._size += entry.stat().st_size
+        self._evict()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+
+        path = self._directory / key
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            # removed by another session sharing the cache
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+
+    def put(self, key: str, data: bytes):
+        with tempfile.NamedTemporaryFile(
+                dir=self._directory, prefix=".", delete=False) as file:
+            file.write(data)
+        os.replace(file.name, self._directory / key)
+
+        with self._lock:
+            self._size += len(data) - self._entries.get(key, 0)
+            self._entries[key] = len(data)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self._max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._directory / key)
+            except FileNotFoundError:
+                pass
+
+
+def find_player(format: str) -> Optional[List[str]]:
+    players = _PCM_PLAYERS if format == "pcm" else _ENCODED_PLAYERS
+    for player in players:
+        if shutil.which(player[0]) is not None:
+            return list(player)
+    return None
+
+
+class AudioPlayer:
+    """Play the speech while it is still being downloaded by writing it to
+    the stdin of a player, pydub is used when no player is installed"""
+
+    def __init__(self, format: str = "pcm"):
+        self._format = format
+        self._command = find_player(format)
+
+    @property
+    def format(self) -> str:
+        return self._format
+
+    def play(self, data: bytes):
+        self.play_stream([data])
+
+    def play_stream(self, chunks: Iterable[bytes]):
+        if self._command is None:
+            self._play_with_pydub(b"".join(chunks))
+            return
+
+        player = subprocess.Popen(self._command, stdin=subprocess.PIPE,
+                                  stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+        stdin: IO[bytes] = player.stdin  # type: ignore
+        try:
+            for chunk in chunks:
+                stdin.write(chunk)
+            stdin.close()
+            player.wait()
+        except BrokenPipeError:
+            player.wait()
+        except BaseException:
+            player.kill()
+            player.wait()
+            raise
+
+    def _play_with_pydub(self, data: bytes):
+        from pydub import AudioSegment
+        from pydub.playback import play
+
+        if self._format == "pcm":
+            # raw samples need no decoding
+            sound = AudioSegment(data=data, sample_width=PCM_WIDTH,
+                                 frame_rate=PCM_RATE, channels=PCM_CHANNELS)
+        else:
+            format = "ogg" if self._format == "opus" else self._format
+            sound = AudioSegment.from_file(io.BytesIO(data), format=format)
+        play(sound)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Replay a long scripted session through the assistant loop with a fake model
+and measure the latency of every turn and where it goes, the allocations of
+every turn and the size of the history sent to the model"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import contextlib
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from assistant import Assistant  # noqa: E402
+from fake_client import (FakeModelClient, ScriptedCall, text,  # noqa: E402
+                         tool_calls)
+
+
+def create_assistant(output_size: int, calls: int) -> Assistant:
+    client = FakeModelClient([
+        tool_calls(*[
+            ScriptedCall("generate_output", {"size": output_size, "seed": i})
+            for i in range(calls)
+        ]),
+        text("The output was generated. " * 8),
+    ])
+    assistant = Assistant("You are a benchmark assistant", client=client)
+
+    @assistant.use(size="the size of the output", seed="a seed")
+    def generate_output(size: int, seed: int) -> str:
+        """Generate an output of some size"""
+        line = f"{seed} line of the generated output\n"
+        return (line * (size // len(line) + 1))[:size]
+
+    return assistant
+
+
+def instrument(assistant: Assistant, names: List[str],
+               timings: Dict[str, float]):
+    """Replace methods of the assistant with ones adding their time"""
+    def timed(name: str, method: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - start
+        return wrapper
+
+    for name in names:
+        setattr(assistant, name, timed(name, getattr(assistant, name)))
+
+    history = assistant._history
+    history.messages = timed("history", history.messages)  # type: ignore
+
+
+def quiet():
+    """Hide the abilities printed by the assistant"""
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+
+def percentile(values: List[float], percent: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def run(args) -> None:
+    assistant = create_assistant(args.output_size, args.calls)
+    timings: Dict[str, float] = defaultdict(float)
+    instrument(assistant, [
+        "use_gpt", "_execute_abilities", "_send_tool_responses",
+    ], timings)
+
+    latencies: List[float] = []
+    with quiet():
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            assistant(f"turn {turn}", with_output=False, with_speech=False,
+                      stream=args.stream)
+            latencies.append(time.perf_counter() - start)
+
+    total = sum(latencies)
+    print(f"turns: {args.turns}, tool calls per turn: {args.calls}, "
+          f"output size: {args.output_size}, stream: {args.stream}")
+    # the first turn loads the lazy imports
+    print(f"first turn: {latencies[0] * 1e3:.3f} ms")
+    latencies = latencies[1:] or latencies
+    print(f"turn latency p50: {percentile(latencies, 50) * 1e3:.3f} ms, "
+          f"p95: {percentile(latencies, 95) * 1e3:.3f} ms, "
+          f"max: {max(latencies) * 1e3:.3f} ms")
+    for name, spent in sorted(timings.items(), key=lambda item: -item[1]):
+        print(f"  {name}: {spent / args.turns * 1e3:.3f} ms/turn "
+              f"({spent / total * 100:.1f}%)")
+
+    stats = assistant.history_stats
+    print(f"history at the end: {stats[-1].messages} messages, "
+          f"{stats[-1].tokens} tokens, {stats[-1].bytes} bytes, "
+          f"{stats[-1].evicted} evicted")
+
+
+def run_allocations(args) -> None:
+    assistant = create_assistant(args.output_size, args.calls)
+    peaks: List[int] = []
+    with quiet():
+        # a first turn loads the lazy imports out of the measurement
+        assistant("warm up", with_output=False, with_speech=False,
+                  stream=args.stream)
+
+        tracemalloc.start()
+        start_size, _ = tracemalloc.get_traced_memory()
+        for turn in range(args.turns):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            assistant(f"turn {turn}", with_output=False, with_speech=False,
+                      stream=args.stream)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+        end_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"peak allocations per turn p50: "
+          f"{percentile(peaks, 50) / 1024:.1f} KiB, "
+          f"max: {max(peaks) / 1024:.1f} KiB")
+    print(f"retained after {args.turns} turns: "
+          f"{(end_size - start_size) / 1024:.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=2,
+                        help="tool calls in every turn")
+    parser.add_argument("--output-size", type=int, default=2000,
+                        help="characters of every tool output")
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+
+    run(args)
+    run_allocations(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Measure the ports per second of the port scanner on the loopback interface
+with a few listeners among the scanned ports, all of them must be found"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from portscan import PortState, max_concurrency, scan  # noqa: E402
+
+HOST = "127.0.0.1"
+LISTENERS = 20
+PORTS = 20000
+CONCURRENCY = 1024
+TIMEOUT = 1.0
+
+
+def open_listeners(count: int) -> list:
+    listeners = []
+    for _ in range(count):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind((HOST, 0))
+        listener.listen(socket.SOMAXCONN)
+        listeners.append(listener)
+    return listeners
+
+
+async def run(ports: list, concurrency: int) -> tuple:
+    found = set()
+    probes = 0
+    start = time.perf_counter()
+    async for result in scan([HOST], ports, concurrency, TIMEOUT):
+        probes += 1
+        if result.state == PortState.open:
+            found.add(result.port)
+    return found, probes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ports", type=int, default=PORTS)
+    parser.add_argument("--listeners", type=int, default=LISTENERS)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+
+    listeners = open_listeners(args.listeners)
+    try:
+        expected = {listener.getsockname()[1] for listener in listeners}
+        # scan the ports around the listeners so the most of the probes
+        # are refused ones like on a real host
+        first = max(min(expected) - args.ports // 2, 1)
+        last = min(first + args.ports - 1, 65535)
+        ports = sorted(set(range(first, last + 1)) | expected)
+
+        found, probes, seconds = asyncio.run(run(ports, args.concurrency))
+    finally:
+        for listener in listeners:
+            listener.close()
+
+    concurrency = min(args.concurrency, max_concurrency())
+    print(f"scanned {probes} ports in {seconds:.2f} s with {concurrency} "
+          f"probes at once: {probes / seconds:.0f} ports/s")
+    missing = expected - found
+    print(f"found {len(expected & found)} of {len(expected)} listeners")
+    if missing:
+        print(f"missing listeners: {sorted(missing)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Measure the time to the first prompt of main.py and the import time of the
+heaviest top level modules"""
+
+import os
+import re
+import sys
+import time
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+RUNS = 5
+TOP = 10
+
+
+def time_to_first_prompt() -> float:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=ROOT,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert process.stdout is not None and process.stdin is not None
+
+    prompt = b""
+    while not prompt.endswith(b"User: "):
+        char = process.stdout.read(1)
+        if len(char) == 0:
+            raise RuntimeError("main.py exited before the first prompt")
+        prompt += char
+    elapsed = time.perf_counter() - start
+
+    process.stdin.close()
+    process.wait()
+    return elapsed
+
+
+def import_times() -> dict:
+    """Self import time in microseconds of every top level package"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        text=True)
+
+    times: dict = defaultdict(int)
+    pattern = re.compile(r"import time:\s+(\d+) \|\s+\d+ \| *(\S+)")
+    for line in result.stderr.splitlines():
+        match = pattern.match(line)
+        if match is not None:
+            times[match.group(2).split(".")[0]] += int(match.group(1))
+    return times
+
+
+def main():
+    # the first run generates the abilities manifest
+    time_to_first_prompt()
+    runs = sorted(time_to_first_prompt() for _ in range(RUNS))
+    print(f"time to first prompt: {runs[len(runs) // 2] * 1000:.1f} ms "
+          f"(median of {RUNS} runs)")
+
+    print("import time:")
+    times = import_times()
+    for name, value in sorted(times.items(), key=lambda x: -x[1])[:TOP]:
+        print(f"  {name:<20} {value / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Measure the per turn cost of building the tools schema with many abilities
+loaded, compiling it on every request against the cached schema"""
+
+import os
+import sys
+import json
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from assistant import Assistant, AssistantAbility  # noqa: E402
+
+ABILITIES = 300
+TURNS = 1000
+
+
+def generate_ability(index: int) -> AssistantAbility:
+    def action(path: str, count: int = 1) -> str:
+        return path * count
+
+    ability = AssistantAbility(f"ability_{index}",
+                               f"Test ability number {index}", action)
+    ability.add_argument("path", "string", "a path", True)
+    ability.add_argument("count", "number", "a count", False)
+    ability.add_argument("mode", "string", "a mode", False, ["a", "b", "c"])
+    return ability
+
+
+def main():
+    assistant = Assistant("benchmark")
+    for index in range(ABILITIES):
+        assistant.add_ability(generate_ability(index))
+
+    def uncached():
+        return [
+            ability.generate_ability_description()
+            for ability in assistant._abilities.values()
+        ]
+
+    def cached():
+        return assistant._request_args([], False)
+
+    uncached_time = timeit.timeit(uncached, number=TURNS) / TURNS
+    cached_time = timeit.timeit(cached, number=TURNS) / TURNS
+
+    print(f"abilities: {ABILITIES}, turns: {TURNS}")
+    print(f"schema size: {len(json.dumps(assistant.tools))} bytes")
+    print(f"uncached: {uncached_time * 1e6:.1f} us/turn")
+    print(f"cached: {cached_time * 1e6:.1f} us/turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+
+
+class AbilityCache:
+    """LRU cache for the results of idempotent abilities, every entry expires
+    after the time to live of its ability"""
+
+    _MAX_ENTRIES_ = 256
+
+    def __init__(self, max_entries: int = _MAX_ENTRIES_):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            self._hits, self._misses, self._evictions, self._invalidations)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(name: str, args: Dict[str, object]) -> str:
+        normalized = {
+            key: value.strip() if isinstance(value, str) else value
+            for key, value in args.items()
+        }
+        return name + json.dumps(normalized, sort_keys=True)
+
+    def get(self, name: str, args: Dict[str, object]) -> Optional[str]:
+        key = AbilityCache.key(name, args)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, name: str, args: Dict[str, object], value: str, ttl: float):
+        key = AbilityCache.key(name, args)
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidations += 1
@@ -0,0 +1,347 @@
+import time
+import random
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+
+class CircuitOpenError(Exception):
+    """The model API failed too many times in a row, requests are refused
+    until the circuit is half open again"""
+
+
+class ClientStats(NamedTuple):
+    requests: int
+    retries: int
+    failures: int
+    rejected: int
+    circuit_opens: int
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+
+
+class ClientMetrics:
+    """Count the requests and their retries and keep the latencies of the
+    last requests to get their percentiles"""
+
+    _LATENCIES_ = 1024
+
+    def __init__(self, latencies: int = _LATENCIES_):
+        self._latencies: Deque[float] = deque(maxlen=latencies)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.circuit_opens = 0
+
+    def observe(self, latency: float):
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(latency)
+
+    def percentile(self, percent: float) -> float:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) == 0:
+            return 0.0
+        index = min(int(len(latencies) * percent / 100), len(latencies) - 1)
+        return latencies[index]
+
+    @property
+    def stats(self) -> ClientStats:
+        return ClientStats(
+            self.requests, self.retries, self.failures, self.rejected,
+            self.circuit_opens, self.percentile(50), self.percentile(95),
+            self.percentile(99))
+
+
+class CircuitBreaker:
+    """Refuse the requests after many failures in a row, after the reset
+    timeout a single request is let through and the circuit is closed again
+    if it succeeds"""
+
+    _FAILURES_ = 5
+    _RESET_TIMEOUT_ = 30.0
+
+    def __init__(self,
+                 failures: int = _FAILURES_,
+                 reset_timeout: float = _RESET_TIMEOUT_):
+        self._max_failures = failures
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or \
+                    time.monotonic() - self._opened_at < self._reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def retry_in(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self._opened_at
+        return max(self._reset_timeout - elapsed, 0.0)
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self) -> bool:
+        """Count a failure, returns True when the circuit opens"""
+        with self._lock:
+            self._failures += 1
+            was_open = self._opened_at is not None
+            if self._probing or self._failures >= self._max_failures:
+                self._opened_at = time.monotonic()
+                self._probing = False
+            return not was_open and self._opened_at is not None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, the server retry-after header is
+    respected when it is given"""
+
+    _RETRIES_ = 3
+    _BASE_DELAY_ = 0.5
+    _MAX_DELAY_ = 8.0
+
+    def __init__(self,
+                 retries: int = _RETRIES_,
+                 base_delay: float = _BASE_DELAY_,
+                 max_delay: float = _MAX_DELAY_):
+        self.retries = retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self._max_delay)
+        ceiling = min(self._base_delay * 2 ** attempt, self._max_delay)
+        return random.uniform(0, ceiling)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or \
+            error.status_code >= 500
+    return False
+
+
+class _ClientBase:
+    _MAX_CONNECTIONS_ = 20
+    _KEEPALIVE_CONNECTIONS_ = 10
+    _KEEPALIVE_EXPIRY_ = 60.0
+    _CONNECT_TIMEOUT_ = 5.0
+    _READ_TIMEOUT_ = 60.0
+
+    def __init__(self,
+                 retry: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 metrics: Optional[ClientMetrics] = None,
+                 max_connections: int = _MAX_CONNECTIONS_,
+                 keepalive_connections: int = _KEEPALIVE_CONNECTIONS_,
+                 connect_timeout: float = _CONNECT_TIMEOUT_,
+                 read_timeout: float = _READ_TIMEOUT_,
+                 **client_args):
+        self._retry = retry or RetryPolicy()
+        self._breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or ClientMetrics()
+        self._max_connections = max_connections
+        self._keepalive_connections = keepalive_connections
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        # passed to the openai client, like base_url or api_key
+        self._client_args = client_args
+
+    @property
+    def stats(self) -> ClientStats:
+        return self.metrics.stats
+
+    def _http_args(self) -> dict:
+        import httpx
+
+        return {
+            "limits": httpx.Limits(
+                max_connections=self._max_connections,
+                max_keepalive_connections=self._keepalive_connections,
+                keepalive_expiry=_ClientBase._KEEPALIVE_EXPIRY_),
+            "timeout": self._timeout(),
+        }
+
+    def _timeout(self) -> "httpx.Timeout":
+        import httpx
+
+        # the read timeout is the longest wait between two chunks of a stream
+        return httpx.Timeout(self._read_timeout,
+                             connect=self._connect_timeout)
+
+    def _before(self):
+        if not self._breaker.allow():
+            self.metrics.rejected += 1
+            raise CircuitOpenError(
+                "The model API is failing, retry in "
+                f"{self._breaker.retry_in():.1f} seconds")
+
+    def _failed(self, error: Exception, attempt: int) -> Optional[float]:
+        """Record a failed attempt, returns the delay before the next attempt
+        or None when the error should be raised"""
+        if not is_retryable(error):
+            self._breaker.success()
+            return None
+
+        if self._breaker.failure():
+            self.metrics.circuit_opens += 1
+        if attempt >= self._retry.retries or self._breaker.is_open:
+            self.metrics.failures += 1
+            return None
+
+        self.metrics.retries += 1
+        return self._retry.delay(attempt, retry_after(error))
+
+    def _succeeded(self, start: float):
+        self._breaker.success()
+        self.metrics.observe(time.monotonic() - start)
+
+
+class ModelClient(_ClientBase):
+    """OpenAI client with a tuned keep alive connection pool, timeouts,
+    retries with backoff and jitter and a circuit breaker"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client: Optional["OpenAI"] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> "OpenAI":
+        with self._lock:
+            if self._client is None:
+                import httpx
+                from openai import OpenAI
+
+                self._client = OpenAI(
+                    http_client=httpx.Client(**self._http_args()),
+                    timeout=self._timeout(),
+                    max_retries=0,
+                    **self._client_args)
+            return self._client
+
+    def _call(self, request: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            self._before()
+            start = time.monotonic()
+            try:
+                response = request()
+            except Exception as error:
+                delay = self._failed(error, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self._succeeded(start)
+            return response
+
+    def chat(self, **args):
+        """Create a chat completion, a stream is retried only until its
+        first response"""
+        return self._call(lambda: self.client.chat.completions.create(**args))
+
+    def speech(self, **args):
+        return self._call(lambda: self.client.audio.speech.create(**args))
+
+    def speech_stream(self, **args):
+        """Start a speech request and return as soon as the response headers
+        arrive, the caller reads the audio as it comes and closes it"""
+        speech = self.client.audio.speech.with_streaming_response
+        return self._call(lambda: speech.create(**args).__enter__())
+
+
+class AsyncModelClient(_ClientBase):
+    """The asyncio version of ModelClient"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client: Optional["AsyncOpenAI"] = None
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(
+                http_client=httpx.AsyncClient(**self._http_args()),
+                timeout=self._timeout(),
+                max_retries=0,
+                **self._client_args)
+        return self._client
+
+    async def _call(self, request: Callable[[], Any]) -> Any:
+        import asyncio
+
+        attempt = 0
+        while True:
+            self._before()
+            start = time.monotonic()
+            try:
+                response = await request()
+            except Exception as error:
+                delay = self._failed(error, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            self._succeeded(start)
+            return response
+
+    async def chat(self, **args):
+        return await self._call(
+            lambda: self.client.chat.completions.create(**args))
+
+    async def speech(self, **args):
+        return await self._call(
+            lambda: self.client.audio.speech.create(**args))
+
+    async def speech_stream(self, **args):
+        """Start a speech request and return as soon as the response headers
+        arrive, the caller reads the audio as it comes and closes it"""
+        speech = self.client.audio.speech.with_streaming_response
+        return await self._call(lambda: speech.create(**args).__aenter__())
@@ -0,0 +1,178 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+# a strategy takes the content and a size limit and returns the compacted
+# content or None when it does not know how to compact it
+CompactionStrategy = Callable[[str, int], Optional[str]]
+
+
+def head_tail(content: str, limit: int) -> str:
+    """Keep the beginning and the end of the content"""
+    if len(content) <= limit:
+        return content
+
+    marker = "\n... [{} characters omitted] ...\n"
+    keep = max(limit - len(marker.format(len(content))), 0)
+    head = keep * 2 // 3
+    tail = keep - head
+    return (content[:head]
+            + marker.format(len(content) - keep)
+            + content[len(content) - tail:])
+
+
+def sample_lines(content: str, limit: int) -> Optional[str]:
+    """Keep the first and the last lines and a sample of the lines between
+    them"""
+    lines = content.splitlines()
+    if len(lines) < 10:
+        return None
+
+    line_limit = max(limit // 20, 40)
+    lines = [head_tail(line, line_limit) for line in lines]
+
+    def take(candidates: List[str], budget: int) -> List[str]:
+        taken: List[str] = []
+        for line in candidates:
+            budget -= len(line) + 1
+            if budget < 0:
+                break
+            taken.append(line)
+        return taken
+
+    head = take(lines, limit * 2 // 5)
+    tail = take(lines[len(head):][::-1], limit * 2 // 5)[::-1]
+    middle = lines[len(head):len(lines) - len(tail)]
+    if len(middle) == 0:
+        return "\n".join(head + tail)
+
+    average = max(sum(len(line) + 1 for line in middle) // len(middle), 1)
+    count = max((limit // 5 - 80) // average, 0)
+    step = max(len(middle) // count, 1) if count > 0 else len(middle) + 1
+    sampled = middle[step // 2::step][:count]
+
+    return "\n".join([
+        *head,
+        f"... [{len(middle)} lines omitted, {len(sampled)} sampled below] ...",
+        *sampled,
+        "... [end of the sampled lines] ...",
+        *tail,
+    ])
+
+
+def _prune(obj: object, string_limit: int, items_limit: int) -> object:
+    if isinstance(obj, str):
+        return head_tail(obj, string_limit)
+    if isinstance(obj, list):
+        pruned = [_prune(item, string_limit, items_limit)
+                  for item in obj[:items_limit]]
+        if len(obj) > items_limit:
+            pruned.append(f"... [{len(obj) - items_limit} more items]")
+        return pruned
+    if isinstance(obj, dict):
+        keys = list(obj.keys())
+        pruned = {
+            key: _prune(obj[key], string_limit, items_limit)
+            for key in keys[:items_limit]
+        }
+        if len(keys) > items_limit:
+            pruned["..."] = f"{len(keys) - items_limit} more fields"
+        return pruned
+    return obj
+
+
+def prune_json(content: str, limit: int) -> Optional[str]:
+    """Shorten the long strings and the long lists of a JSON document"""
+    try:
+        obj = json.loads(content)
+    except ValueError:
+        return None
+
+    # the first try keeps most of a single long field like a command output
+    for string_limit, items_limit in ((limit * 3 // 4, 200), (1024, 100),
+                                      (512, 50), (256, 25), (128, 10),
+                                      (64, 5), (32, 3)):
+        pruned = json.dumps(_prune(obj, string_limit, items_limit))
+        if len(pruned) <= limit:
+            return pruned
+    return None
+
+
+class ResultStore:
+    """Keep the full results of the abilities out of the chat history, the
+    oldest results are dropped when the store is over its size"""
+
+    _MAX_SIZE_ = 64 * 1024 * 1024
+
+    def __init__(self, max_size: int = _MAX_SIZE_):
+        self._max_size = max_size
+        self._size = 0
+        self._counter = 0
+        self._results: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, content: str) -> str:
+        with self._lock:
+            self._counter += 1
+            handle = f"result-{self._counter}"
+            self._results[handle] = content
+            self._size += len(content)
+
+            while self._size > self._max_size and len(self._results) > 1:
+                _, dropped = self._results.popitem(last=False)
+                self._size -= len(dropped)
+        return handle
+
+    def get(self, handle: str) -> Optional[str]:
+        with self._lock:
+            content = self._results.get(handle)
+            if content is not None:
+                self._results.move_to_end(handle)
+            return content
+
+
+class Compactor:
+    """Make the results of the abilities fit in a tool message, the full
+    result is stored and the model can page through it by its handle"""
+
+    def __init__(self,
+                 limit: int = 4096,
+                 store: Optional[ResultStore] = None,
+                 strategies: Optional[List[CompactionStrategy]] = None):
+        self._limit = limit
+        self._store = store or ResultStore()
+        self._strategies = strategies or [prune_json, sample_lines]
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    def __call__(self, content: str) -> str:
+        if len(content) <= self._limit:
+            return content
+
+        handle = self._store.put(content)
+        note = (f"\n[Compacted from {len(content)} characters, "
+                f"the full output is stored as {handle}, "
+                "use read_result to page through it]")
+        limit = self._limit - len(note)
+
+        for strategy in self._strategies:
+            compacted = strategy(content, limit)
+            if compacted is not None and len(compacted) <= limit:
+                return compacted + note
+        return head_tail(content, limit) + note
+
+    def read(self, handle: str, offset: int = 0) -> str:
+        content = self._store.get(handle)
+        if content is None:
+            return f"Error: result {handle} does not exist or was dropped"
+
+        offset = max(offset, 0)
+        page = content[offset:offset + self._limit - 128]
+        end = offset + len(page)
+        footer = f"\n[characters {offset}-{end} of {len(content)}"
+        if end < len(content):
+            footer += f", next offset: {end}"
+        return page + footer + "]"
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import heapq
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from treewalk import subtree, walk
+from paths import cache_path
+
+
+class DirectoryUsage(NamedTuple):
+    mtime: int
+    # usage of the directory itself and the files directly inside it, hard
+    # linked files are kept apart to be counted only once
+    size: int
+    subdirs: List[str]
+    links: List[Tuple[int, int, int]]
+    files: List[Tuple[int, str]]
+
+
+class DiskUsageReport(NamedTuple):
+    total: int
+    directories: List[Tuple[str, int]]
+    files: List[Tuple[str, int]]
+    scanned: int
+    reused: int
+    errors: int
+    complete: bool
+    elapsed: float
+
+
+def default_cache_path() -> Path:
+    return cache_path("disk_usage.sqlite3")
+
+
+def scan_directory(path: str,
+                   device: int,
+                   cached: Optional[DirectoryUsage],
+                   files_limit: int
+                   ) -> Tuple[Optional[DirectoryUsage], bool]:
+    """Get the usage of the files directly inside a directory, the cached
+    usage is returned as it is when the directory was not changed since
+
+    Returns the usage or None on failure and whether the cache was used"""
+    try:
+        stat = os.stat(path, follow_symlinks=False)
+        if cached is not None and cached.mtime == stat.st_mtime_ns:
+            return cached, True
+
+        size = stat.st_blocks * 512
+        subdirs: List[str] = []
+        links: List[Tuple[int, int, int]] = []
+        files: List[Tuple[int, str]] = []
+
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                if entry.is_dir(follow_symlinks=False):
+                    # stay on the same file system like du -x
+                    if entry_stat.st_dev == device:
+                        subdirs.append(entry.name)
+                    continue
+
+                usage = entry_stat.st_blocks * 512
+                if entry_stat.st_nlink > 1:
+                    links.append((entry_stat.st_dev, entry_stat.st_ino, usage))
+                else:
+                    size += usage
+
+                if len(files) < files_limit:
+                    heapq.heappush(files, (usage, entry.name))
+                else:
+                    heapq.heappushpop(files, (usage, entry.name))
+
+        return DirectoryUsage(
+            stat.st_mtime_ns, size, subdirs, links, files), False
+    except OSError:
+        return None, False
+
+
+class DiskUsageScanner:
+    """Compute the recursive disk usage of directories on a thread pool, the
+    usage of every directory is stored by its modification time so the next
+    scans only read the directories that were changed
+
+    A directory modification time changes only when entries are added,
+    removed or renamed, a file growing in place is seen after its directory
+    changes"""
+
+    _MAX_WORKERS_ = 8
+    _FILES_PER_DIRECTORY_ = 16
+    _TIME_LIMIT_ = 240.0
+
+    def __init__(self,
+                 cache_path: Optional[Path] = None,
+                 max_workers: int = _MAX_WORKERS_,
+                 files_per_directory: int = _FILES_PER_DIRECTORY_):
+        self._cache_path = cache_path or default_cache_path()
+        self._max_workers = max_workers
+        self._files_per_directory = files_per_directory
+
+    def _connect(self) -> sqlite3.Connection:
+        self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self._cache_path, timeout=30)
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                mtime INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                subdirs TEXT NOT NULL,
+                links TEXT NOT NULL,
+                files TEXT NOT NULL
+            )""")
+        return connection
+
+    def _load(self, connection: sqlite3.Connection,
+              root: str) -> Dict[str, DirectoryUsage]:
+        rows = connection.execute(
+            "SELECT path, mtime, size, subdirs, links, files "
+            "FROM directories WHERE path = ? OR (path > ? AND path < ?)",
+            subtree(root))
+
+        return {
+            path: DirectoryUsage(
+                mtime, size, json.loads(subdirs),
+                [tuple(link) for link in json.loads(links)],
+                [tuple(file) for file in json.loads(files)])
+            for path, mtime, size, subdirs, links, files in rows
+        }
+
+    def _save(self, connection: sqlite3.Connection,
+              changed: Dict[str, DirectoryUsage], removed: Set[str]):
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (path, usage.mtime, usage.size, json.dumps(usage.subdirs),
+                     json.dumps(usage.links), json.dumps(usage.files))
+                    for path, usage in changed.items()
+                ])
+            connection.executemany(
+                "DELETE FROM directories WHERE path = ?",
+                [(path,) for path in removed])
+
+    def scan(self, root: str, top: int = 10,
+             time_limit: float = _TIME_LIMIT_) -> DiskUsageReport:
+        start = time.monotonic()
+        deadline = start + time_limit
+        root = os.path.abspath(root)
+        device = os.stat(root).st_dev
+
+        connection = self._connect()
+        try:
+            cached = self._load(connection, root)
+
+            def scan(path: str) -> Optional[Tuple[DirectoryUsage, bool]]:
+                usage, reused = scan_directory(
+                    path, device, cached.get(path), self._files_per_directory)
+                return None if usage is None else (usage, reused)
+
+            scanned, errors, complete = walk(
+                root, scan, lambda path, result: result[0].subdirs,
+                self._max_workers, deadline)
+            results = {path: usage for path, (usage, _) in scanned.items()}
+            changed = {path: usage for path, (usage, reused) in scanned.items()
+                       if not reused}
+
+            removed = set()
+            if complete:
+                removed = set(cached.keys()) - set(results.keys())
+            self._save(connection, changed, removed)
+        finally:
+            connection.close()
+
+        totals = self._aggregate(results)
+        directories = heapq.nlargest(
+            top, ((path, size) for path, size in totals.items()
+                  if path != root),
+            key=lambda item: item[1])
+        files = heapq.nlargest(
+            top, ((os.path.join(path, name), size)
+                  for path, usage in results.items()
+                  for size, name in usage.files),
+            key=lambda item: item[1])
+
+        return DiskUsageReport(
+            totals.get(root, 0),
+            directories,
+            files,
+            len(changed),
+            len(results) - len(changed),
+            errors,
+            complete,
+            round(time.monotonic() - start, 3),
+        )
+
+    @staticmethod
+    def _aggregate(results: Dict[str, DirectoryUsage]) -> Dict[str, int]:
+        """Sum the usage of every directory with its subdirectories, a path
+        is always longer than its parent so the children are summed first"""
+        totals: Dict[str, int] = {}
+        seen: Set[Tuple[int, int]] = set()
+
+        for path in sorted(results, key=len, reverse=True):
+            usage = results[path]
+            total = usage.size
+
+            for device, inode, size in usage.links:
+                if (device, inode) not in seen:
+                    seen.add((device, inode))
+                    total += size
+
+            for name in usage.subdirs:
+                total += totals.get(os.path.join(path, name), 0)
+            totals[path] = total
+        return totals
@@ -0,0 +1,245 @@
+import json
+import time
+import asyncio
+import itertools
+import threading
+from pathlib import Path
+from typing import (TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, List,
+                    NamedTuple, Optional, Union)
+
+from audio import PCM_CHANNELS, PCM_RATE, PCM_WIDTH
+from client import AsyncModelClient, ModelClient
+from history import count_tokens, message_to_dict
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+class ScriptedCall(NamedTuple):
+    name: str
+    arguments: Dict[str, Any]
+
+
+class ScriptedResponse(NamedTuple):
+    content: Optional[str] = None
+    tool_calls: List[ScriptedCall] = []
+
+    @staticmethod
+    def from_dict(obj: Dict[str, Any]) -> "ScriptedResponse":
+        return ScriptedResponse(obj.get("content"), [
+            ScriptedCall(call["name"], call.get("arguments", {}))
+            for call in obj.get("tool_calls", [])
+        ])
+
+
+def text(content: str) -> ScriptedResponse:
+    return ScriptedResponse(content)
+
+
+def tool_calls(*calls: ScriptedCall) -> ScriptedResponse:
+    return ScriptedResponse(None, list(calls))
+
+
+# the speech of every text, a quarter second of pcm silence
+FAKE_SPEECH = bytes(PCM_RATE * PCM_WIDTH * PCM_CHANNELS // 4)
+
+
+class FakeSpeech:
+    """Speech response with the parts of the openai responses used by the
+    assistant, the whole content or its chunks"""
+
+    _CHUNK_SIZE_ = 4096
+
+    def __init__(self, content: bytes = FAKE_SPEECH,
+                 chunk_size: int = _CHUNK_SIZE_):
+        self.content = content
+        self._chunk_size = chunk_size
+        self.closed = False
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        for start in range(0, len(self.content), self._chunk_size):
+            yield self.content[start:start + self._chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncFakeSpeech(FakeSpeech):
+    async def iter_bytes(self) -> AsyncIterator[bytes]:  # type: ignore
+        for chunk in super().iter_bytes():
+            yield chunk
+
+    async def close(self):  # type: ignore
+        super().close()
+
+
+def load_script(path: Union[str, Path]) -> List[ScriptedResponse]:
+    """Load a script from a JSON list like:
+
+    [{"tool_calls": [{"name": "execute",
+                      "arguments": {"command": "ls"}}]},
+     {"content": "done"}]"""
+    with open(path) as file:
+        return [ScriptedResponse.from_dict(obj) for obj in json.load(file)]
+
+
+class FakeModelClient(ModelClient):
+    """Model client replaying a script of responses without any network, the
+    script is repeated when it ends so long sessions can be replayed from a
+    short script
+
+    Used to benchmark and profile the assistant loop, a fixed latency can be
+    added to every request to look like a real model"""
+
+    def __init__(self,
+                 script: List[ScriptedResponse],
+                 latency: float = 0.0,
+                 chunk_size: int = 16):
+        super().__init__()
+        if len(script) == 0:
+            raise ValueError("Fake client script is empty")
+        self._script = itertools.cycle(script)
+        self._latency = latency
+        self._chunk_size = chunk_size
+        self._counter = itertools.count(1)
+        self._script_lock = threading.Lock()
+
+    @staticmethod
+    def from_file(path: Union[str, Path],
+                  latency: float = 0.0) -> "FakeModelClient":
+        return FakeModelClient(load_script(path), latency)
+
+    def _next(self) -> ScriptedResponse:
+        with self._script_lock:
+            return next(self._script)
+
+    def _call_id(self) -> str:
+        return f"call_{next(self._counter)}"
+
+    def chat(self, **args):
+        return self._call(lambda: self._complete(**args))
+
+    def speech(self, **args):
+        return self._call(self._speech)
+
+    def speech_stream(self, **args):
+        return self._call(self._speech)
+
+    def _speech(self) -> FakeSpeech:
+        if self._latency > 0:
+            time.sleep(self._latency)
+        return FakeSpeech()
+
+    def _complete(self, messages: List[Any], stream: bool = False,
+                  **_) -> Union["ChatCompletion",
+                                Iterator["ChatCompletionChunk"]]:
+        if self._latency > 0:
+            time.sleep(self._latency)
+
+        response = self._next()
+        if stream:
+            return self._chunks(response)
+
+        from openai.types.chat import ChatCompletion, ChatCompletionMessage
+        from openai.types.chat.chat_completion import Choice
+        from openai.types.chat.chat_completion_message_tool_call import (
+            ChatCompletionMessageToolCall, Function)
+        from openai.types.completion_usage import CompletionUsage
+
+        calls = [
+            ChatCompletionMessageToolCall(
+                id=self._call_id(), type="function",
+                function=Function(name=call.name,
+                                  arguments=json.dumps(call.arguments)))
+            for call in response.tool_calls
+        ] or None
+
+        prompt_tokens = sum(
+            len(str(message_to_dict(message).get("content") or ""))
+            for message in messages) // 4
+        completion_tokens = count_tokens(response.content or "")
+
+        return ChatCompletion(
+            id="fake", object="chat.completion", created=0, model="fake",
+            choices=[Choice(
+                index=0,
+                finish_reason="tool_calls" if calls else "stop",
+                message=ChatCompletionMessage(
+                    role="assistant", content=response.content,
+                    tool_calls=calls),
+            )],
+            usage=CompletionUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens),
+        )
+
+    def _chunks(self, response: ScriptedResponse
+                ) -> Iterator["ChatCompletionChunk"]:
+        from openai.types.chat import ChatCompletionChunk
+        from openai.types.chat.chat_completion_chunk import (
+            Choice, ChoiceDelta, ChoiceDeltaToolCall,
+            ChoiceDeltaToolCallFunction)
+
+        def chunk(delta: ChoiceDelta) -> ChatCompletionChunk:
+            return ChatCompletionChunk(
+                id="fake", object="chat.completion.chunk", created=0,
+                model="fake",
+                choices=[Choice(index=0, delta=delta, finish_reason=None)])
+
+        content = response.content or ""
+        for start in range(0, len(content), self._chunk_size):
+            yield chunk(ChoiceDelta(
+                content=content[start:start + self._chunk_size]))
+
+        for index, call in enumerate(response.tool_calls):
+            yield chunk(ChoiceDelta(tool_calls=[ChoiceDeltaToolCall(
+                index=index, id=self._call_id(), type="function",
+                function=ChoiceDeltaToolCallFunction(
+                    name=call.name, arguments=json.dumps(call.arguments)),
+            )]))
+
+
+class AsyncFakeModelClient(AsyncModelClient):
+    """The asyncio version of FakeModelClient, the latency is awaited so many
+    sessions can wait for it at once"""
+
+    def __init__(self,
+                 script: List[ScriptedResponse],
+                 latency: float = 0.0,
+                 chunk_size: int = 16):
+        super().__init__()
+        self._fake = FakeModelClient(script, chunk_size=chunk_size)
+        self._latency = latency
+
+    @staticmethod
+    def from_file(path: Union[str, Path],
+                  latency: float = 0.0) -> "AsyncFakeModelClient":
+        return AsyncFakeModelClient(load_script(path), latency)
+
+    async def chat(self, **args):
+        return await self._call(lambda: self._complete(**args))
+
+    async def speech(self, **args):
+        return await self._call(self._speech)
+
+    async def speech_stream(self, **args):
+        return await self._call(self._speech)
+
+    async def _speech(self) -> AsyncFakeSpeech:
+        if self._latency > 0:
+            await asyncio.sleep(self._latency)
+        return AsyncFakeSpeech()
+
+    async def _complete(self, stream: bool = False, **args):
+        if self._latency > 0:
+            await asyncio.sleep(self._latency)
+
+        response = self._fake._complete(stream=stream, **args)
+        if not stream:
+            return response
+
+        async def chunks():
+            for chunk in response:
+                yield chunk
+        return chunks()
@@ -0,0 +1,389 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from treewalk import subtree, walk
+from paths import cache_path
+
+
+class EntryKind(Enum):
+    any = "any"
+    file = "file"
+    directory = "directory"
+    link = "link"
+
+
+# the kinds as stored in the index
+_KINDS_ = (EntryKind.file, EntryKind.directory, EntryKind.link)
+
+
+class IndexEntry(NamedTuple):
+    name: str
+    kind: int
+    size: int
+    mtime: int
+
+
+class DirectoryListing(NamedTuple):
+    mtime: int
+    # the directories to enter, on the same file system
+    subdirs: List[str]
+    # None when the directory was not changed since it was indexed
+    entries: Optional[List[IndexEntry]]
+
+
+class RefreshReport(NamedTuple):
+    scanned: int
+    reused: int
+    errors: int
+    complete: bool
+    elapsed: float
+
+
+class FileMatch(NamedTuple):
+    path: str
+    kind: EntryKind
+    size: int
+    mtime: int
+
+
+class FileSearch(NamedTuple):
+    matches: List[FileMatch]
+    truncated: bool
+    # None when the index of the path was fresh enough to skip the refresh
+    refresh: Optional[RefreshReport]
+    indexed_entries: int
+    index_bytes: int
+    elapsed: float
+
+
+def default_index_path() -> Path:
+    return cache_path("file_index.sqlite3")
+
+
+def list_directory(path: str,
+                   device: int,
+                   cached_mtime: Optional[int]
+                   ) -> Optional[DirectoryListing]:
+    """List the entries of a directory, nothing is listed when its
+    modification time is the cached one
+
+    Returns the listing or None on failure"""
+    try:
+        stat = os.stat(path, follow_symlinks=False)
+        if stat.st_mtime_ns == cached_mtime:
+            return DirectoryListing(stat.st_mtime_ns, [], None)
+
+        subdirs: List[str] = []
+        entries: List[IndexEntry] = []
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                try:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                if entry.is_symlink():
+                    kind = _KINDS_.index(EntryKind.link)
+                elif entry.is_dir(follow_symlinks=False):
+                    kind = _KINDS_.index(EntryKind.directory)
+                    # a mount point is indexed but not entered, like find -xdev
+                    if entry_stat.st_dev == device:
+                        subdirs.append(entry.name)
+                else:
+                    kind = _KINDS_.index(EntryKind.file)
+                entries.append(IndexEntry(
+                    entry.name, kind, entry_stat.st_size,
+                    int(entry_stat.st_mtime)))
+        return DirectoryListing(stat.st_mtime_ns, subdirs, entries)
+    except OSError:
+        return None
+
+
+class FileIndex:
+    """Index of the paths under the searched directories in SQLite, the names
+    are matched with a trigram full text index so finding a part of a name
+    does not read every row
+
+    The index is refreshed before a search by listing only the directories
+    whose modification time changed, a directory changes when entries are
+    added, removed or renamed so a file growing in place keeps its old size
+    until then. A path refreshed in the last seconds is not refreshed again"""
+
+    _MAX_WORKERS_ = 8
+    _TIME_LIMIT_ = 240.0
+    _REFRESH_INTERVAL_ = 30.0
+
+    def __init__(self,
+                 index_path: Optional[Path] = None,
+                 max_workers: int = _MAX_WORKERS_,
+                 refresh_interval: float = _REFRESH_INTERVAL_):
+        self._index_path = index_path or default_index_path()
+        self._max_workers = max_workers
+        self._refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        # the refreshed directories by the time of their refresh
+        self._refreshed: Dict[str, float] = {}
+        self._has_names: Optional[bool] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        self._index_path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self._index_path, timeout=30)
+        # the searches read while a refresh of another path writes
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS directories (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                mtime INTEGER NOT NULL,
+                subdirs TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                directory INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                kind INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                extension TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_directory
+                ON entries (directory);
+            CREATE INDEX IF NOT EXISTS entries_extension
+                ON entries (extension);
+            CREATE INDEX IF NOT EXISTS entries_size ON entries (size);""")
+
+        if self._has_names is None:
+            self._has_names = self._create_names(connection)
+        return connection
+
+    @staticmethod
+    def _create_names(connection: sqlite3.Connection) -> bool:
+        """Index the names for substring searches, SQLite builds without the
+        full text search extension scan the names instead"""
+        try:
+            # kept in sync with the entries by _save
+            connection.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(
+                    name, content='entries', content_rowid='id',
+                    tokenize='trigram')""")
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    def _is_fresh(self, root: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            for path, refreshed in self._refreshed.items():
+                if now - refreshed > self._refresh_interval:
+                    continue
+                if root == path or root.startswith(path.rstrip("/") + "/"):
+                    return True
+        return False
+
+    def invalidate(self):
+        """Refresh every path on its next search, like after a command that
+        may have created or removed files"""
+        with self._lock:
+            self._refreshed.clear()
+
+    def refresh(self, root: str,
+                time_limit: float = _TIME_LIMIT_) -> RefreshReport:
+        start = time.monotonic()
+        deadline = start + time_limit
+        root = os.path.abspath(root)
+        device = os.stat(root).st_dev
+
+        connection = self._connect()
+        try:
+            # the id, modification time and subdirs of every directory
+            cached: Dict[str, Tuple[int, int, List[str]]] = {
+                path: (directory_id, mtime, json.loads(subdirs))
+                for path, directory_id, mtime, subdirs in connection.execute(
+                    "SELECT path, id, mtime, subdirs FROM directories "
+                    "WHERE path = ? OR (path > ? AND path < ?)",
+                    subtree(root))
+            }
+
+            def scan(path: str) -> Optional[DirectoryListing]:
+                cache = cached.get(path)
+                return list_directory(
+                    path, device, cache[1] if cache is not None else None)
+
+            def subdirs(path: str, listing: DirectoryListing) -> List[str]:
+                # an unchanged directory keeps its indexed subdirs
+                if listing.entries is None:
+                    return cached[path][2]
+                return listing.subdirs
+
+            seen, errors, complete = walk(
+                root, scan, subdirs, self._max_workers, deadline)
+            changed = {path: listing for path, listing in seen.items()
+                       if listing.entries is not None}
+
+            removed = []
+            if complete:
+                removed = [cache[0] for path, cache in cached.items()
+                           if path not in seen]
+            self._save(connection, changed, removed)
+        finally:
+            connection.close()
+
+        if complete:
+            with self._lock:
+                self._refreshed[root] = time.monotonic()
+
+        return RefreshReport(
+            len(changed),
+            len(seen) - len(changed),
+            errors,
+            complete,
+            round(time.monotonic() - start, 3),
+        )
+
+    def _save(self, connection: sqlite3.Connection,
+              changed: Dict[str, DirectoryListing], removed: List[int]):
+        with connection:
+            directories = []
+            for path, listing in changed.items():
+                connection.execute(
+                    "INSERT INTO directories (path, mtime, subdirs) "
+                    "VALUES (?, ?, ?) ON CONFLICT (path) DO UPDATE SET "
+                    "mtime = excluded.mtime, subdirs = excluded.subdirs",
+                    (path, listing.mtime, json.dumps(listing.subdirs)))
+                directory_id, = connection.execute(
+                    "SELECT id FROM directories WHERE path = ?",
+                    (path,)).fetchone()
+                directories.append((directory_id, listing))
+
+            stale = [(directory_id,) for directory_id, _ in directories]
+            stale.extend((directory_id,) for directory_id in removed)
+            if self._has_names:
+                connection.executemany(
+                    "INSERT INTO names (names, rowid, name) "
+                    "SELECT 'delete', id, name FROM entries "
+                    "WHERE directory = ?", stale)
+            connection.executemany(
+                "DELETE FROM entries WHERE directory = ?", stale)
+            connection.executemany(
+                "DELETE FROM directories WHERE id = ?",
+                [(directory_id,) for directory_id in removed])
+
+            # the new entries get ids over the last one
+            last_id, = connection.execute(
+                "SELECT coalesce(max(id), 0) FROM entries").fetchone()
+            connection.executemany(
+                "INSERT INTO entries (directory, name, kind, size, mtime, "
+                "extension) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (directory_id, entry.name, entry.kind, entry.size,
+                     entry.mtime, os.path.splitext(entry.name)[1][1:].lower())
+                    for directory_id, listing in directories
+                    for entry in listing.entries or []
+                ])
+            # one insert of all the names is many times faster than a
+            # trigger inserting them row by row
+            if self._has_names:
+                connection.execute(
+                    "INSERT INTO names (rowid, name) "
+                    "SELECT id, name FROM entries WHERE id > ?", (last_id,))
+
+    def find(self,
+             root: str,
+             name: str = "",
+             pattern: str = "",
+             extension: str = "",
+             min_size: int = 0,
+             max_size: int = 0,
+             kind: EntryKind = EntryKind.any,
+             include_hidden: bool = False,
+             limit: int = 100) -> FileSearch:
+        """Find the entries under the root matching all the given filters, a
+        name matches any part of the entry names ignoring the case while a
+        pattern is a glob matching the whole name"""
+        start = time.monotonic()
+        root = os.path.abspath(root)
+
+        refresh = None
+        if not self._is_fresh(root):
+            refresh = self.refresh(root)
+
+        conditions = ["(d.path = ? OR (d.path > ? AND d.path < ?))"]
+        parameters: List[object] = list(subtree(root))
+
+        connection = self._connect()
+        try:
+            if name and self._has_names and len(name) >= 3:
+                # a quoted trigram query matches the name anywhere
+                conditions.append(
+                    "e.id IN (SELECT rowid FROM names WHERE names MATCH ?)")
+                parameters.append('"' + name.replace('"', '""') + '"')
+            elif name:
+                conditions.append("e.name LIKE ? ESCAPE '\\'")
+                escaped = name.replace("\\", "\\\\").replace(
+                    "%", "\\%").replace("_", "\\_")
+                parameters.append(f"%{escaped}%")
+
+            if pattern and self._has_names:
+                conditions.append(
+                    "e.id IN (SELECT rowid FROM names WHERE name GLOB ?)")
+                parameters.append(pattern)
+            elif pattern:
+                conditions.append("e.name GLOB ?")
+                parameters.append(pattern)
+
+            if extension:
+                conditions.append("e.extension = ?")
+                parameters.append(extension.lstrip(".").lower())
+            if min_size > 0:
+                conditions.append("e.size >= ?")
+                parameters.append(min_size)
+            if max_size > 0:
+                conditions.append("e.size <= ?")
+                parameters.append(max_size)
+            if kind != EntryKind.any:
+                conditions.append("e.kind = ?")
+                parameters.append(_KINDS_.index(kind))
+            if not include_hidden:
+                # only the hidden directories under the root are skipped
+                conditions.append("substr(d.path, ?) NOT LIKE '%/.%'")
+                conditions.append("e.name NOT LIKE '.%'")
+                parameters.append(len(root.rstrip("/")) + 1)
+
+            rows = connection.execute(
+                "SELECT d.path, e.name, e.kind, e.size, e.mtime "
+                "FROM entries e JOIN directories d ON d.id = e.directory "
+                f"WHERE {' AND '.join(conditions)} LIMIT ?",
+                (*parameters, max(limit, 0) + 1)).fetchall()
+
+            indexed, = connection.execute(
+                "SELECT count(*) FROM entries").fetchone()
+        finally:
+            connection.close()
+
+        matches = [
+            FileMatch(os.path.join(path, name), _KINDS_[kind], size, mtime)
+            for path, name, kind, size, mtime in rows[:max(limit, 0)]
+        ]
+        return FileSearch(
+            matches,
+            len(rows) > max(limit, 0),
+            refresh,
+            indexed,
+            self.index_bytes(),
+            round(time.monotonic() - start, 3),
+        )
+
+    def index_bytes(self) -> int:
+        size = 0
+        for suffix in ("", "-wal"):
+            try:
+                size += os.path.getsize(f"{self._index_path}{suffix}")
+            except OSError:
+                continue
+        return size
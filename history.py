@@ -0,0 +1,193 @@
+import json
+from typing import (TYPE_CHECKING, Callable, Iterator, List, NamedTuple,
+                    Optional)
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessageParam
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.encoding_for_model("gpt-3.5-turbo")
+except Exception:
+    _ENCODING = None
+
+Summarizer = Callable[[List["ChatCompletionMessageParam"]], str]
+
+# tokens used by the chat format around every message
+_MESSAGE_OVERHEAD_ = 4
+
+
+def message_to_dict(message: "ChatCompletionMessageParam") -> dict:
+    if isinstance(message, dict):
+        return message
+    return message.model_dump(exclude_none=True)  # type: ignore
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text, uses tiktoken when it is installed
+    otherwise estimates about 4 characters per token"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+class MessageSize(NamedTuple):
+    tokens: int
+    bytes: int
+
+
+def measure_message(message: "ChatCompletionMessageParam") -> MessageSize:
+    obj = message_to_dict(message)
+    text = [str(obj.get("content") or "")]
+
+    for call in obj.get("tool_calls") or []:
+        function = call["function"]
+        text.append(function["name"])
+        text.append(function["arguments"])
+
+    return MessageSize(
+        count_tokens("".join(text)) + _MESSAGE_OVERHEAD_,
+        len(json.dumps(obj).encode()),
+    )
+
+
+class TurnStats(NamedTuple):
+    messages: int
+    tokens: int
+    bytes: int
+    evicted: int
+
+
+class History:
+    """Chat history limited by a token budget, the size of every message is
+    counted once when it is added, when the history is over the budget the
+    oldest turns are evicted or summarized.
+
+    The system prompt and the current turn, with its tool calls and their
+    responses, are always kept."""
+
+    _TOKEN_BUDGET_ = 8192
+
+    def __init__(self,
+                 instructions: str,
+                 token_budget: int = _TOKEN_BUDGET_,
+                 summarizer: Optional[Summarizer] = None):
+        self._token_budget = token_budget
+        self._summarizer = summarizer
+        self._messages: List[ChatCompletionMessageParam] = []
+        self._sizes: List[MessageSize] = []
+        self._roles: List[str] = []
+        self._tokens = 0
+        self._bytes = 0
+        self._evicted = 0
+        self._stats: List[TurnStats] = []
+        self.reset(instructions)
+
+    @property
+    def token_budget(self) -> int:
+        return self._token_budget
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    @property
+    def stats(self) -> List[TurnStats]:
+        """The size of the history sent on every request"""
+        return [*self._stats]
+
+    def reset(self, instructions: str):
+        self._messages = []
+        self._sizes = []
+        self._roles = []
+        self._tokens = 0
+        self._bytes = 0
+        self._evicted = 0
+        self._stats = []
+        self.append({"role": "system", "content": instructions})
+
+    def __iter__(self) -> "Iterator[ChatCompletionMessageParam]":
+        return iter(self._messages)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def append(self, message: "ChatCompletionMessageParam"):
+        self._insert(len(self._messages), message)
+        if self._roles[-1] == "user":
+            self._trim()
+
+    def messages(self) -> "List[ChatCompletionMessageParam]":
+        """Get the messages to send and record their size"""
+        self._trim()
+        self._stats.append(TurnStats(
+            len(self._messages), self._tokens, self._bytes, self._evicted))
+        return self._messages
+
+    def _insert(self, index: int, message: "ChatCompletionMessageParam"):
+        size = measure_message(message)
+        self._messages.insert(index, message)
+        self._sizes.insert(index, size)
+        self._roles.insert(index, str(message_to_dict(message).get("role")))
+        self._tokens += size.tokens
+        self._bytes += size.bytes
+
+    def _remove(self, start: int,
+                end: int) -> "List[ChatCompletionMessageParam]":
+        removed = self._messages[start:end]
+        for size in self._sizes[start:end]:
+            self._tokens -= size.tokens
+            self._bytes -= size.bytes
+        del self._messages[start:end]
+        del self._sizes[start:end]
+        del self._roles[start:end]
+        return removed
+
+    def _first_turn(self) -> int:
+        """Index of the first message after the system prompt and the
+        summary of the evicted turns"""
+        # the system prompt is the only other system message
+        if len(self._roles) > 1 and self._roles[1] == "system":
+            return 2
+        return 1
+
+    def _turn_starts(self) -> List[int]:
+        return [
+            index
+            for index in range(self._first_turn(), len(self._roles))
+            if self._roles[index] == "user"
+        ]
+
+    def _trim(self):
+        """Evict the oldest turns until the history fits in the budget"""
+        evicted: List[ChatCompletionMessageParam] = []
+
+        while self._tokens > self._token_budget:
+            starts = self._turn_starts()
+            # the last turn is the current one and it is never evicted
+            if len(starts) < 2:
+                break
+            evicted.extend(self._remove(self._first_turn(), starts[1]))
+
+        if len(evicted) == 0:
+            return
+
+        self._evicted += len(evicted)
+        if self._summarizer is None:
+            return
+
+        # the previous summary is summarized again with the evicted turns
+        if self._first_turn() == 2:
+            evicted.insert(0, self._remove(1, 2)[0])
+        self._insert(1, {
+            "role": "system",
+            "content": "Summary of the earlier conversation: "
+                       + self._summarizer(evicted),
+        })
@@ -0,0 +1,120 @@
+import os
+import heapq
+import fnmatch
+import itertools
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class SortBy(Enum):
+    none = "none"
+    name = "name"
+    size = "size"
+    modified = "modified"
+    type = "type"
+
+
+class FilesPage(NamedTuple):
+    entries: List[os.DirEntry]
+    # None when the listing stopped early and the total is unknown
+    total: Optional[int]
+    has_more: bool
+
+
+def entry_type(entry: os.DirEntry) -> str:
+    """Get the type of a directory entry from the data cached by scandir"""
+    try:
+        if entry.is_file():
+            return "file"
+        elif entry.is_dir():
+            return "directory"
+        elif entry.is_symlink():
+            return "link"
+    except OSError:
+        pass
+    return "unknown"
+
+
+def entry_stat(entry: os.DirEntry) -> Optional[os.stat_result]:
+    try:
+        return entry.stat()
+    except OSError:
+        try:
+            return entry.stat(follow_symlinks=False)
+        except OSError:
+            return None
+
+
+def iter_entries(path: str, pattern: str = "*") -> Iterator[os.DirEntry]:
+    """Yield the entries of a directory as they are read, only the entries
+    matching the glob pattern"""
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if pattern == "*" or fnmatch.fnmatch(entry.name, pattern):
+                yield entry
+
+
+def _sort_key(sort: SortBy) -> Tuple[Callable[[os.DirEntry], object], bool]:
+    """Get the sort key and whether the largest values come first"""
+    def size(entry: os.DirEntry) -> int:
+        stat = entry_stat(entry)
+        return stat.st_size if stat is not None else -1
+
+    def modified(entry: os.DirEntry) -> float:
+        stat = entry_stat(entry)
+        return stat.st_mtime if stat is not None else 0
+
+    if sort == SortBy.size:
+        return size, True
+    elif sort == SortBy.modified:
+        return modified, True
+    elif sort == SortBy.type:
+        return lambda entry: (entry_type(entry), entry.name), False
+    return lambda entry: entry.name, False
+
+
+def list_entries(path: str,
+                 offset: int = 0,
+                 limit: int = 100,
+                 sort: SortBy = SortBy.name,
+                 pattern: str = "*") -> FilesPage:
+    """List a page of a directory without keeping all of its entries in
+    memory, unsorted listings stop reading the directory after the page"""
+    offset = max(offset, 0)
+    limit = max(limit, 1)
+    counter = itertools.count()
+    counted = (entry for entry, _ in zip(iter_entries(path, pattern), counter))
+
+    if sort == SortBy.none:
+        page = list(itertools.islice(counted, offset, offset + limit + 1))
+        has_more = len(page) > limit
+        total = None if has_more else next(counter)
+        return FilesPage(page[:limit], total, has_more)
+
+    key, largest_first = _sort_key(sort)
+    select = heapq.nlargest if largest_first else heapq.nsmallest
+
+    # only the entries up to the end of the page are kept while reading
+    page = select(offset + limit, counted, key=key)[offset:]
+    total = next(counter)
+    return FilesPage(page, total, offset + len(page) < total)
+
+
+def count_children(path: str, cap: int) -> Optional[int]:
+    """Count the entries of a directory, stops counting at the cap"""
+    try:
+        with os.scandir(path) as entries:
+            return sum(1 for _ in itertools.islice(entries, cap))
+    except OSError:
+        return None
+
+
+def count_children_parallel(paths: List[str],
+                            cap: int = 1000,
+                            max_workers: int = 8) -> Dict[str, Optional[int]]:
+    if len(paths) == 0:
+        return {}
+    with ThreadPoolExecutor(min(max_workers, len(paths))) as executor:
+        counts = executor.map(lambda path: count_children(path, cap), paths)
+        return dict(zip(paths, counts))
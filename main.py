@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 
 import os
+import argparse
+import threading
+from typing import Union
 
 from assistant import Assistant
+from client import AsyncModelClient, CircuitOpenError, ModelClient
+from metrics import MetricsDumper, MetricsServer
+from profiling import Profiler
+from sessions import SessionStore
 
-assistant = Assistant(
-    """You are an assistant running on a linux machine, your main role is to
+INSTRUCTIONS = """You are an assistant running on a linux machine, your main role is to
     help the user complete tasks. The user will provide you with questions
     related to his/her work on a linux machine. Your job is to help the user by
     providing the direct answer to the questions or helpful tips or urls to
@@ -38,6 +44,9 @@ assistant = Assistant(
     - The username
     - The available package manager
 
+    Save every collected fact with remember_machine_fact, the known facts are
+    listed at the end of these instructions, never collect them again.
+
     Try to use the command `doas` whenever it is possible.
     Before running any command make sure first it is installed on the system.
     If the command is not installed on the system ask the user to install it.
@@ -57,33 +66,121 @@ assistant = Assistant(
     Usually represent size values in suitable units to represent the value
     with less digits to be easy to read.
 """
-)
 
 
-@assistant.use()
+@Assistant.ability()
 def get_current_working_directory():
-    """Get current working directory"""
+    """Get the working directory of the shell running the commands"""
     try:
-        return os.getcwd()
+        assistant = Assistant.current()
+        return assistant.shell.cwd if assistant else os.getcwd()
     except Exception:
         return "Error: Failed to get current working directory"
 
 
-assistant.import_abilities_module("abilities")
+def add_abilities(assistant: Assistant):
+    assistant.add_ability(get_current_working_directory)
+    # abilities are registered from their manifest, the abilities module and
+    # its dependencies are imported on the first use of any of them
+    assistant.import_abilities_manifest("abilities")
 
-if __name__ == "__main__":
+
+def warm_up(client: Union[ModelClient, AsyncModelClient]):
+    """Load the model client and start sampling the system usage while the
+    user is typing the first prompt"""
+    from sampler import system_sampler
+    system_sampler.start()
+
+    try:
+        client.client
+    except Exception:
+        # like a missing api key, raised again on the first request
+        pass
+
+
+def repl(assistant: Assistant):
     while True:
         try:
             user_input = input("User: ")
         except EOFError:
             print("\nSystem: Goodbye!")
-            exit(0)
+            return
         except KeyboardInterrupt:
             print("\nSystem: Goodbye!")
-            exit(0)
+            return
 
         try:
             # turn off speech for low API usage
-            assistant(user_input, with_speech=False)
+            assistant(user_input, with_speech=False, stream=True)
         except KeyboardInterrupt:
             print("\nSystem: Canceled!")
+        except CircuitOpenError as e:
+            print(f"System: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Linux Bot")
+    parser.add_argument("--resume", nargs="?", const=-1, type=int,
+                        metavar="SESSION",
+                        help="continue the latest session or a given one")
+    parser.add_argument("--fake", metavar="SCRIPT",
+                        help="replay the model responses of a JSON script "
+                             "instead of calling the model API")
+    parser.add_argument("--profile-cpu", metavar="FILE",
+                        help="profile the session with cProfile and save "
+                             "the stats to a file")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="trace the allocations with tracemalloc and "
+                             "print the top ones at exit")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on "
+                             "http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-json", metavar="FILE",
+                        help="dump the metrics as JSON to a file")
+    parser.add_argument("--metrics-interval", type=float,
+                        default=MetricsDumper._INTERVAL_, metavar="SECONDS",
+                        help="seconds between the JSON dumps")
+    parser.add_argument("--tools-limit", type=int, metavar="COUNT",
+                        help="send only the abilities most relevant to the "
+                             "input with the pinned ones, all by default")
+    args = parser.parse_args()
+
+    assistant = Assistant(INSTRUCTIONS, store=SessionStore(),
+                          tools_limit=args.tools_limit)
+    add_abilities(assistant)
+
+    if args.fake is not None:
+        from fake_client import FakeModelClient
+        assistant.client = FakeModelClient.from_file(args.fake)
+
+    profiler = Profiler(args.profile_cpu, args.trace_memory)
+    profiler.start()
+
+    exporters = []
+    if args.metrics_port is not None:
+        exporters.append(MetricsServer(assistant.metrics, args.metrics_port))
+    if args.metrics_json is not None:
+        exporters.append(MetricsDumper(assistant.metrics, args.metrics_json,
+                                       args.metrics_interval))
+    for exporter in exporters:
+        exporter.start()
+
+    threading.Thread(target=warm_up, args=(assistant.client,),
+                     daemon=True).start()
+
+    if args.resume is not None:
+        loaded = assistant.resume(None if args.resume < 0 else args.resume)
+        if assistant.session is None:
+            print("System: No session to resume, starting a new one")
+        else:
+            print(f"System: Resumed session {assistant.session} "
+                  f"with {loaded} messages")
+
+    try:
+        repl(assistant)
+    finally:
+        assistant.close()
+        for exporter in exporters:
+            exporter.stop()
+        if profiler.is_enabled:
+            print(profiler.stop())
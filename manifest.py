@@ -0,0 +1,138 @@
+import ast
+import json
+import hashlib
+import importlib
+import importlib.util
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from assistant import AssistantAbility
+
+
+class LazyFunction:
+    """Import a function from its module on the first call"""
+
+    def __init__(self, reference: str):
+        self._reference = reference
+        self._function = None
+
+    def __call__(self, *args, **kwargs):
+        if self._function is None:
+            module, name = self._reference.split(":")
+            self._function = getattr(importlib.import_module(module), name)
+        return self._function(*args, **kwargs)
+
+
+class LazyAbility(AssistantAbility):
+    """Ability registered from a manifest, its module and the heavy
+    dependencies of the module are imported on its first call"""
+
+    def __init__(self, manifest: Dict):
+        invalidates_cache = manifest["invalidates_cache"]
+        if isinstance(invalidates_cache, str):
+            invalidates_cache = LazyFunction(invalidates_cache)
+
+        super().__init__(
+            manifest["name"],
+            manifest["description"],
+            LazyFunction(manifest["function"]),
+            manifest["timeout"],
+            manifest["cache_ttl"],
+            invalidates_cache,
+        )
+        self._coroutine = bool(manifest["coroutine"])
+
+        for arg in manifest["arguments"]:
+            self.add_argument(arg["name"], arg["type"], arg["description"],
+                              arg["is_required"], arg["enum"])
+
+    @property
+    def is_coroutine(self) -> bool:
+        return self._coroutine
+
+
+def get_module_path(module: str) -> Path:
+    """Find the source of a module without importing it"""
+    spec = importlib.util.find_spec(module)
+    if spec is None or spec.origin is None:
+        raise ImportError(f"No module named {module}")
+    return Path(spec.origin)
+
+
+def get_manifest_path(module: str) -> Path:
+    return get_module_path(module).with_suffix(".manifest.json")
+
+
+def module_sources(module: str) -> List[str]:
+    """Find the modules of the project a module imports and the ones they
+    import, the sources are read without importing them"""
+    root = get_module_path(module).parent
+    found = [module]
+    pending = [module]
+    while len(pending) > 0:
+        tree = ast.parse(get_module_path(pending.pop()).read_bytes())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and \
+                    node.module is not None:
+                names = [node.module]
+            else:
+                continue
+
+            for name in names:
+                # the top level name never imports a package to find it
+                name = name.split(".")[0]
+                if name in found:
+                    continue
+                try:
+                    path = get_module_path(name)
+                except (ImportError, ValueError):
+                    continue
+                if path.parent == root:
+                    found.append(name)
+                    pending.append(name)
+    return found
+
+
+def sources_hash(modules: List[str]) -> str:
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(module.encode() + b"\0")
+        digest.update(get_module_path(module).read_bytes())
+    return digest.hexdigest()
+
+
+def generate_manifest(module: str,
+                      abilities: List[AssistantAbility]) -> Dict[str, object]:
+    # the abilities are generated from their module and from the ones it
+    # imports, like the enums of their arguments
+    sources = module_sources(module)
+    return {
+        "module": module,
+        "sources": sources,
+        "hash": sources_hash(sources),
+        "abilities": [ability.generate_manifest() for ability in abilities],
+    }
+
+
+def write_manifest(path: Union[str, Path], manifest: Dict[str, object]):
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
+def load_manifest(path: Union[str, Path]) -> Optional[List[AssistantAbility]]:
+    """Load the abilities of a manifest, returns None if the manifest does
+    not exist or its module or one of the modules it imports was changed
+    after it was generated"""
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        current = sources_hash(manifest.get("sources", [manifest["module"]]))
+    except (OSError, ValueError, KeyError, ImportError):
+        return None
+
+    if manifest.get("hash") != current:
+        return None
+    return [LazyAbility(ability) for ability in manifest["abilities"]]
@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import bisect
+import tempfile
+import threading
+from collections import defaultdict
+from typing import (Any, Callable, DefaultDict, Dict, List, NamedTuple,
+                    Optional, Sequence, Tuple)
+
+# seconds, from a cached result to the longest ability timeout
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0, 60.0, 120.0)
+# bytes, from a short answer to the largest compacted outputs
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# the outcomes of an ability call
+OK = "ok"
+ERROR = "error"
+CACHED = "cached"
+TIMEOUT = "timeout"
+INTERRUPTED = "interrupted"
+INVALID = "invalid"
+
+_PREFIX_ = "linux_bot"
+
+
+class Histogram:
+    """Fixed buckets histogram, an observation is a binary search and an
+    increment so it is cheap enough for every call"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # the last count is for the values over the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """The count of the values less or equal to every bucket"""
+        total = 0
+        result = []
+        for bucket, count in zip((*self.buckets, float("inf")), self.counts):
+            total += count
+            result.append((bucket, total))
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {
+                str(bucket): count for bucket, count in self.cumulative()
+            },
+        }
+
+
+class AbilityMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.output_bytes = Histogram(BYTES_BUCKETS)
+        self.outcomes: DefaultDict[str, int] = defaultdict(int)
+
+    @property
+    def calls(self) -> int:
+        return sum(self.outcomes.values())
+
+    @property
+    def error_rate(self) -> float:
+        """The part of the calls that did not return a result"""
+        calls = self.calls
+        if calls == 0:
+            return 0.0
+        results = self.outcomes.get(OK, 0) + self.outcomes.get(CACHED, 0)
+        return (calls - results) / calls
+
+
+class ModelMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+class Metrics:
+    """Metrics of the abilities and the model calls of an assistant, kept in
+    memory and exported as Prometheus text or JSON
+
+    Other stats like the client or the cache ones are collected as gauges
+    when the metrics are exported, so they cost nothing on the hot path"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._abilities: DefaultDict[str, AbilityMetrics] = \
+            defaultdict(AbilityMetrics)
+        self._model = ModelMetrics()
+        self._collectors: Dict[str, Callable[[], NamedTuple]] = {}
+
+    def add_collector(self, name: str, collect: Callable[[], NamedTuple]):
+        """Export the fields of the tuple returned by collect as gauges named
+        after the collector name"""
+        self._collectors[name] = collect
+
+    def observe_ability(self, name: str, seconds: float,
+                        output_bytes: Optional[int] = None):
+        """Record the time of a run and the size of its result, a run that
+        outlived its timeout is still recorded when it ends"""
+        with self._lock:
+            ability = self._abilities[name]
+            ability.latency.observe(seconds)
+            if output_bytes is not None:
+                ability.output_bytes.observe(output_bytes)
+
+    def count_ability(self, name: str, outcome: str):
+        """Count a call by the result sent to the model, once per call"""
+        with self._lock:
+            self._abilities[name].outcomes[outcome] += 1
+
+    def observe_model(self, seconds: float,
+                      prompt_tokens: int = 0,
+                      completion_tokens: int = 0,
+                      failed: bool = False):
+        with self._lock:
+            model = self._model
+            model.calls += 1
+            if failed:
+                model.errors += 1
+                return
+            model.latency.observe(seconds)
+            model.prompt_tokens += prompt_tokens
+            model.completion_tokens += completion_tokens
+
+    def count_tokens(self, prompt_tokens: int, completion_tokens: int):
+        """Add the tokens of a streamed response once it is complete"""
+        with self._lock:
+            self._model.prompt_tokens += prompt_tokens
+            self._model.completion_tokens += completion_tokens
+
+    def ability(self, name: str) -> Optional[AbilityMetrics]:
+        return self._abilities.get(name)
+
+    @property
+    def model(self) -> ModelMetrics:
+        return self._model
+
+    def _collect(self) -> Dict[str, Dict[str, float]]:
+        gauges = {}
+        for name, collect in self._collectors.items():
+            try:
+                stats = collect()
+            except Exception:
+                # a failing collector must not break the export
+                continue
+            gauges[name] = {
+                field: float(value) for field, value in stats._asdict().items()
+            }
+        return gauges
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            abilities = {
+                name: {
+                    "calls": ability.calls,
+                    "error_rate": ability.error_rate,
+                    "outcomes": dict(ability.outcomes),
+                    "latency_seconds": ability.latency.to_dict(),
+                    "output_bytes": ability.output_bytes.to_dict(),
+                }
+                for name, ability in self._abilities.items()
+            }
+            model = self._model
+            model_dict = {
+                "calls": model.calls,
+                "errors": model.errors,
+                "prompt_tokens": model.prompt_tokens,
+                "completion_tokens": model.completion_tokens,
+                "latency_seconds": model.latency.to_dict(),
+            }
+
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self._started,
+            "abilities": abilities,
+            "model": model_dict,
+            **self._collect(),
+        }
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+
+        def header(name: str, type: str, help: str):
+            lines.append(f"# HELP {_PREFIX_}_{name} {help}")
+            lines.append(f"# TYPE {_PREFIX_}_{name} {type}")
+
+        def histogram(name: str, labels: str, histogram: Histogram):
+            for bucket, count in histogram.cumulative():
+                le = "+Inf" if bucket == float("inf") else repr(bucket)
+                separator = "," if labels else ""
+                lines.append(f'{_PREFIX_}_{name}_bucket'
+                             f'{{{labels}{separator}le="{le}"}} {count}')
+            braces = f"{{{labels}}}" if labels else ""
+            lines.append(f"{_PREFIX_}_{name}_sum{braces} {histogram.sum}")
+            lines.append(f"{_PREFIX_}_{name}_count{braces} {histogram.count}")
+
+        with self._lock:
+            abilities = sorted(self._abilities.items())
+
+            header("ability_calls_total", "counter",
+                   "Ability calls by outcome")
+            for name, ability in abilities:
+                for outcome, count in sorted(ability.outcomes.items()):
+                    lines.append(
+                        f'{_PREFIX_}_ability_calls_total'
+                        f'{{ability="{name}",outcome="{outcome}"}} {count}')
+
+            header("ability_latency_seconds", "histogram",
+                   "Time to run an ability")
+            for name, ability in abilities:
+                histogram("ability_latency_seconds",
+                          f'ability="{name}"', ability.latency)
+
+            header("ability_output_bytes", "histogram",
+                   "Size of the ability results")
+            for name, ability in abilities:
+                histogram("ability_output_bytes",
+                          f'ability="{name}"', ability.output_bytes)
+
+            model = self._model
+            header("model_calls_total", "counter", "Model API calls")
+            lines.append(f"{_PREFIX_}_model_calls_total {model.calls}")
+            header("model_errors_total", "counter", "Failed model API calls")
+            lines.append(f"{_PREFIX_}_model_errors_total {model.errors}")
+            header("model_tokens_total", "counter", "Tokens used by kind")
+            lines.append(f'{_PREFIX_}_model_tokens_total{{kind="prompt"}} '
+                         f'{model.prompt_tokens}')
+            lines.append(f'{_PREFIX_}_model_tokens_total{{kind="completion"}} '
+                         f'{model.completion_tokens}')
+            header("model_latency_seconds", "histogram",
+                   "Time to the model response or to the stream start")
+            histogram("model_latency_seconds", "", model.latency)
+
+        for name, fields in self._collect().items():
+            for field, value in fields.items():
+                header(f"{name}_{field}", "gauge", f"{name} {field}")
+                lines.append(f"{_PREFIX_}_{name}_{field} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serve the metrics in the Prometheus text format on /metrics from a
+    background thread"""
+
+    _HOST_ = "127.0.0.1"
+
+    def __init__(self, metrics: Metrics, port: int, host: str = _HOST_):
+        self._metrics = metrics
+        self._address = (host, port)
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        if self._server is None:
+            return self._address[1]
+        return self._server.server_address[1]
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self._metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # keep the scrapes out of the chat
+                pass
+
+        self._server = ThreadingHTTPServer(self._address, Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server",
+            daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class MetricsDumper:
+    """Write the metrics as JSON to a file every interval and once more when
+    stopped, the file is replaced at once so readers never see half of it"""
+
+    _INTERVAL_ = 60.0
+
+    def __init__(self, metrics: Metrics, path: str,
+                 interval: float = _INTERVAL_):
+        if interval <= 0:
+            raise ValueError("Dump interval must be positive")
+        self._metrics = metrics
+        self._path = path
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-dumper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.dump()
+
+    def dump(self):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        with tempfile.NamedTemporaryFile(
+                "w", dir=directory, prefix=".", delete=False) as file:
+            json.dump(self._metrics.to_dict(), file)
+        os.replace(file.name, self._path)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.dump()
+            except OSError:
+                # like a full disk, the next dump may succeed
+                continue
@@ -0,0 +1,96 @@
+import time
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+import psutil
+
+# the partition columns, the usage ones are None when it could not be read
+PARTITION_FIELDS = ("device", "mountpoint", "fstype", "options", "total",
+                    "used", "free", "percent")
+
+
+class PartitionInfo(NamedTuple):
+    device: str
+    mountpoint: str
+    fstype: str
+    options: str
+    total: Optional[int]
+    used: Optional[int]
+    free: Optional[int]
+    percent: Optional[float]
+
+
+class PartitionUsageReader:
+    """Read the usage of the mounted partitions in parallel, every mount has
+    a daemon thread so a stale network mount hanging in statvfs only costs
+    the timeout and never the whole call
+
+    A mount still hanging from a previous call is not read again until its
+    thread returns, so the hung threads never pile up"""
+
+    _TIMEOUT_ = 2.0
+
+    def __init__(self, timeout: float = _TIMEOUT_):
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        # the mounts whose last read did not return yet
+        self._hanging: Dict[str, threading.Thread] = {}
+
+    def _start(self, mountpoint: str, results: Dict[str, object]
+               ) -> Optional[threading.Thread]:
+        with self._lock:
+            thread = self._hanging.get(mountpoint)
+            if thread is not None:
+                if thread.is_alive():
+                    return None
+                del self._hanging[mountpoint]
+
+            def read():
+                try:
+                    results[mountpoint] = psutil.disk_usage(mountpoint)
+                except OSError as e:
+                    results[mountpoint] = e
+
+            thread = threading.Thread(
+                target=read, name=f"disk-usage {mountpoint}", daemon=True)
+            thread.start()
+            return thread
+
+    def read(self, partitions: List) -> List[PartitionInfo]:
+        """Get the usage of psutil partitions, the partitions that did not
+        answer before the timeout are returned without their usage"""
+        deadline = time.monotonic() + self._timeout
+        results: Dict[str, object] = {}
+        threads = {
+            partition.mountpoint: self._start(partition.mountpoint, results)
+            for partition in partitions
+        }
+
+        for mountpoint, thread in threads.items():
+            if thread is None:
+                continue
+            thread.join(max(deadline - time.monotonic(), 0))
+            if thread.is_alive():
+                with self._lock:
+                    self._hanging[mountpoint] = thread
+
+        infos = []
+        for partition in partitions:
+            usage = results.get(partition.mountpoint)
+            if isinstance(usage, BaseException):
+                usage = None
+            infos.append(PartitionInfo(
+                partition.device, partition.mountpoint, partition.fstype,
+                partition.opts,
+                usage.total if usage is not None else None,
+                usage.used if usage is not None else None,
+                usage.free if usage is not None else None,
+                usage.percent if usage is not None else None))
+        return infos
+
+    @property
+    def hanging(self) -> List[str]:
+        """The mounts that did not answer in time, the stale ones"""
+        with self._lock:
+            return [mountpoint for mountpoint, thread in self._hanging.items()
+                    if thread.is_alive()]
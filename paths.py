@@ -0,0 +1,9 @@
+import os
+from pathlib import Path
+
+
+def cache_path(name: str) -> Path:
+    """Path of a cache file or directory of the bot, it can be removed at
+    any time and is built again"""
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(cache) / "linux-bot" / name
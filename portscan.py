@@ -0,0 +1,218 @@
+import time
+import socket
+import asyncio
+import resource
+import ipaddress
+from enum import Enum
+from typing import (AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, Tuple)
+
+# the ports scanned when no ports are given
+COMMON_PORTS = (21, 22, 23, 25, 53, 80, 110, 111, 135, 139, 143, 443, 445,
+                465, 587, 631, 993, 995, 1433, 1521, 1883, 2049, 2375, 3000,
+                3306, 3389, 5000, 5432, 5900, 6379, 8000, 8080, 8443, 9000,
+                9090, 9200, 11211, 27017)
+
+# the largest scan of a single call, a /16 network on a few ports
+MAX_PROBES = 1 << 20
+MAX_HOSTS = 1 << 16
+
+
+class PortState(Enum):
+    open = "open"
+    # the host answered that nothing listens on the port, so it is up
+    closed = "closed"
+    # no answer before the timeout, the host is down or drops the packets
+    filtered = "filtered"
+
+
+class PortResult(NamedTuple):
+    host: str
+    port: int
+    state: PortState
+    # seconds to the answer
+    latency: float
+
+
+def parse_ports(text: str) -> List[int]:
+    """Parse a list of ports and ranges like: 22,80,8000-8100, common is the
+    list of the common services ports"""
+    ports = set()
+    for part in text.replace(" ", "").split(","):
+        if part == "":
+            continue
+        if part == "common":
+            ports.update(COMMON_PORTS)
+            continue
+
+        start, _, end = part.partition("-")
+        try:
+            first, last = int(start), int(end or start)
+        except ValueError:
+            raise ValueError(f"Invalid port or range: {part}") from None
+        if not 0 < first <= last <= 65535:
+            raise ValueError(f"Invalid port or range: {part}")
+        ports.update(range(first, last + 1))
+
+    if len(ports) == 0:
+        raise ValueError("No ports to scan")
+    return sorted(ports)
+
+
+def parse_hosts(text: str) -> List[str]:
+    """Parse a list of addresses, networks and host names like:
+    192.168.1.0/24,10.0.0.5,printer.local, the network and broadcast
+    addresses of a network are skipped"""
+    hosts: List[str] = []
+    for part in text.replace(" ", "").split(","):
+        if part == "":
+            continue
+
+        if "/" in part:
+            try:
+                network = ipaddress.ip_network(part, strict=False)
+            except ValueError as e:
+                raise ValueError(f"Invalid network {part}: {e}") from None
+            if network.num_addresses > MAX_HOSTS:
+                raise ValueError(
+                    f"Network {part} is too large, the limit is {MAX_HOSTS} "
+                    "addresses")
+            # hosts() of a single address network is empty
+            addresses = list(network.hosts()) or [network.network_address]
+            hosts.extend(str(address) for address in addresses)
+        else:
+            hosts.append(part)
+
+        if len(hosts) > MAX_HOSTS:
+            raise ValueError(f"Too many hosts, the limit is {MAX_HOSTS}")
+
+    if len(hosts) == 0:
+        raise ValueError("No hosts to scan")
+    return list(dict.fromkeys(hosts))
+
+
+def max_concurrency() -> int:
+    """Every probe holds a socket, leave some descriptors to the process"""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return 1 << 16
+    return max(soft - 128, 16)
+
+
+async def _resolve(host: str) -> Tuple[int, str]:
+    try:
+        address = ipaddress.ip_address(host.split("%")[0])
+        family = socket.AF_INET6 if address.version == 6 else socket.AF_INET
+        return family, host
+    except ValueError:
+        pass
+
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    family, _, _, _, address = infos[0]
+    return family, address[0]
+
+
+def is_local_address(address: str) -> bool:
+    """Check if an address is the machine or on a local network, loopback,
+    private or link local"""
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_loopback or ip.is_private or ip.is_link_local
+
+
+async def resolve_hosts(hosts: List[str]) -> Dict[str, Optional[str]]:
+    """Resolve the host names at once, the addresses are kept as they are
+    and the names that can not be resolved are None"""
+    async def resolve(host: str) -> Optional[str]:
+        try:
+            return (await _resolve(host))[1]
+        except OSError:
+            return None
+
+    addresses: Dict[str, Optional[str]] = {}
+    names = []
+    for host in hosts:
+        try:
+            ipaddress.ip_address(host.split("%")[0])
+            addresses[host] = host
+        except ValueError:
+            names.append(host)
+
+    resolved = await asyncio.gather(*(resolve(name) for name in names))
+    addresses.update(zip(names, resolved))
+    return addresses
+
+
+async def probe(family: int, address: str, port: int,
+                timeout: float) -> Tuple[PortState, float]:
+    """Try a non blocking tcp connect, the socket is closed at once"""
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(
+                loop.sock_connect(sock, (address, port)), timeout)
+            state = PortState.open
+        except asyncio.TimeoutError:
+            state = PortState.filtered
+        except ConnectionRefusedError:
+            state = PortState.closed
+        except OSError:
+            # like a host or network unreachable
+            state = PortState.filtered
+    return state, time.monotonic() - start
+
+
+async def scan(hosts: Iterable[str],
+               ports: List[int],
+               concurrency: int = 256,
+               timeout: float = 1.0) -> AsyncIterator[PortResult]:
+    """Probe every port of every host and yield the results as they come, at
+    most concurrency probes run at once and every probe waits up to the
+    timeout. A host name that can not be resolved is skipped"""
+    concurrency = max(1, min(concurrency, max_concurrency()))
+    # None marks the end of the scan
+    results: "asyncio.Queue[Optional[PortResult]]" = \
+        asyncio.Queue(concurrency * 4)
+    targets: Iterator[Tuple[str, int]] = iter(
+        (host, port) for host in hosts for port in ports)
+    resolved: Dict[str, "asyncio.Future[Tuple[int, str]]"] = {}
+
+    async def worker():
+        # the workers share the same iterator, so there are never more
+        # pending probes than workers
+        for host, port in targets:
+            if host not in resolved:
+                resolved[host] = asyncio.ensure_future(_resolve(host))
+            try:
+                family, address = await resolved[host]
+            except OSError:
+                continue
+
+            state, latency = await probe(family, address, port, timeout)
+            await results.put(PortResult(host, port, state, latency))
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+
+    async def wait_workers():
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            await results.put(None)
+
+    waiter = asyncio.create_task(wait_workers())
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            yield result
+        # raise the error of a failed worker if any
+        await waiter
+    finally:
+        for task in (*workers, waiter):
+            task.cancel()
+        await asyncio.gather(*workers, waiter, return_exceptions=True)
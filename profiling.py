@@ -0,0 +1,55 @@
+import io
+import pstats
+import cProfile
+import tracemalloc
+from typing import Optional
+
+
+class Profiler:
+    """Optional cpu and memory profiling of a whole session, the reports are
+    printed when the session ends"""
+
+    _TOP_ = 20
+
+    def __init__(self,
+                 cpu_output: Optional[str] = None,
+                 trace_memory: bool = False,
+                 top: int = _TOP_):
+        self._cpu_output = cpu_output
+        self._trace_memory = trace_memory
+        self._top = top
+        self._profile: Optional[cProfile.Profile] = None
+
+    @property
+    def is_enabled(self) -> bool:
+        return self._cpu_output is not None or self._trace_memory
+
+    def start(self):
+        if self._trace_memory:
+            tracemalloc.start(16)
+        if self._cpu_output is not None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self) -> str:
+        """Stop profiling and get the report"""
+        report = io.StringIO()
+
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self._cpu_output)
+            stats = pstats.Stats(self._profile, stream=report)
+            stats.sort_stats("cumulative").print_stats(self._top)
+            report.write(f"cpu profile saved to {self._cpu_output}\n")
+            self._profile = None
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report.write(f"memory current: {current / 1024:.1f} KiB, "
+                         f"peak: {peak / 1024:.1f} KiB\n")
+            for stat in snapshot.statistics("lineno")[:self._top]:
+                report.write(f"{stat}\n")
+
+        return report.getvalue()
@@ -0,0 +1,288 @@
+import os
+import re
+import mmap
+import bisect
+import codecs
+import threading
+from array import array
+from collections import OrderedDict
+from typing import (BinaryIO, Iterator, List, NamedTuple, Optional, Tuple,
+                    Union)
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# encodings where a new line is the byte \n, lines can be found without
+# decoding the file
+_LINE_ENCODINGS = ("utf-8", "utf-8-sig", "latin-1")
+_SAMPLE_SIZE = 8192
+# a mapped file or a file read into memory
+_Data = Union[mmap.mmap, bytes]
+
+
+def detect_encoding(sample: bytes) -> Optional[str]:
+    """Guess the encoding of a file from its first bytes, returns None for
+    binary content"""
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    if b"\0" in sample:
+        return None
+
+    try:
+        # the sample may end in the middle of a character
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    controls = sum(1 for byte in sample
+                   if byte < 32 and byte not in b"\t\n\r\f\b\x1b")
+    if controls > len(sample) // 10:
+        return None
+    return "latin-1"
+
+
+class LineIndex:
+    """Sparse index of the line numbers of a file, the number of lines before
+    every block is stored so finding a line only reads a single block
+
+    The index is built as far as it is needed, a line at the beginning of a
+    huge file never reads the rest of the file"""
+
+    _BLOCK_SIZE_ = 64 * 1024
+
+    def __init__(self, block_size: int = _BLOCK_SIZE_):
+        self._block_size = block_size
+        # lines before the start of every indexed block
+        self._lines = array("Q", [0])
+        self._lock = threading.Lock()
+
+    def _extend(self, data: _Data, block: int):
+        with self._lock:
+            while len(self._lines) <= block:
+                start = (len(self._lines) - 1) * self._block_size
+                if start >= len(data):
+                    break
+                count = data[start:start + self._block_size].count(b"\n")
+                self._lines.append(self._lines[-1] + count)
+
+    def line_of(self, data: _Data, position: int) -> int:
+        """Get the line number of a byte position, starting from 1"""
+        block = position // self._block_size
+        self._extend(data, block)
+        start = block * self._block_size
+        return self._lines[block] + data[start:position].count(b"\n") + 1
+
+    def offset_of(self, data: _Data, line: int) -> Optional[int]:
+        """Get the byte position where a line starts, None when the file has
+        less lines"""
+        if line <= 1:
+            return 0
+
+        # index blocks until the line is found or the file ends
+        while self._lines[-1] < line - 1 and \
+                (len(self._lines) - 1) * self._block_size < len(data):
+            self._extend(data, len(self._lines))
+
+        block = bisect.bisect_left(self._lines, line - 1) - 1
+        position = block * self._block_size
+        for _ in range(line - 1 - self._lines[block]):
+            position = data.find(b"\n", position)
+            if position < 0:
+                return None
+            position += 1
+        return position if position < len(data) else None
+
+
+class _IndexCache:
+    """Keep the line indexes of the recently read files, an index is dropped
+    when its file is changed"""
+
+    _MAX_ENTRIES_ = 16
+
+    def __init__(self, max_entries: int = _MAX_ENTRIES_):
+        self._max_entries = max_entries
+        self._indexes: "OrderedDict[Tuple[int, ...], LineIndex]" = \
+            OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, stat: os.stat_result) -> LineIndex:
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = LineIndex()
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self._max_entries:
+                self._indexes.popitem(last=False)
+            return index
+
+
+line_indexes = _IndexCache()
+
+
+def _read_bounded(file: BinaryIO, limit: int) -> bytes:
+    """Read a file chunk by chunk until it ends or the limit is reached"""
+    chunks: List[bytes] = []
+    remaining = limit
+    while remaining > 0:
+        chunk = file.read(min(remaining, 64 * 1024))
+        if len(chunk) == 0:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+class MappedFile:
+    """A file mapped to memory, only the pages that are read are loaded
+
+    Files that can not be mapped like the ones of /proc and /sys that report
+    a size of 0 are read into memory up to a limit instead"""
+
+    _STREAM_LIMIT_ = 16 * 1024 * 1024
+
+    def __init__(self, path: str, stream_limit: int = _STREAM_LIMIT_):
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self.data: _Data = b""
+            try:
+                if stat.st_size > 0:
+                    self.data = mmap.mmap(
+                        file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                pass
+            # the content of these files changes without their stat
+            streamed = not isinstance(self.data, mmap.mmap)
+            if streamed:
+                self.data = _read_bounded(file, stream_limit)
+        self.size = len(self.data)
+        self.index = LineIndex() if streamed else line_indexes.get(stat)
+        self.encoding = detect_encoding(self.sample)
+
+    @property
+    def sample(self) -> bytes:
+        return self.data[:_SAMPLE_SIZE]
+
+    @property
+    def is_binary(self) -> bool:
+        return self.encoding is None
+
+    def __enter__(self) -> "MappedFile":
+        return self
+
+    def __exit__(self, *_):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def decode(self, content: bytes) -> str:
+        return content.decode(self.encoding or "latin-1", errors="replace")
+
+
+class Match(NamedTuple):
+    line: int
+    offset: int
+    text: str
+
+
+def _align(data: _Data, position: int) -> int:
+    """Move a position back to the start of an utf-8 character"""
+    while position > 0 and position < len(data) and \
+            data[position] & 0xC0 == 0x80:
+        position -= 1
+    return position
+
+
+def read_bytes(file: MappedFile, offset: int, length: int) -> Tuple[str, int]:
+    """Read a range of bytes, returns the text and the end of the range"""
+    if file.size == 0 or offset >= file.size:
+        return "", file.size
+
+    start = max(offset, 0)
+    end = min(start + length, file.size)
+    if file.encoding in ("utf-8", "utf-8-sig"):
+        start = _align(file.data, start)
+        # a range shorter than a character is read as it is
+        end = max(_align(file.data, end), start + 1)
+    return file.decode(file.data[start:end]), end
+
+
+def hex_dump(file: MappedFile, offset: int, length: int) -> Tuple[str, int]:
+    if file.size == 0 or offset >= file.size:
+        return "", file.size
+
+    start = max(offset, 0)
+    end = min(start + length, file.size)
+    lines = []
+    for position in range(start, end, 16):
+        row = file.data[position:min(position + 16, end)]
+        text = "".join(chr(byte) if 32 <= byte < 127 else "." for byte in row)
+        lines.append(f"{position:08x}  {row.hex(' '):<47}  {text}")
+    return "\n".join(lines), end
+
+
+def read_lines(file: MappedFile, start_line: int, count: int,
+               max_bytes: int) -> Tuple[List[str], Optional[int]]:
+    """Read some lines starting from a line number, long lines are cut at the
+    byte limit
+
+    Returns the lines and the offset where the reading stopped, None when
+    the file ended"""
+    if file.encoding not in _LINE_ENCODINGS:
+        raise ValueError(f"can not read lines of {file.encoding} files, "
+                         "read a range of bytes instead")
+
+    position = file.index.offset_of(file.data, start_line) \
+        if file.size > 0 else None
+    lines: List[str] = []
+
+    while position is not None and len(lines) < count and max_bytes > 0:
+        end = file.data.find(b"\n", position)
+        end = file.size if end < 0 else end + 1
+        cut = min(end, position + max_bytes)
+        lines.append(file.decode(file.data[position:cut]).rstrip("\r\n"))
+        max_bytes -= cut - position
+        position = cut if cut < file.size else None
+    return lines, position
+
+
+def search(file: MappedFile, pattern: str, ignore_case: bool = False,
+           is_regex: bool = False, max_line_length: int = 300
+           ) -> Iterator[Match]:
+    """Find the lines matching a pattern, the mapped file is searched in
+    place without reading it into memory"""
+    if file.size == 0:
+        return
+    if file.encoding not in _LINE_ENCODINGS and not file.is_binary:
+        raise ValueError(f"can not search {file.encoding} files")
+
+    encoding = "latin-1" if file.encoding == "latin-1" else "utf-8"
+    expression = pattern.encode(encoding)
+    if not is_regex:
+        expression = re.escape(expression)
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    regex = re.compile(expression, flags)
+
+    end = -1
+    for match in regex.finditer(file.data):  # type: ignore
+        if match.start() < end:
+            continue  # already reported this line
+
+        if file.is_binary:
+            yield Match(0, match.start(), "")
+            end = match.end()
+            continue
+
+        start = file.data.rfind(b"\n", 0, match.start()) + 1
+        end = file.data.find(b"\n", match.start())
+        end = file.size if end < 0 else end + 1
+
+        text = file.data[start:min(end, start + max_line_length)]
+        yield Match(file.index.line_of(file.data, start), start,
+                    file.decode(text).rstrip("\r\n"))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Thin client of server.py, the chat runs in the warm server process so a new
+terminal starts at once"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from termcolor import colored
+
+# the events ending a turn
+_END_EVENTS_ = ("done", "error", "canceled")
+
+
+def default_socket_path() -> Path:
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return Path(runtime) / "linux-bot.sock"
+    return Path(tempfile.gettempdir()) / f"linux-bot-{os.getuid()}.sock"
+
+
+class RemoteSession:
+    """A session on the server, requests and events are JSON lines over the
+    unix socket"""
+
+    def __init__(self,
+                 path: Optional[Path] = None,
+                 resume: bool = False,
+                 session: Optional[int] = None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(str(path or default_socket_path()))
+        self._file = self._socket.makefile("rwb")
+
+        self._send({"type": "open", "resume": resume, "session": session})
+        opened = self._receive()
+        if opened["type"] == "error":
+            self.close()
+            raise ConnectionError(opened["message"])
+        self.session: Optional[int] = opened["session"]
+        self.loaded: int = opened["loaded"]
+
+    def _send(self, request: Dict[str, Any]):
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+
+    def _receive(self) -> Dict[str, Any]:
+        line = self._file.readline()
+        if len(line) == 0:
+            raise ConnectionError("The server closed the connection")
+        return json.loads(line)
+
+    def ask(self, text: str) -> Iterator[Dict[str, Any]]:
+        """Start a turn and yield its events until it ends"""
+        self._send({"type": "input", "text": text})
+        return self.events()
+
+    def events(self) -> Iterator[Dict[str, Any]]:
+        while True:
+            event = self._receive()
+            if event["type"] == "done":
+                # a new session gets its id with its first message
+                self.session = event["session"]
+            yield event
+            if event["type"] in _END_EVENTS_:
+                return
+
+    def cancel(self):
+        self._send({"type": "cancel"})
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+def show_turn(events: Iterator[Dict[str, Any]], assistant_name="Assistant"):
+    started = False
+    for event in events:
+        if event["type"] == "text":
+            if not started:
+                print(f"{assistant_name}: ", end="")
+                started = True
+            print(event["text"], end="", flush=True)
+        elif event["type"] == "ability":
+            print(colored(
+                f"Use Ability: {event['name']} {event['arguments']}", "green"))
+        elif event["type"] == "stderr":
+            print(event["text"], file=sys.stderr)
+        elif event["type"] == "interrupted":
+            print(colored("System: Ability Interrupted!", "red"))
+        elif event["type"] == "waiting":
+            print("System: The server is busy, waiting for a free slot")
+        elif event["type"] == "error":
+            print(f"System: {event['message']}")
+
+    if started:
+        print()
+
+
+def repl(session: RemoteSession):
+    while True:
+        try:
+            user_input = input("User: ")
+        except (EOFError, KeyboardInterrupt):
+            print("\nSystem: Goodbye!")
+            return
+
+        try:
+            show_turn(session.ask(user_input))
+        except KeyboardInterrupt:
+            session.cancel()
+            # the rest of the turn until the server stops it
+            for _ in session.events():
+                pass
+            print("\nSystem: Canceled!")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linux Bot")
+    parser.add_argument("--socket", type=Path, default=default_socket_path(),
+                        help="the unix socket of the server")
+    parser.add_argument("--resume", nargs="?", const=-1, type=int,
+                        metavar="SESSION",
+                        help="continue the latest session or a given one")
+    args = parser.parse_args()
+
+    try:
+        session = RemoteSession(
+            args.socket, args.resume is not None,
+            None if args.resume is None or args.resume < 0 else args.resume)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"System: No server on {args.socket}, start it with "
+              "`python server.py`", file=sys.stderr)
+        sys.exit(1)
+    except ConnectionError as e:
+        print(f"System: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.resume is not None:
+        if session.loaded == 0:
+            print("System: No session to resume, starting a new one")
+        else:
+            print(f"System: Resumed session {session.session} "
+                  f"with {session.loaded} messages")
+
+    try:
+        repl(session)
+    except ConnectionError as e:
+        print(f"\nSystem: {e}")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import time
+import itertools
+import threading
+from collections import deque
+from typing import Deque, Dict, NamedTuple, Optional
+
+import psutil
+
+
+class Sample(NamedTuple):
+    time: float
+    cpu_busy: float
+    cpu_total: float
+    memory_percent: float
+    disk_read_bytes: int
+    disk_write_bytes: int
+
+
+class SystemSampler:
+    """Sample cpu, memory and disk counters in a background thread and keep
+    them in a ring buffer, so usage over the last minutes is read from memory
+    instead of sleeping while measuring it"""
+
+    _INTERVAL_ = 2.0
+    _WINDOW_ = 15 * 60
+    # a sample takes about 120 bytes, the default ceiling is less than 1 MB
+    _MAX_SAMPLES_ = 8192
+
+    def __init__(self,
+                 interval: float = _INTERVAL_,
+                 max_samples: int = _MAX_SAMPLES_):
+        if interval <= 0:
+            raise ValueError("Sampling interval must be positive")
+
+        self._interval = interval
+        size = min(int(SystemSampler._WINDOW_ / interval) + 1, max_samples)
+        self._samples: Deque[Sample] = deque(maxlen=max(size, 2))
+        self._memory = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stopped.clear()
+        self.sample()
+        self._thread = threading.Thread(
+            target=self._run, name="system-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sample(self):
+        sample, memory = SystemSampler._read()
+        with self._lock:
+            self._samples.append(sample)
+            self._memory = memory
+
+    @staticmethod
+    def _read():
+        cpu = psutil.cpu_times()
+        idle = cpu.idle + getattr(cpu, "iowait", 0)
+        total = sum(cpu)
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_io_counters()
+
+        sample = Sample(
+            time.monotonic(),
+            total - idle,
+            total,
+            memory.percent,
+            disk.read_bytes if disk is not None else 0,
+            disk.write_bytes if disk is not None else 0,
+        )
+        return sample, memory
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self.sample()
+            except Exception:
+                # a failed sample is only a gap in the buffer
+                continue
+
+    @property
+    def memory(self):
+        """The latest psutil.virtual_memory() sample"""
+        with self._lock:
+            return self._memory
+
+    def _window(self, seconds: float):
+        """Get the oldest and the latest samples covering the window, the
+        counters are read now when there is only the sample taken on start"""
+        with self._lock:
+            if len(self._samples) == 0:
+                return None, None
+            latest = self._samples[-1]
+            index = len(self._samples) - 1 - round(seconds / self._interval)
+            oldest = self._samples[max(index, 0)]
+        if oldest is latest:
+            latest, _ = SystemSampler._read()
+        return oldest, latest
+
+    def covered_seconds(self, seconds: float) -> float:
+        """The real number of seconds available for a window"""
+        oldest, latest = self._window(seconds)
+        if oldest is None or latest is None:
+            return 0.0
+        return round(latest.time - oldest.time, 1)
+
+    def cpu_percent(self, seconds: float) -> Optional[float]:
+        oldest, latest = self._window(seconds)
+        if oldest is None or latest is None:
+            return None
+        total = latest.cpu_total - oldest.cpu_total
+        if total <= 0:
+            return None
+        busy = latest.cpu_busy - oldest.cpu_busy
+        return round(100 * busy / total, 1)
+
+    def memory_percent(self, seconds: float) -> Optional[float]:
+        """Average memory usage percent over the window"""
+        with self._lock:
+            count = min(len(self._samples),
+                        round(seconds / self._interval) + 1)
+            if count == 0:
+                return None
+            samples = [
+                sample.memory_percent
+                for sample in itertools.islice(reversed(self._samples), count)
+            ]
+        return round(sum(samples) / count, 1)
+
+    def disk_rates(self, seconds: float) -> Dict[str, Optional[float]]:
+        """Disk read and write bytes per second over the window"""
+        oldest, latest = self._window(seconds)
+        if oldest is None or latest is None or latest.time <= oldest.time:
+            return {"read": None, "write": None}
+
+        elapsed = latest.time - oldest.time
+        return {
+            "read": round(
+                (latest.disk_read_bytes - oldest.disk_read_bytes) / elapsed),
+            "write": round(
+                (latest.disk_write_bytes - oldest.disk_write_bytes) / elapsed),
+        }
+
+
+# the sampler shared by the system abilities, it is started by the first of
+# them to be imported or earlier by the application
+system_sampler = SystemSampler()
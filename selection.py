@@ -0,0 +1,72 @@
+import re
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "can", "do",
+    "for", "from", "how", "i", "if", "in", "is", "it", "its", "me", "my",
+    "of", "on", "or", "the", "this", "to", "what", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    words = _WORD.findall(text.lower())
+    # a naive stemming, enough to match "files" with "file"
+    return [
+        word[:-1] if len(word) > 3 and word.endswith("s") else word
+        for word in words if word not in _STOP_WORDS
+    ]
+
+
+class AbilityIndex:
+    """TF-IDF index over the names, docstrings and argument descriptions of
+    the abilities, used to pick the abilities relevant to a request"""
+
+    def __init__(self, documents: Iterable[Tuple[str, str]]):
+        counts: Dict[str, Counter] = {
+            name: Counter(tokenize(text)) for name, text in documents
+        }
+        frequency: Counter = Counter()
+        for words in counts.values():
+            frequency.update(words.keys())
+
+        total = len(counts)
+        self._idf = {
+            word: math.log((1 + total) / (1 + count)) + 1
+            for word, count in frequency.items()
+        }
+        self._vectors = {
+            name: self._vectorize(words) for name, words in counts.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def _vectorize(self, words: Counter) -> Dict[str, float]:
+        vector = {
+            word: count * self._idf[word]
+            for word, count in words.items() if word in self._idf
+        }
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        if norm == 0:
+            return {}
+        return {word: value / norm for word, value in vector.items()}
+
+    def rank(self, query: str, limit: int) -> List[str]:
+        """Get the names of the most relevant abilities to the query"""
+        query_vector = self._vectorize(Counter(tokenize(query)))
+        if len(query_vector) == 0:
+            return []
+
+        scores = []
+        for name, vector in self._vectors.items():
+            score = sum(
+                value * vector.get(word, 0)
+                for word, value in query_vector.items())
+            if score > 0:
+                scores.append((score, name))
+
+        scores.sort(reverse=True)
+        return [name for _, name in scores[:limit]]
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""Host many assistant sessions in one warm process, every connection to the
+unix socket is an independent session with its own history while the model
+client, the abilities workers and their cache are shared"""
+
+import os
+import json
+import signal
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+from typing import (Any, Awaitable, Callable, Dict, NamedTuple, Optional,
+                    Set)
+
+from openai.types.chat import ChatCompletionMessageToolCall
+
+from assistant import Assistant
+from async_assistant import AsyncAssistant
+from cache import AbilityCache
+from client import AsyncModelClient, CircuitOpenError
+from metrics import Metrics, MetricsServer
+from remote import default_socket_path
+from sessions import SessionStore
+from workers import AbilityExecutor, CancelToken
+
+
+class ServerStats(NamedTuple):
+    sessions: int
+    turns: int
+    rejected: int
+
+
+class SessionAssistant(AsyncAssistant):
+    """Assistant of a connection, its output is sent to the client as events
+    and it runs a limited number of abilities at once"""
+
+    def __init__(self, *args,
+                 send: Callable[[Dict[str, Any]], None],
+                 drain: Callable[[], Awaitable[None]],
+                 max_abilities: int,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self._send = send
+        self._drain = drain
+        self._ability_slots = asyncio.Semaphore(max_abilities)
+        self._loop = asyncio.get_running_loop()
+
+    def _output_text(self, text: str, assistant_name: str, is_first: bool):
+        self._send({"type": "text", "text": text})
+
+    def _output_end(self):
+        pass
+
+    async def _flush_output(self):
+        # a slow client slows the turn down instead of growing the buffer
+        await self._drain()
+
+    def _output_ability(self, name: str, arguments: str):
+        self._send({"type": "ability", "name": name, "arguments": arguments})
+
+    def _output_interrupted(self):
+        self._send({"type": "interrupted"})
+
+    def output_stderr(self, text: str):
+        # the plain abilities call it from the workers
+        self._loop.call_soon_threadsafe(
+            self._send, {"type": "stderr", "text": text})
+
+    async def _run_ability_async(self, call: ChatCompletionMessageToolCall,
+                                 cancel: Optional[CancelToken] = None
+                                 ) -> str:
+        async with self._ability_slots:
+            return await super()._run_ability_async(call, cancel)
+
+
+class _Connection:
+    def __init__(self, server: "AssistantServer",
+                 reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._server = server
+        self._reader = reader
+        self._writer = writer
+        self.assistant: Optional[SessionAssistant] = None
+        self._turn: Optional["asyncio.Task[None]"] = None
+
+    def send(self, event: Dict[str, Any]):
+        if not self._writer.is_closing():
+            self._writer.write(json.dumps(event).encode() + b"\n")
+
+    async def _drain(self):
+        try:
+            await self._writer.drain()
+        except ConnectionError:
+            # the client is gone, the reader sees it next
+            pass
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    line = await self._reader.readline()
+                except ValueError:
+                    self.send({"type": "error",
+                               "message": "Request is too long"})
+                    break
+                if len(line) == 0:
+                    break
+
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    self.send({"type": "error", "message": "Invalid request"})
+                else:
+                    self._dispatch(request)
+                await self._drain()
+        finally:
+            self.cancel()
+            self._writer.close()
+            if self.assistant is not None:
+                self.assistant.close()
+
+    def _dispatch(self, request: Dict[str, Any]):
+        kind = request.get("type")
+        if kind == "open":
+            self._open(request.get("resume", False), request.get("session"))
+        elif kind == "input":
+            self._input(str(request.get("text", "")))
+        elif kind == "cancel":
+            self.cancel()
+        else:
+            self.send({"type": "error", "message": f"Unknown request {kind}"})
+
+    def _open(self, resume: bool, session: Optional[int]):
+        if self.assistant is not None:
+            self.send({"type": "error", "message": "Session is already open"})
+            return
+
+        assistant = self._server.create_assistant(self.send, self._drain)
+        loaded = assistant.resume(session) if resume else 0
+        # the latest session is known only once it is resolved
+        if assistant.session is not None and \
+                self._server.is_open(assistant.session):
+            assistant.close()
+            self.send({"type": "error", "message":
+                       f"Session {assistant.session} is open elsewhere"})
+            return
+
+        self.assistant = assistant
+        self.send({"type": "opened", "session": assistant.session,
+                   "loaded": loaded})
+
+    def _input(self, text: str):
+        if self.assistant is None:
+            self.send({"type": "error", "message": "Open a session first"})
+        elif self._turn is not None and not self._turn.done():
+            # one turn at a time, the client waits for the end of a turn
+            self.send({"type": "error", "message": "A turn is running"})
+        else:
+            self._turn = asyncio.create_task(self._run_turn(text))
+
+    def cancel(self):
+        if self._turn is not None and not self._turn.done():
+            self._turn.cancel()
+
+    async def _run_turn(self, text: str):
+        assistant = self.assistant
+        assert assistant is not None
+
+        if self._server.is_busy:
+            self.send({"type": "waiting"})
+        try:
+            text = await self._server.run_turn(assistant, text)
+            self.send({"type": "done", "text": text,
+                       "session": assistant.session})
+        except asyncio.CancelledError:
+            self.send({"type": "canceled"})
+        except CircuitOpenError as e:
+            self.send({"type": "error", "message": str(e)})
+        except Exception as e:
+            self.send({"type": "error", "message": f"Error: {e}"})
+        await self._drain()
+
+
+class AssistantServer:
+    """Serve assistant sessions over a unix socket with JSON lines
+
+    The load is bounded by the number of sessions, the turns running at once
+    over all the sessions and the abilities running at once in every session,
+    a turn waits for a free slot and the client is told it is waiting"""
+
+    _MAX_SESSIONS_ = 32
+    _MAX_TURNS_ = 8
+    _MAX_ABILITIES_ = 4
+    _WORKERS_ = 16
+    _LINE_LIMIT_ = 1024 * 1024
+
+    def __init__(self,
+                 instructions: str,
+                 add_abilities: Callable[[Assistant], None],
+                 path: Optional[Path] = None,
+                 store: Optional[SessionStore] = None,
+                 client: Optional[AsyncModelClient] = None,
+                 workers: int = _WORKERS_,
+                 max_sessions: int = _MAX_SESSIONS_,
+                 max_turns: int = _MAX_TURNS_,
+                 max_abilities: int = _MAX_ABILITIES_,
+                 tools_limit: Optional[int] = None):
+        self._instructions = instructions
+        self._add_abilities = add_abilities
+        self._path = path or default_socket_path()
+        self._store = store or SessionStore()
+        self._client = client or AsyncModelClient()
+        self._cache = AbilityCache()
+        self._executor = AbilityExecutor(
+            max_workers=workers, thread_name_prefix="ability")
+        self._max_sessions = max_sessions
+        self._max_turns = max_turns
+        self._max_abilities = max_abilities
+        self._tools_limit = tools_limit
+        self._connections: Set[_Connection] = set()
+        self._rejected = 0
+        self._running = 0
+        self._turns: Optional[asyncio.Semaphore] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+        self._metrics = Metrics()
+        self._metrics.add_collector("client", lambda: self._client.stats)
+        self._metrics.add_collector("cache", lambda: self._cache.stats)
+        self._metrics.add_collector("server", lambda: self.stats)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def is_busy(self) -> bool:
+        return self._running >= self._max_turns
+
+    @property
+    def stats(self) -> ServerStats:
+        return ServerStats(
+            len(self._connections), self._running, self._rejected)
+
+    async def run_turn(self, assistant: SessionAssistant, text: str) -> str:
+        assert self._turns is not None, "Server is not running"
+        async with self._turns:
+            self._running += 1
+            try:
+                return await assistant(text, with_speech=False, stream=True)
+            finally:
+                self._running -= 1
+
+    def is_open(self, session: int) -> bool:
+        return any(connection.assistant is not None and
+                   connection.assistant.session == session
+                   for connection in self._connections)
+
+    def create_assistant(self, send: Callable[[Dict[str, Any]], None],
+                         drain: Callable[[], Awaitable[None]]
+                         ) -> SessionAssistant:
+        assistant = SessionAssistant(
+            self._instructions, cache=self._cache, store=self._store,
+            client=self._client, metrics=self._metrics,
+            executor=self._executor, tools_limit=self._tools_limit,
+            send=send, drain=drain, max_abilities=self._max_abilities)
+        self._add_abilities(assistant)
+        return assistant
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        connection = _Connection(self, reader, writer)
+        if len(self._connections) >= self._max_sessions:
+            self._rejected += 1
+            connection.send({"type": "error",
+                             "message": "The server is full, try again later"})
+            writer.close()
+            return
+
+        self._connections.add(connection)
+        try:
+            await connection.run()
+        finally:
+            self._connections.discard(connection)
+
+    def _check_path(self):
+        """Remove the socket of a server that did not exit cleanly"""
+        if not self._path.exists():
+            return
+
+        import socket
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self._path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            self._path.unlink(missing_ok=True)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"A server is already running on {self._path}")
+
+    async def serve(self):
+        self._check_path()
+        self._turns = asyncio.Semaphore(self._max_turns)
+        self._stopped = asyncio.Event()
+
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self._stopped.set)
+
+        # only the user may connect, the socket runs commands as the user
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(
+                self._handle, path=str(self._path),
+                limit=AssistantServer._LINE_LIMIT_)
+        finally:
+            os.umask(umask)
+
+        # the model client loads while the first client connects
+        from main import warm_up
+        threading.Thread(target=warm_up, args=(self._client,),
+                         daemon=True).start()
+        print(f"System: Serving on {self._path}")
+
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            for connection in self._connections:
+                connection.cancel()
+            self._path.unlink(missing_ok=True)
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._store.close()
+
+    def stop(self):
+        if self._stopped is not None:
+            self._stopped.set()
+
+
+def main():
+    from main import INSTRUCTIONS, add_abilities
+
+    parser = argparse.ArgumentParser(description="Linux Bot Server")
+    parser.add_argument("--socket", type=Path, default=default_socket_path(),
+                        help="the unix socket to listen on")
+    parser.add_argument("--workers", type=int,
+                        default=AssistantServer._WORKERS_,
+                        help="threads running the abilities of all sessions")
+    parser.add_argument("--max-sessions", type=int,
+                        default=AssistantServer._MAX_SESSIONS_)
+    parser.add_argument("--max-turns", type=int,
+                        default=AssistantServer._MAX_TURNS_,
+                        help="turns running at once over all sessions")
+    parser.add_argument("--max-abilities", type=int,
+                        default=AssistantServer._MAX_ABILITIES_,
+                        help="abilities running at once in every session")
+    parser.add_argument("--tools-limit", type=int, metavar="COUNT",
+                        help="send only the abilities most relevant to the "
+                             "input with the pinned ones, all by default")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on "
+                             "http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--fake", metavar="SCRIPT",
+                        help="replay the model responses of a JSON script "
+                             "instead of calling the model API")
+    args = parser.parse_args()
+
+    client = None
+    if args.fake is not None:
+        from fake_client import AsyncFakeModelClient
+        client = AsyncFakeModelClient.from_file(args.fake)
+
+    server = AssistantServer(
+        INSTRUCTIONS, add_abilities, args.socket, client=client,
+        workers=args.workers,
+        max_sessions=args.max_sessions, max_turns=args.max_turns,
+        max_abilities=args.max_abilities, tools_limit=args.tools_limit)
+
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(server.metrics, args.metrics_port)
+        metrics_server.start()
+
+    try:
+        asyncio.run(server.serve())
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        print("System: Goodbye!")
+
+
+if __name__ == "__main__":
+    main()
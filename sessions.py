@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, cast
+
+
+class SessionInfo(NamedTuple):
+    id: int
+    started: float
+    updated: float
+    messages: int
+
+
+def default_store_path() -> Path:
+    data = os.environ.get("XDG_DATA_HOME") or \
+        os.path.expanduser("~/.local/share")
+    return Path(data) / "linux-bot" / "sessions.sqlite3"
+
+
+def complete_turns(messages: List[dict]) -> List[dict]:
+    """Drop the messages after a tool call that never got its response, like
+    when the session was interrupted while running an ability"""
+    for index, message in enumerate(messages):
+        calls = message.get("tool_calls") or []
+        if message.get("role") != "assistant" or len(calls) == 0:
+            continue
+
+        responses = {
+            response.get("tool_call_id")
+            for response in messages[index + 1:index + 1 + len(calls)]
+            if response.get("role") == "tool"
+        }
+        if any(call["id"] not in responses for call in calls):
+            return messages[:index]
+    return messages
+
+
+class SessionStore:
+    """Append only log of the conversations and the facts the assistant
+    learned about the machine, every message is written as soon as it is
+    added so a session can be resumed after a restart"""
+
+    # messages loaded when resuming, older ones would be evicted by the
+    # history budget anyway
+    _RESUME_LIMIT_ = 200
+
+    def __init__(self, path: Optional[Path] = None):
+        path = path or default_store_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.executescript("""
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id INTEGER PRIMARY KEY,
+                    started REAL NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    session INTEGER NOT NULL REFERENCES sessions (id),
+                    role TEXT NOT NULL,
+                    message TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS messages_by_session
+                    ON messages (session, id);
+                CREATE TABLE IF NOT EXISTS facts (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated REAL NOT NULL
+                );
+            """)
+
+    def create_session(self) -> int:
+        now = time.time()
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO sessions (started, updated) VALUES (?, ?)",
+                (now, now))
+            return cast(int, cursor.lastrowid)
+
+    def latest_session(self) -> Optional[int]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id FROM sessions ORDER BY updated DESC LIMIT 1"
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def has_session(self, session: int) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM sessions WHERE id = ?", (session,)).fetchone()
+        return row is not None
+
+    def sessions(self, limit: int = 20) -> List[SessionInfo]:
+        with self._lock:
+            rows = self._connection.execute("""
+                SELECT id, started, updated,
+                    (SELECT COUNT(*) FROM messages WHERE session = sessions.id)
+                FROM sessions ORDER BY updated DESC LIMIT ?
+            """, (limit,)).fetchall()
+        return [SessionInfo(*row) for row in rows]
+
+    def append(self, session: int, message: dict):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO messages (session, role, message) "
+                "VALUES (?, ?, ?)",
+                (session, message.get("role"), json.dumps(message)))
+            self._connection.execute(
+                "UPDATE sessions SET updated = ? WHERE id = ?",
+                (time.time(), session))
+
+    def load(self, session: int,
+             limit: int = _RESUME_LIMIT_) -> List[dict]:
+        """Get the last messages of a session starting from a user message"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT role, message FROM messages WHERE session = ? "
+                "ORDER BY id DESC LIMIT ?", (session, limit)).fetchall()
+        rows.reverse()
+
+        # a turn cut by the limit is dropped
+        start = next((index for index, (role, _) in enumerate(rows)
+                      if role == "user"), len(rows))
+        return complete_turns(
+            [json.loads(message) for _, message in rows[start:]])
+
+    def set_fact(self, name: str, value: str):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO facts VALUES (?, ?, ?)",
+                (name, value, time.time()))
+
+    def facts(self) -> Dict[str, str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name, value FROM facts ORDER BY name").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
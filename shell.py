@@ -0,0 +1,401 @@
+import os
+import time
+import uuid
+import shlex
+import shutil
+import signal
+import asyncio
+import selectors
+import threading
+import functools
+import subprocess
+from concurrent.futures import Executor
+from typing import List, NamedTuple, Optional, Tuple
+
+from workers import CancelToken
+
+
+class BoundedBuffer:
+    """Keep only the beginning and the end of a stream of bytes, memory stays
+    the same no matter how much is written"""
+
+    def __init__(self, head_size: int, tail_size: int):
+        self._head_size = head_size
+        self._tail_size = tail_size
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._total = 0
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    @property
+    def dropped(self) -> int:
+        return self._total - len(self._head) - len(self._tail)
+
+    def write(self, data: bytes):
+        self._total += len(data)
+
+        room = self._head_size - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+
+        self._tail += data
+        if len(self._tail) > self._tail_size:
+            del self._tail[:len(self._tail) - self._tail_size]
+
+    def text(self) -> str:
+        head = self._head.decode(errors="replace")
+        tail = self._tail.decode(errors="replace")
+        if self.dropped == 0:
+            return head + tail
+        return f"{head}\n... [{self.dropped} bytes dropped] ...\n{tail}"
+
+
+class CommandResult(NamedTuple):
+    return_code: Optional[int]
+    stdout: str
+    stderr: str
+    stdout_dropped: int
+    stderr_dropped: int
+    elapsed: float
+    killed: Optional[str]
+    restarted: bool
+
+
+class _MarkedStream:
+    """Split the output of a command from the sentinel line written after it
+    by the shell"""
+
+    def __init__(self, marker: bytes, buffer: BoundedBuffer):
+        self._marker = marker
+        self._pending = bytearray()
+        self._found = False
+        self.buffer = buffer
+        self.trailer: Optional[bytes] = None
+
+    @property
+    def done(self) -> bool:
+        return self.trailer is not None
+
+    def feed(self, data: bytes):
+        if self.done:
+            return
+        self._pending += data
+
+        if not self._found:
+            index = self._pending.find(self._marker)
+            if index < 0:
+                # keep enough bytes to find a marker split between two reads
+                flush = len(self._pending) - len(self._marker) + 1
+                if flush > 0:
+                    self.buffer.write(bytes(self._pending[:flush]))
+                    del self._pending[:flush]
+                return
+
+            self.buffer.write(bytes(self._pending[:index]))
+            del self._pending[:index + len(self._marker)]
+            self._found = True
+
+        end = self._pending.find(b"\n")
+        if end >= 0:
+            self.trailer = bytes(self._pending[:end]).strip()
+            self._pending.clear()
+
+
+class ShellSession:
+    """A long lived shell reading commands from a pipe, a sentinel line is
+    written after every command so the shell keeps its working directory and
+    variables between commands"""
+
+    _CHUNK_SIZE_ = 64 * 1024
+    _MAX_OUTPUT_ = 256 * 1024 * 1024
+    _KEEP_SIZE_ = 64 * 1024
+
+    def __init__(self,
+                 max_output: int = _MAX_OUTPUT_,
+                 keep_size: int = _KEEP_SIZE_,
+                 cwd: Optional[str] = None):
+        self._max_output = max_output
+        self._keep_size = keep_size
+        self._sentinel = f"__linux_bot_{uuid.uuid4().hex}__"
+        self._broken = False
+
+        bash = shutil.which("bash")
+        args = [bash, "--noprofile", "--norc"] if bash else ["/bin/sh"]
+        self._process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+            cwd=cwd,
+            start_new_session=True)
+
+    @property
+    def alive(self) -> bool:
+        return not self._broken and self._process.poll() is None
+
+    @property
+    def cwd(self) -> Optional[str]:
+        """The working directory of the shell, None when it can not be read
+        like on systems without /proc"""
+        try:
+            return os.readlink(f"/proc/{self._process.pid}/cwd")
+        except OSError:
+            return None
+
+    def run(self, command: str, timeout: float,
+            cwd: Optional[str] = None) -> CommandResult:
+        start = time.monotonic()
+        deadline = start + timeout
+        stdout = _MarkedStream(f"\n{self._sentinel} ".encode(),
+                               BoundedBuffer(self._keep_size, self._keep_size))
+        stderr = _MarkedStream(f"\n{self._sentinel}\n".encode(),
+                               BoundedBuffer(self._keep_size, self._keep_size))
+        killed = None
+
+        script = f"cd -- {shlex.quote(cwd)} 2> /dev/null\n" if cwd else ""
+        # eval keeps a syntax error from breaking the protocol and the
+        # command never reads the pipe the next commands come from
+        script += (f"eval {shlex.quote(command)} < /dev/null\n"
+                   f"printf '\\n%s %d\\n' {self._sentinel} $?\n"
+                   f"printf '\\n%s\\n\\n' {self._sentinel} >&2\n")
+
+        assert self._process.stdin is not None
+        assert self._process.stdout is not None
+        assert self._process.stderr is not None
+
+        try:
+            self._process.stdin.write(script.encode())
+        except OSError:
+            self._broken = True
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._process.stdout, selectors.EVENT_READ,
+                              stdout)
+            selector.register(self._process.stderr, selectors.EVENT_READ,
+                              stderr)
+
+            while not self._broken and not (stdout.done and stderr.done):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    killed = f"timed out after {timeout} seconds"
+                    break
+
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fd, ShellSession._CHUNK_SIZE_)
+                    if len(data) == 0:
+                        # the shell exited, like when the command calls exit
+                        self._broken = True
+                        break
+                    key.data.feed(data)
+
+                total = stdout.buffer.total + stderr.buffer.total
+                if total > self._max_output:
+                    killed = f"output exceeded {self._max_output} bytes"
+                    break
+
+        if killed is not None:
+            self.close()
+
+        if stdout.trailer is not None and stdout.trailer.isdigit():
+            return_code: Optional[int] = int(stdout.trailer)
+        else:
+            self._broken = True
+            try:
+                return_code = self._process.wait(1)
+            except subprocess.TimeoutExpired:
+                return_code = None
+
+        return CommandResult(
+            return_code,
+            stdout.buffer.text().strip(),
+            stderr.buffer.text().strip(),
+            stdout.buffer.dropped,
+            stderr.buffer.dropped,
+            round(time.monotonic() - start, 3),
+            killed,
+            not self.alive,
+        )
+
+    def kill(self):
+        """Kill the shell and the command it is running, it is safe to call
+        from another thread while the command is running"""
+        self._broken = True
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def close(self):
+        self.kill()
+        try:
+            self._process.wait(1)
+        except subprocess.TimeoutExpired:
+            pass
+        for pipe in (self._process.stdin, self._process.stdout,
+                     self._process.stderr):
+            if pipe is not None:
+                pipe.close()
+
+
+class ShellPool:
+    """Keep a shell session alive to run the commands on, it is replaced by
+    a new one in the same directory when it crashes or its command gets
+    killed
+
+    Commands running one after the other share the working directory and
+    variables of the session, a command started while another one is running
+    runs on a spare session in the same directory without the variables"""
+
+    _SIZE_ = 2
+    _TIMEOUT_ = 100.0
+
+    def __init__(self,
+                 size: int = _SIZE_,
+                 timeout: float = _TIMEOUT_,
+                 max_output: int = ShellSession._MAX_OUTPUT_,
+                 keep_size: int = ShellSession._KEEP_SIZE_,
+                 executor: Optional[Executor] = None):
+        self._size = size
+        self._timeout = timeout
+        self._max_output = max_output
+        self._keep_size = keep_size
+        # the threads waiting for the commands of run_async, the default
+        # executor of the loop when None
+        self._executor = executor
+        self._session: Optional[ShellSession] = None
+        self._busy = False
+        # the last directory of the session, its replacement starts in it
+        self._cwd: Optional[str] = None
+        # the spare sessions kept for the commands running at once
+        self._idle: List[ShellSession] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def cwd(self) -> str:
+        """The working directory of the session, the one of the process
+        before the first command"""
+        with self._lock:
+            session, cwd = self._session, self._cwd
+        if session is not None and session.alive:
+            cwd = session.cwd or cwd
+        return cwd or os.getcwd()
+
+    def _start(self, cwd: Optional[str]) -> ShellSession:
+        try:
+            return ShellSession(self._max_output, self._keep_size, cwd)
+        except OSError:
+            # the directory was removed
+            return ShellSession(self._max_output, self._keep_size)
+
+    def _acquire(self) -> Tuple[ShellSession, bool]:
+        """Get the session or a spare one when the session is running a
+        command, the flag tells if it is the session"""
+        with self._lock:
+            is_main = not self._busy
+            if is_main:
+                self._busy = True
+                session = self._session
+            else:
+                session = self._idle.pop() if len(self._idle) > 0 else None
+
+        if session is not None and session.alive:
+            return session, is_main
+        if session is not None:
+            session.close()
+
+        try:
+            session = self._start(self._cwd if is_main else None)
+        except BaseException:
+            if is_main:
+                with self._lock:
+                    self._busy = False
+            raise
+
+        if is_main:
+            with self._lock:
+                self._session = session
+        return session, is_main
+
+    def _release(self, session: ShellSession, is_main: bool):
+        cwd = session.cwd if session.alive else None
+        with self._lock:
+            if is_main and session is self._session:
+                self._busy = False
+                if cwd is not None:
+                    self._cwd = cwd
+                keep = not self._closed
+            elif is_main:
+                # it was killed or the pool was closed while it was running
+                keep = False
+            else:
+                keep = not self._closed and session.alive and \
+                    len(self._idle) < self._size
+                if keep:
+                    self._idle.append(session)
+        if not keep:
+            session.close()
+
+    def _kill(self, session: ShellSession, is_main: bool):
+        """Kill the command of a session, the session is given up at once so
+        the next command restarts it in its last directory without waiting
+        for the killed command to return"""
+        if is_main:
+            cwd = session.cwd
+            with self._lock:
+                if session is self._session:
+                    self._session = None
+                    self._busy = False
+                    if cwd is not None:
+                        self._cwd = cwd
+        session.kill()
+
+    def _run_on(self, session: ShellSession, is_main: bool, command: str,
+                cancel: Optional[CancelToken] = None) -> CommandResult:
+        # a spare session moves to the directory of the session first
+        cwd = None if is_main else self.cwd
+        kill = functools.partial(self._kill, session, is_main)
+        if cancel is not None:
+            cancel.add(kill)
+        try:
+            return session.run(command, self._timeout, cwd)
+        finally:
+            if cancel is not None:
+                cancel.remove(kill)
+            self._release(session, is_main)
+
+    def run(self, command: str,
+            cancel: Optional[CancelToken] = None) -> CommandResult:
+        """Run a command, canceling the token kills it"""
+        return self._run_on(*self._acquire(), command, cancel)
+
+    async def run_async(self, command: str,
+                        cancel: Optional[CancelToken] = None
+                        ) -> CommandResult:
+        session, is_main = self._acquire()
+        loop = asyncio.get_running_loop()
+
+        try:
+            return await loop.run_in_executor(
+                self._executor, self._run_on, session, is_main, command,
+                cancel)
+        except asyncio.CancelledError:
+            # the shell is killed so the thread reading it returns
+            self._kill(session, is_main)
+            raise
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            sessions, self._idle = self._idle, []
+            # a busy session is closed when its command returns
+            if self._session is not None and not self._busy:
+                sessions.append(self._session)
+            self._session = None
+        for session in sessions:
+            session.close()
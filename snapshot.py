@@ -0,0 +1,315 @@
+import time
+import heapq
+import socket
+import threading
+from enum import Enum
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import psutil
+
+_PROCESS_ATTRS_ = ["pid", "name", "username", "cmdline", "cpu_times",
+                   "memory_info", "io_counters", "num_threads", "create_time"]
+
+# a process is known by its pid and start time so a reused pid is a new one
+ProcessKey = Tuple[int, float]
+
+
+class ProcessSortBy(Enum):
+    cpu = "cpu"
+    memory = "memory"
+    io = "io"
+    threads = "threads"
+    connections = "connections"
+
+
+class ProcessSample(NamedTuple):
+    pid: int
+    name: str
+    user: Optional[str]
+    command: str
+    cpu_time: float
+    rss: int
+    read_bytes: Optional[int]
+    write_bytes: Optional[int]
+    threads: int
+    created: float
+
+
+class ProcessInfo(NamedTuple):
+    pid: int
+    name: str
+    user: Optional[str]
+    command: str
+    # percent of one core, like top
+    cpu_percent: float
+    rss: int
+    memory_percent: float
+    # bytes per second, None when the counters are not readable
+    read_rate: Optional[float]
+    write_rate: Optional[float]
+    threads: int
+
+
+class SocketInfo(NamedTuple):
+    protocol: str
+    address: str
+    port: int
+    pid: Optional[int]
+    process: Optional[str]
+
+
+class InterfaceInfo(NamedTuple):
+    name: str
+    is_up: bool
+    speed: int
+    mtu: int
+    addresses: List[str]
+    bytes_sent: int
+    bytes_recv: int
+    errors: int
+    drops: int
+    # bytes per second since the previous snapshot, None for the first one
+    send_rate: Optional[float]
+    recv_rate: Optional[float]
+
+
+class _Counters(NamedTuple):
+    time: float
+    samples: Dict[ProcessKey, ProcessSample]
+
+
+def _process_samples() -> _Counters:
+    samples: Dict[ProcessKey, ProcessSample] = {}
+    now = time.monotonic()
+
+    for process in psutil.process_iter(_PROCESS_ATTRS_, ad_value=None):
+        info = process.info
+        cpu = info["cpu_times"]
+        memory = info["memory_info"]
+        io = info["io_counters"]
+        # the kernel threads have no command line
+        command = " ".join(info["cmdline"] or []) or info["name"] or ""
+
+        sample = ProcessSample(
+            info["pid"], info["name"] or "", info["username"], command,
+            cpu.user + cpu.system if cpu is not None else 0.0,
+            memory.rss if memory is not None else 0,
+            io.read_bytes if io is not None else None,
+            io.write_bytes if io is not None else None,
+            info["num_threads"] or 0,
+            info["create_time"] or 0.0)
+        samples[(sample.pid, sample.created)] = sample
+
+    return _Counters(now, samples)
+
+
+def _rate(current: Optional[int], previous: Optional[int],
+          seconds: float) -> Optional[float]:
+    if current is None or previous is None or seconds <= 0:
+        return None
+    return max(current - previous, 0) / seconds
+
+
+class SystemSnapshot:
+    """The processes, sockets and interfaces of the system at one time, every
+    part is read on its first use and then shared by all the abilities of the
+    turn, so asking for processes twice costs a single scan
+
+    Rates, like the cpu usage, need two readings of the counters, they are
+    measured since the previous snapshot or over a short interval when it is
+    too old"""
+
+    _BASELINE_INTERVAL_ = 0.25
+    _BASELINE_MAX_AGE_ = 10.0
+
+    def __init__(self,
+                 previous: Optional["SystemSnapshot"] = None,
+                 baseline_interval: float = _BASELINE_INTERVAL_):
+        self.time = time.monotonic()
+        self._previous = previous
+        self._baseline_interval = baseline_interval
+        # the parts are read apart, listing the interfaces never waits for
+        # the processes scan
+        self._processes_lock = threading.Lock()
+        self._connections_lock = threading.Lock()
+        self._interfaces_lock = threading.Lock()
+        self._counters: Optional[_Counters] = None
+        self._processes: Optional[Dict[int, ProcessInfo]] = None
+        self._connections: Optional[List] = None
+        self._interfaces: Optional[Dict[str, InterfaceInfo]] = None
+        self._interface_counters: Optional[Tuple[float, Dict]] = None
+
+        # only the previous snapshot is needed, not the whole chain
+        if previous is not None:
+            previous._previous = None
+
+    def _baseline(self) -> _Counters:
+        previous = self._previous
+        if previous is not None and previous._counters is not None and \
+                self.time - previous._counters.time < \
+                SystemSnapshot._BASELINE_MAX_AGE_:
+            return previous._counters
+
+        baseline = _process_samples()
+        time.sleep(self._baseline_interval)
+        return baseline
+
+    def processes(self) -> Dict[int, ProcessInfo]:
+        with self._processes_lock:
+            if self._processes is not None:
+                return self._processes
+
+            baseline = self._baseline()
+            counters = _process_samples()
+            seconds = counters.time - baseline.time
+            total_memory = psutil.virtual_memory().total
+
+            processes = {}
+            for key, sample in counters.samples.items():
+                before = baseline.samples.get(key)
+                cpu_percent = 0.0
+                read_rate = write_rate = None
+                if before is not None and seconds > 0:
+                    cpu_percent = max(
+                        sample.cpu_time - before.cpu_time, 0) / seconds * 100
+                    read_rate = _rate(
+                        sample.read_bytes, before.read_bytes, seconds)
+                    write_rate = _rate(
+                        sample.write_bytes, before.write_bytes, seconds)
+
+                processes[sample.pid] = ProcessInfo(
+                    sample.pid, sample.name, sample.user, sample.command,
+                    cpu_percent, sample.rss,
+                    sample.rss / total_memory * 100 if total_memory else 0,
+                    read_rate, write_rate, sample.threads)
+
+            self._counters = counters
+            self._processes = processes
+            return processes
+
+    def connections(self) -> List:
+        """The inet sockets of all the processes, the owners of the sockets
+        of other users are only known when running as root"""
+        with self._connections_lock:
+            if self._connections is None:
+                try:
+                    self._connections = psutil.net_connections("inet")
+                except psutil.AccessDenied:
+                    self._connections = []
+            return self._connections
+
+    def connection_counts(self) -> Dict[int, int]:
+        counts: Dict[int, int] = {}
+        for connection in self.connections():
+            if connection.pid is not None and connection.raddr:
+                counts[connection.pid] = counts.get(connection.pid, 0) + 1
+        return counts
+
+    def _process_name(self, pid: Optional[int]) -> Optional[str]:
+        """Get the name of a process without scanning all of them"""
+        if pid is None:
+            return None
+        processes = self._processes
+        if processes is not None and pid in processes:
+            return processes[pid].name
+        try:
+            return psutil.Process(pid).name()
+        except psutil.Error:
+            return None
+
+    def listening_sockets(self) -> List[SocketInfo]:
+        sockets = []
+        for connection in self.connections():
+            if connection.type == socket.SOCK_STREAM:
+                if connection.status != psutil.CONN_LISTEN:
+                    continue
+                protocol = "tcp"
+            elif connection.type == socket.SOCK_DGRAM:
+                if connection.raddr:
+                    continue
+                protocol = "udp"
+            else:
+                continue
+
+            if connection.family == socket.AF_INET6:
+                protocol += "6"
+            sockets.append(SocketInfo(
+                protocol, connection.laddr.ip, connection.laddr.port,
+                connection.pid, self._process_name(connection.pid)))
+
+        sockets.sort(key=lambda item: (item.port, item.protocol))
+        return sockets
+
+    def interfaces(self) -> Dict[str, InterfaceInfo]:
+        with self._interfaces_lock:
+            if self._interfaces is not None:
+                return self._interfaces
+
+            now = time.monotonic()
+            counters = psutil.net_io_counters(pernic=True)
+            stats = psutil.net_if_stats()
+            addresses = psutil.net_if_addrs()
+
+            previous = None
+            if self._previous is not None:
+                previous = self._previous._interface_counters
+            seconds = now - previous[0] if previous is not None else 0
+
+            interfaces = {}
+            for name, counter in counters.items():
+                stat = stats.get(name)
+                before = previous[1].get(name) if previous else None
+                interfaces[name] = InterfaceInfo(
+                    name,
+                    stat.isup if stat is not None else False,
+                    stat.speed if stat is not None else 0,
+                    stat.mtu if stat is not None else 0,
+                    [address.address for address in addresses.get(name, [])],
+                    counter.bytes_sent, counter.bytes_recv,
+                    counter.errin + counter.errout,
+                    counter.dropin + counter.dropout,
+                    _rate(counter.bytes_sent,
+                          before.bytes_sent if before else None, seconds),
+                    _rate(counter.bytes_recv,
+                          before.bytes_recv if before else None, seconds))
+
+            self._interface_counters = (now, counters)
+            self._interfaces = interfaces
+            return interfaces
+
+
+class SnapshotCache:
+    """Give the abilities called in the same turn the same snapshot, a new
+    snapshot is taken when the last one is older than the time to live"""
+
+    _TTL_ = 2.0
+
+    def __init__(self, ttl: float = _TTL_):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot: Optional[SystemSnapshot] = None
+
+    def get(self) -> SystemSnapshot:
+        with self._lock:
+            snapshot = self._snapshot
+            now = time.monotonic()
+            if snapshot is None or now - snapshot.time > self._ttl:
+                snapshot = SystemSnapshot(snapshot)
+                self._snapshot = snapshot
+            return snapshot
+
+
+def top_processes(processes: Iterable[ProcessInfo], sort: ProcessSortBy,
+                  top: int, connections: Dict[int, int]) -> List[ProcessInfo]:
+    def io(process: ProcessInfo) -> float:
+        return (process.read_rate or 0) + (process.write_rate or 0)
+
+    keys = {
+        ProcessSortBy.cpu: lambda process: process.cpu_percent,
+        ProcessSortBy.memory: lambda process: process.rss,
+        ProcessSortBy.io: io,
+        ProcessSortBy.threads: lambda process: process.threads,
+        ProcessSortBy.connections:
+            lambda process: connections.get(process.pid, 0),
+    }
+    return heapq.nlargest(top, processes, key=keys[sort])
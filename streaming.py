@@ -0,0 +1,208 @@
+import re
+import queue
+import threading
+from typing import (TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List,
+                    Optional)
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionChunk, ChatCompletionMessage
+
+
+class StreamedMessage:
+    """Rebuild a chat completion message from the chunks of a streamed
+    response, the text and the tool calls deltas are joined as they arrive"""
+
+    def __init__(self):
+        self._content: List[str] = []
+        self._tool_calls: Dict[int, Dict[str, object]] = {}
+
+    @property
+    def content(self) -> str:
+        return "".join(self._content)
+
+    @property
+    def has_tool_calls(self) -> bool:
+        return len(self._tool_calls) > 0
+
+    def feed(self, chunk: "ChatCompletionChunk") -> str:
+        """Add a chunk to the message and returns its new text if any"""
+        if len(chunk.choices) == 0:
+            return ""
+
+        delta = chunk.choices[0].delta
+
+        for call in delta.tool_calls or []:
+            entry = self._tool_calls.setdefault(call.index, {
+                "id": "",
+                "name": "",
+                "arguments": [],
+            })
+
+            if call.id:
+                entry["id"] = call.id
+            if call.function is not None:
+                if call.function.name:
+                    entry["name"] = str(entry["name"]) + call.function.name
+                if call.function.arguments:
+                    arguments = entry["arguments"]
+                    assert isinstance(arguments, list)
+                    arguments.append(call.function.arguments)
+
+        if delta.content:
+            self._content.append(delta.content)
+            return delta.content
+        return ""
+
+    def to_message(self) -> "ChatCompletionMessage":
+        from openai.types.chat import (ChatCompletionMessage,
+                                       ChatCompletionMessageToolCall)
+        from openai.types.chat.chat_completion_message_tool_call import Function
+
+        tool_calls = None
+
+        if self.has_tool_calls:
+            tool_calls = [
+                ChatCompletionMessageToolCall(
+                    id=str(entry["id"]),
+                    type="function",
+                    function=Function(
+                        name=str(entry["name"]),
+                        arguments="".join(entry["arguments"]),  # type: ignore
+                    ),
+                )
+                for _, entry in sorted(self._tool_calls.items())
+            ]
+
+        return ChatCompletionMessage(
+            role="assistant",
+            content=self.content if len(self._content) > 0 else None,
+            tool_calls=tool_calls,
+        )
+
+
+class SentenceSplitter:
+    """Split a stream of text into sentences, a sentence is yielded only once
+    it is complete and long enough to be worth a speech request"""
+
+    _SENTENCE_END_ = re.compile(r"(?<=[.!?:;])\s+|\n+")
+
+    def __init__(self, min_length: int = 40):
+        self._min_length = min_length
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences: List[str] = []
+        start = 0
+
+        for match in self._SENTENCE_END_.finditer(self._buffer):
+            if match.end() - start < self._min_length:
+                continue
+            sentence = self._buffer[start:match.start()].strip()
+            if len(sentence) > 0:
+                sentences.append(sentence)
+            start = match.end()
+
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        sentence = self._buffer.strip()
+        self._buffer = ""
+        return [sentence] if len(sentence) > 0 else []
+
+    def split(self, chunks: Iterable[str]) -> Iterator[str]:
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.flush()
+
+
+class SpeechPipeline:
+    """Synthesize and play sentences in the background, while a sentence is
+    playing the next one is already being synthesized
+
+    When synthesizing or playing fails the pipeline stops, the next sentences
+    are dropped and the error is raised again by close"""
+
+    _QUEUE_SIZE_ = 4
+
+    def __init__(self,
+                 synthesize: Callable[[str], bytes],
+                 play: Callable[[bytes], None]):
+        self._synthesize = synthesize
+        self._play = play
+        self._sentences: "queue.Queue[Optional[str]]" = queue.Queue(
+            SpeechPipeline._QUEUE_SIZE_)
+        self._sounds: "queue.Queue[Optional[bytes]]" = queue.Queue(
+            SpeechPipeline._QUEUE_SIZE_)
+        self._stopped = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._threads = [
+            threading.Thread(target=self._synthesize_loop, daemon=True),
+            threading.Thread(target=self._play_loop, daemon=True),
+        ]
+
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        return self._error
+
+    def put(self, sentence: str):
+        if not self._stopped.is_set():
+            self._sentences.put(sentence)
+
+    def close(self):
+        """Wait for all the queued sentences to be played, raises the error
+        that stopped the pipeline if any"""
+        self._sentences.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        """Drop the queued sentences and stop as soon as possible"""
+        self._stopped.set()
+        for pending in (self._sentences, self._sounds):
+            SpeechPipeline._drain(pending)
+        self._sentences.put(None)
+
+    @staticmethod
+    def _drain(pending: queue.Queue):
+        while not pending.empty():
+            pending.get_nowait()
+
+    def _fail(self, error: BaseException):
+        if self._error is None:
+            self._error = error
+        self._stopped.set()
+
+    def _synthesize_loop(self):
+        try:
+            while True:
+                sentence = self._sentences.get()
+                if sentence is None or self._stopped.is_set():
+                    break
+                self._sounds.put(self._synthesize(sentence))
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # unblock a put waiting on a full queue, the later ones are
+            # dropped as the pipeline is stopped
+            if self._stopped.is_set():
+                SpeechPipeline._drain(self._sentences)
+            self._sounds.put(None)
+
+    def _play_loop(self):
+        try:
+            while True:
+                sound = self._sounds.get()
+                if sound is None or self._stopped.is_set():
+                    break
+                self._play(sound)
+        except Exception as e:
+            self._fail(e)
+            # unblock the synthesizer waiting on a full queue
+            SpeechPipeline._drain(self._sounds)
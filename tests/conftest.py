@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules are at the top level of the repository like in the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
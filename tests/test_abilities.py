@@ -0,0 +1,62 @@
+import os
+import re
+import json
+import socket
+import asyncio
+
+import pytest
+
+import abilities
+
+
+@pytest.fixture
+def lines(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_text("match one\nskip\nmatch two\nmatch three\n")
+    return str(path)
+
+
+def test_search_file_returns_at_least_one_match(lines):
+    assert abilities.search_file(lines, "match", max_matches=0) == \
+        "1: match one\n" \
+        "[more than 1 matches, use a more specific pattern]"
+
+
+def test_search_file_returns_all_the_matches_up_to_the_limit(lines):
+    assert abilities.search_file(lines, "match", max_matches=3) == \
+        "1: match one\n3: match two\n4: match three"
+    assert abilities.search_file(lines, "match", max_matches=2) == \
+        "1: match one\n3: match two\n" \
+        "[more than 2 matches, use a more specific pattern]"
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"),
+                    reason="needs /proc")
+def test_proc_files_are_read_although_their_size_is_zero():
+    assert os.stat("/proc/self/status").st_size == 0
+
+    content = abilities.read_file("/proc/self/status", line_count=1)
+    assert content.startswith("Name:\t")
+    assert "next line: 2" in content
+    match = abilities.search_file("/proc/self/status", "^Pid:",
+                                  is_regex=True)
+    assert re.fullmatch(rf"\d+: Pid:\t{os.getpid()}", match)
+
+
+def test_scan_ports_rejects_the_hosts_out_of_the_local_networks():
+    result = asyncio.run(abilities.scan_ports("127.0.0.1,8.8.8.8", "80"))
+
+    assert result.startswith("Error: ")
+    assert "8.8.8.8" in result
+
+
+def test_scan_ports_finds_a_local_listener():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        port = listener.getsockname()[1]
+
+        result = json.loads(asyncio.run(
+            abilities.scan_ports("127.0.0.1", str(port))))
+
+    assert result["hosts"] == {"127.0.0.1": [port]}
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Iterable, List
+
+from async_assistant import AsyncAssistant
+from audio import AudioCache
+from fake_client import FAKE_SPEECH, AsyncFakeModelClient, text
+
+ANSWER = "The first sentence is long enough to be spoken alone. " \
+         "The second sentence is long enough to be spoken too."
+
+
+class RecordingPlayer:
+    def __init__(self):
+        self.played: List[bytes] = []
+
+    def play(self, data: bytes):
+        self.played.append(data)
+
+    def play_stream(self, chunks: Iterable[bytes]):
+        self.played.append(b"".join(chunks))
+
+
+class RecordingAssistant(AsyncAssistant):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recorder = RecordingPlayer()
+
+    @property
+    def player(self):
+        return self.recorder
+
+
+def create_assistant(tmp_path) -> RecordingAssistant:
+    return RecordingAssistant(
+        "test", client=AsyncFakeModelClient([text(ANSWER)]),
+        audio_cache=AudioCache(tmp_path))
+
+
+def test_streamed_turn_speaks_every_sentence(tmp_path):
+    assistant = create_assistant(tmp_path)
+
+    answer = asyncio.run(assistant("hi", with_output=False, stream=True))
+
+    assert answer == ANSWER
+    assert assistant.recorder.played == [FAKE_SPEECH, FAKE_SPEECH]
+
+
+def test_turn_speaks_the_answer(tmp_path):
+    assistant = create_assistant(tmp_path)
+
+    answer = asyncio.run(assistant("hi", with_output=False))
+
+    assert answer == ANSWER
+    assert assistant.recorder.played == [FAKE_SPEECH]
+    # the speech is cached for the next time
+    assert len(assistant.audio_cache) == 1
@@ -0,0 +1,183 @@
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Tuple
+
+import openai
+import pytest
+
+from client import (AsyncModelClient, CircuitBreaker, CircuitOpenError,
+                    ModelClient, RetryPolicy)
+
+COMPLETION = {
+    "id": "test",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "test",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "hello"},
+        "finish_reason": "stop",
+    }],
+}
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class StubAPI:
+    """A model API answering with the queued statuses, then with 200"""
+
+    def __init__(self):
+        self.responses: Deque[Tuple[int, Dict[str, str]]] = deque()
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.requests += 1
+                status, headers = stub.responses.popleft() \
+                    if len(stub.responses) > 0 else (200, {})
+                body = json.dumps(COMPLETION if status == 200 else
+                                  {"error": {"message": "failing"}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}/v1"
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.01,), daemon=True)
+        self._thread.start()
+
+    def fail(self, *statuses: int, **headers: str):
+        for status in statuses:
+            self.responses.append((status, headers))
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def api():
+    stub = StubAPI()
+    yield stub
+    stub.close()
+
+
+def create_client(api: StubAPI, cls=ModelClient, **kwargs):
+    kwargs.setdefault("retry", RetryPolicy(base_delay=0.01, max_delay=1))
+    return cls(base_url=api.url, api_key="test", **kwargs)
+
+
+def content(response) -> str:
+    return response.choices[0].message.content
+
+
+def test_failures_are_retried_until_a_response(api):
+    api.fail(429, 500, 503)
+    client = create_client(api)
+
+    assert content(client.chat(model="test", messages=MESSAGES)) == "hello"
+    assert api.requests == 4
+    assert client.stats.retries == 3
+    assert client.stats.requests == 1
+    assert client.stats.failures == 0
+
+
+def test_the_error_is_raised_when_the_retries_run_out(api):
+    api.fail(500, 500, 500)
+    client = create_client(api, retry=RetryPolicy(retries=2, base_delay=0.01))
+
+    with pytest.raises(openai.InternalServerError):
+        client.chat(model="test", messages=MESSAGES)
+    assert api.requests == 3
+    assert client.stats.failures == 1
+
+
+def test_client_errors_are_not_retried(api):
+    api.fail(400)
+    client = create_client(api)
+
+    with pytest.raises(openai.BadRequestError):
+        client.chat(model="test", messages=MESSAGES)
+    assert api.requests == 1
+
+
+def test_retry_after_is_respected(api):
+    api.fail(429, **{"Retry-After": "0.3"})
+    client = create_client(api)
+
+    start = time.monotonic()
+    client.chat(model="test", messages=MESSAGES)
+
+    assert time.monotonic() - start >= 0.3
+    assert api.requests == 2
+
+
+def test_backoff_grows_with_the_attempts():
+    policy = RetryPolicy(base_delay=0.5, max_delay=8)
+
+    for attempt, ceiling in enumerate((0.5, 1, 2, 4, 8, 8)):
+        delays = [policy.delay(attempt) for _ in range(100)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+    assert policy.delay(0, retry_after=30) == 8
+
+
+def test_circuit_opens_and_closes_again(api):
+    api.fail(500, 500)
+    client = create_client(
+        api, breaker=CircuitBreaker(failures=2, reset_timeout=0.3))
+
+    with pytest.raises(openai.InternalServerError):
+        client.chat(model="test", messages=MESSAGES)
+    assert client.stats.circuit_opens == 1
+
+    # refused without reaching the API until the reset timeout
+    with pytest.raises(CircuitOpenError):
+        client.chat(model="test", messages=MESSAGES)
+    assert api.requests == 2
+    assert client.stats.rejected == 1
+
+    time.sleep(0.3)
+    assert content(client.chat(model="test", messages=MESSAGES)) == "hello"
+    assert content(client.chat(model="test", messages=MESSAGES)) == "hello"
+    assert api.requests == 4
+
+
+def test_failed_probe_opens_the_circuit_again(api):
+    api.fail(500, 500, 500)
+    client = create_client(
+        api, breaker=CircuitBreaker(failures=2, reset_timeout=0.3))
+
+    with pytest.raises(openai.InternalServerError):
+        client.chat(model="test", messages=MESSAGES)
+    time.sleep(0.3)
+    with pytest.raises(openai.InternalServerError):
+        client.chat(model="test", messages=MESSAGES)
+
+    # the probe failed, the circuit waits for a whole reset timeout again
+    with pytest.raises(CircuitOpenError):
+        client.chat(model="test", messages=MESSAGES)
+    assert api.requests == 3
+
+
+def test_async_failures_are_retried_until_a_response(api):
+    api.fail(429, 502)
+    client = create_client(api, AsyncModelClient)
+
+    response = asyncio.run(client.chat(model="test", messages=MESSAGES))
+
+    assert content(response) == "hello"
+    assert api.requests == 3
+    assert client.stats.retries == 2
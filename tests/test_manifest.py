@@ -0,0 +1,25 @@
+import importlib
+
+from manifest import (generate_manifest, get_manifest_path, load_manifest,
+                      write_manifest)
+
+
+def write_module(path, name: str, source: str):
+    (path / f"{name}.py").write_text(source)
+    importlib.invalidate_caches()
+
+
+def test_manifest_is_stale_when_an_imported_module_changes(
+        tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    write_module(tmp_path, "sample_helpers", "LIMIT = 10\n")
+    write_module(tmp_path, "sample_abilities",
+                 "import json\nfrom sample_helpers import LIMIT\n")
+    path = get_manifest_path("sample_abilities")
+    write_manifest(path, generate_manifest("sample_abilities", []))
+
+    assert load_manifest(path) == []
+
+    write_module(tmp_path, "sample_helpers", "LIMIT = 20\n")
+
+    assert load_manifest(path) is None
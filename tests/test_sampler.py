@@ -0,0 +1,16 @@
+import time
+
+from sampler import SystemSampler
+
+
+def test_usage_is_measured_before_the_second_sample():
+    sampler = SystemSampler(interval=60)
+    sampler.start()
+    try:
+        time.sleep(0.2)
+
+        assert sampler.cpu_percent(60) is not None
+        assert sampler.disk_rates(60)["read"] is not None
+        assert sampler.covered_seconds(60) > 0
+    finally:
+        sampler.stop()
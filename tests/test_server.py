@@ -0,0 +1,122 @@
+import json
+import asyncio
+from typing import Any, Dict
+
+import abilities
+from fake_client import AsyncFakeModelClient, ScriptedCall, text, tool_calls
+from server import AssistantServer
+from sessions import SessionStore
+
+
+class Client:
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    async def request(self, **request: Any) -> Dict[str, Any]:
+        self._writer.write(json.dumps(request).encode() + b"\n")
+        await self._writer.drain()
+        return await self.event()
+
+    async def event(self) -> Dict[str, Any]:
+        return json.loads(await self._reader.readline())
+
+    def close(self):
+        self._writer.close()
+
+
+async def connect(server: AssistantServer) -> Client:
+    return Client(*await asyncio.open_unix_connection(str(server.path)))
+
+
+async def start(server: AssistantServer) -> "asyncio.Task[None]":
+    task = asyncio.create_task(server.serve())
+    while not server.path.exists():
+        await asyncio.sleep(0.01)
+    return task
+
+
+def test_latest_session_is_not_opened_twice(tmp_path):
+    server = AssistantServer(
+        "test", lambda assistant: None, tmp_path / "server.sock",
+        store=SessionStore(tmp_path / "sessions.sqlite3"),
+        client=AsyncFakeModelClient([text("hello there")]))
+
+    async def run():
+        task = await start(server)
+        first = await connect(server)
+        second = await connect(server)
+        try:
+            assert (await first.request(type="open"))["type"] == "opened"
+            event = await first.request(type="input", text="hi")
+            while event["type"] != "done":
+                event = await first.event()
+            assert event["text"] == "hello there"
+
+            # resuming the latest session resolves to the open one
+            event = await second.request(type="open", resume=True)
+            assert event["type"] == "error"
+            assert "open elsewhere" in event["message"]
+        finally:
+            first.close()
+            second.close()
+            server.stop()
+            await task
+
+    asyncio.run(run())
+
+
+def test_sessions_send_only_the_relevant_abilities(tmp_path):
+    def add_abilities(assistant):
+        for ability in (abilities.execute, abilities.read_file,
+                        abilities.search_file, abilities.get_path_type):
+            assistant.add_ability(ability)
+
+    server = AssistantServer(
+        "test", add_abilities, tmp_path / "server.sock",
+        store=SessionStore(tmp_path / "sessions.sqlite3"),
+        client=AsyncFakeModelClient([text("found it")]), tools_limit=1)
+
+    async def run():
+        async def drain():
+            pass
+
+        assistant = server.create_assistant(lambda event: None, drain)
+        try:
+            await assistant("search the file for a pattern",
+                            with_output=False, with_speech=False)
+            return assistant.selected_abilities
+        finally:
+            assistant.close()
+
+    # the pinned abilities are sent with the most relevant one
+    assert asyncio.run(run()) == [
+        "execute", "read_result", "remember_machine_fact", "search_file"]
+
+
+def test_ability_errors_are_sent_to_the_client(tmp_path, capsys):
+    server = AssistantServer(
+        "test", lambda assistant: assistant.add_ability(abilities.execute),
+        tmp_path / "server.sock",
+        store=SessionStore(tmp_path / "sessions.sqlite3"),
+        client=AsyncFakeModelClient([
+            tool_calls(ScriptedCall("execute", {"command": "echo oops >&2"})),
+            text("done")]))
+
+    async def run():
+        task = await start(server)
+        client = await connect(server)
+        try:
+            await client.request(type="open")
+            events = [await client.request(type="input", text="run it")]
+            while events[-1]["type"] != "done":
+                events.append(await client.event())
+            return events
+        finally:
+            client.close()
+            server.stop()
+            await task
+
+    assert {"type": "stderr", "text": "oops"} in asyncio.run(run())
+    assert "oops" not in capsys.readouterr().err
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import asyncio
+from typing import List
+
+import abilities
+from assistant import Assistant
+from async_assistant import AsyncAssistant
+from fake_client import (AsyncFakeModelClient, FakeModelClient, ScriptedCall,
+                         text, tool_calls)
+from shell import ShellPool
+
+
+def create_assistant(*commands: str) -> AsyncAssistant:
+    script = []
+    for command in commands:
+        script.append(tool_calls(ScriptedCall("execute",
+                                              {"command": command})))
+        script.append(text("done"))
+
+    assistant = AsyncAssistant(
+        "test", client=AsyncFakeModelClient(script))
+    assistant.add_ability(abilities.execute)
+    return assistant
+
+
+def tool_responses(assistant: Assistant) -> List[str]:
+    return [str(message["content"]) for message in assistant.history
+            if isinstance(message, dict) and message["role"] == "tool"]
+
+
+def run(assistant: AsyncAssistant) -> str:
+    asyncio.run(assistant("run it", with_output=False, with_speech=False))
+    return json.loads(tool_responses(assistant)[-1])["stdout"]
+
+
+def test_sessions_have_their_own_shell():
+    first = create_assistant("cd / && export NAME=first", "echo $PWD $NAME")
+    second = create_assistant("echo $PWD $NAME")
+    try:
+        run(first)
+
+        assert run(second) == os.getcwd()
+        assert run(first) == "/ first"
+    finally:
+        first.close()
+        second.close()
+
+
+def test_relative_paths_start_from_the_shell_directory(tmp_path):
+    (tmp_path / "notes.txt").write_text("hello")
+    assistant = create_assistant(f"cd {tmp_path}")
+    assistant.add_ability(abilities.get_path_type)
+    try:
+        run(assistant)
+
+        ability = assistant._abilities["get_path_type"]
+        assert assistant._run_ability(ability, {"path": "notes.txt"}) \
+            == "file"
+    finally:
+        assistant.close()
+
+
+def test_concurrent_command_starts_in_the_shell_directory(tmp_path):
+    pool = ShellPool()
+    try:
+        pool.run(f"cd {tmp_path} && export NAME=pinned")
+
+        async def run_both():
+            return await asyncio.gather(
+                pool.run_async("sleep 0.2; echo $PWD $NAME"),
+                pool.run_async("echo $PWD $NAME"))
+
+        pinned, spare = asyncio.run(run_both())
+
+        assert pinned.stdout == f"{tmp_path} pinned"
+        assert spare.stdout == str(tmp_path)
+        assert pool.cwd == str(tmp_path)
+    finally:
+        pool.close()
+
+
+def test_interrupted_command_is_killed_in_the_shell_directory(tmp_path):
+    marker = tmp_path / "finished"
+    assistant = Assistant("test", client=FakeModelClient([
+        tool_calls(ScriptedCall("execute", {"command": f"cd {tmp_path}"})),
+        text("done"),
+        tool_calls(ScriptedCall("execute",
+                                {"command": f"sleep 1; touch {marker}"})),
+        text("done"),
+        tool_calls(ScriptedCall("execute", {"command": "pwd"})),
+        text("done"),
+    ]))
+    assistant.add_ability(abilities.execute)
+    wait_ability = assistant._wait_ability
+
+    def interrupt(future, started, *args):
+        # the user presses Ctrl-C while the command is running
+        started.result()
+        time.sleep(0.3)
+        raise KeyboardInterrupt
+
+    try:
+        assistant("cd", with_output=False, with_speech=False)
+        assistant._wait_ability = interrupt  # type: ignore[method-assign]
+        assistant("sleep", with_output=False, with_speech=False)
+        assistant._wait_ability = wait_ability  # type: ignore[method-assign]
+
+        assert tool_responses(assistant)[-1] == \
+            "Error: Ability execution interrupted by the user!"
+        assistant("pwd", with_output=False, with_speech=False)
+        assert json.loads(tool_responses(assistant)[-1])["stdout"] == \
+            str(tmp_path)
+
+        time.sleep(1)
+        assert not marker.exists()
+    finally:
+        assistant.close()
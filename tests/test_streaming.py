@@ -0,0 +1,77 @@
+import time
+import threading
+from typing import List
+
+import pytest
+
+from streaming import SpeechPipeline
+
+
+def test_sentences_are_played_in_order():
+    played: List[bytes] = []
+    pipeline = SpeechPipeline(str.encode, played.append)
+
+    for sentence in ("one.", "two.", "three."):
+        pipeline.put(sentence)
+    pipeline.close()
+
+    assert played == [b"one.", b"two.", b"three."]
+
+
+def test_next_sentence_is_synthesized_while_playing():
+    synthesized = threading.Event()
+    overlapped: List[bool] = []
+
+    def synthesize(sentence: str) -> bytes:
+        if sentence == "second":
+            synthesized.set()
+        return sentence.encode()
+
+    def play(sound: bytes):
+        if sound == b"first":
+            # the second sentence is ready before the first one ends
+            overlapped.append(synthesized.wait(2))
+
+    pipeline = SpeechPipeline(synthesize, play)
+    pipeline.put("first")
+    pipeline.put("second")
+    pipeline.close()
+
+    assert overlapped == [True]
+
+
+def test_failed_synthesis_stops_the_pipeline():
+    played: List[bytes] = []
+
+    def synthesize(sentence: str) -> bytes:
+        if sentence == "bad":
+            raise RuntimeError("synthesis failed")
+        return sentence.encode()
+
+    pipeline = SpeechPipeline(synthesize, played.append)
+    pipeline.put("good")
+    pipeline.put("bad")
+    # the queue is never full once the pipeline stopped
+    for _ in range(SpeechPipeline._QUEUE_SIZE_ * 4):
+        pipeline.put("dropped")
+
+    with pytest.raises(RuntimeError, match="synthesis failed"):
+        pipeline.close()
+    assert b"dropped" not in played
+    assert isinstance(pipeline.error, RuntimeError)
+
+
+def test_stop_drops_the_queued_sentences():
+    played: List[bytes] = []
+
+    def play(sound: bytes):
+        time.sleep(0.1)
+        played.append(sound)
+
+    pipeline = SpeechPipeline(str.encode, play)
+    for index in range(SpeechPipeline._QUEUE_SIZE_):
+        pipeline.put(str(index))
+    pipeline.stop()
+    pipeline.close()
+
+    assert len(played) < SpeechPipeline._QUEUE_SIZE_
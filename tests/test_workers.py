@@ -0,0 +1,110 @@
+import time
+import asyncio
+import threading
+from typing import List
+
+from assistant import Assistant
+from async_assistant import AsyncAssistant
+from fake_client import (AsyncFakeModelClient, FakeModelClient, ScriptedCall,
+                         text, tool_calls)
+from workers import AbilityExecutor, cancel_token
+
+released = threading.Event()
+
+
+@Assistant.ability(timeout=0.5)
+def nap() -> str:
+    """Sleep a little"""
+    time.sleep(0.3)
+    return "rested"
+
+
+@Assistant.ability(timeout=0.2)
+def hang() -> str:
+    """Never return in time"""
+    released.wait(5)
+    return "late"
+
+
+@Assistant.ability(timeout=0.2)
+def wait_cancel() -> str:
+    """Wait until canceled"""
+    stopped = threading.Event()
+    token = cancel_token()
+    assert token is not None
+    token.add(stopped.set)
+    stopped.wait(5)
+    return "stopped"
+
+
+def tool_results(assistant: Assistant) -> List[str]:
+    return [str(message["content"]) for message in assistant.history
+            if isinstance(message, dict) and message["role"] == "tool"]
+
+
+def script(*names: str):
+    return [tool_calls(*[ScriptedCall(name, {}) for name in names]),
+            text("done")]
+
+
+def test_queued_abilities_get_their_whole_timeout():
+    # one worker, the second nap waits for the first one before it runs
+    assistant = Assistant(
+        "test", client=FakeModelClient(script("nap", "nap")),
+        executor=AbilityExecutor(1))
+    assistant.add_ability(nap)
+
+    assistant("nap twice", with_output=False, with_speech=False)
+
+    assert tool_results(assistant) == ["rested", "rested"]
+
+
+def test_async_queued_abilities_get_their_whole_timeout():
+    assistant = AsyncAssistant(
+        "test", client=AsyncFakeModelClient(script("nap", "nap")),
+        executor=AbilityExecutor(1))
+    assistant.add_ability(nap)
+
+    asyncio.run(assistant("nap twice", with_output=False, with_speech=False))
+
+    assert tool_results(assistant) == ["rested", "rested"]
+
+
+def test_stuck_worker_is_replaced():
+    released.clear()
+    executor = AbilityExecutor(1)
+    assistant = Assistant(
+        "test", client=FakeModelClient(script("hang") + script("nap")),
+        executor=executor)
+    assistant.add_ability(hang)
+    assistant.add_ability(nap)
+    try:
+        assistant("hang", with_output=False, with_speech=False)
+        assert executor.stuck == 1
+
+        # the only worker is stuck, a new one runs the next ability
+        assistant("nap", with_output=False, with_speech=False)
+        assert tool_results(assistant) == [
+            "Error: Ability execution timed out, it was abandoned and may "
+            "still be running!", "rested"]
+    finally:
+        released.set()
+
+    deadline = time.monotonic() + 5
+    while executor.stuck > 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert executor.stuck == 0
+    executor.shutdown()
+
+
+def test_ability_honours_its_cancel_token():
+    assistant = AsyncAssistant(
+        "test", client=AsyncFakeModelClient(script("wait_cancel")),
+        executor=AbilityExecutor(1))
+    assistant.add_ability(wait_cancel)
+
+    start = time.monotonic()
+    asyncio.run(assistant("wait", with_output=False, with_speech=False))
+
+    assert tool_results(assistant) == ["Error: Ability execution timed out!"]
+    assert time.monotonic() - start < 2
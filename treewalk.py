@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
+from typing import Callable, Dict, Iterable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def subtree(root: str) -> Tuple[str, str, str]:
+    """The parameters of path = ? OR (path > ? AND path < ?) selecting a
+    directory and every path under it"""
+    # every path under the root sorts between root/ and root0
+    prefix = root.rstrip("/")
+    return root, prefix + "/", prefix + "0"
+
+
+def walk(root: str,
+         scan: Callable[[str], Optional[T]],
+         subdirs: Callable[[str, T], Iterable[str]],
+         max_workers: int,
+         deadline: float) -> Tuple[Dict[str, T], int, bool]:
+    """Scan a directory and every directory under it on a thread pool, a
+    directory is scanned as soon as its parent is, scan returns None on
+    failure and subdirs gives the names of the directories to enter
+
+    Returns the results by path, the number of failures and whether the whole
+    tree was scanned before the deadline"""
+    results: Dict[str, T] = {}
+    errors = 0
+    complete = True
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        pending: Dict[Future, str] = {executor.submit(scan, root): root}
+        while len(pending) > 0:
+            done, _ = wait(pending, deadline - time.monotonic(),
+                           FIRST_COMPLETED)
+            if len(done) == 0 or time.monotonic() > deadline:
+                complete = False
+                executor.shutdown(wait=True, cancel_futures=True)
+                break
+
+            for future in done:
+                path = pending.pop(future)
+                result = future.result()
+                if result is None:
+                    errors += 1
+                    continue
+
+                results[path] = result
+                for name in subdirs(path, result):
+                    child = os.path.join(path, name)
+                    pending[executor.submit(scan, child)] = child
+
+    return results, errors, complete
@@ -0,0 +1,192 @@
+import queue
+import threading
+import contextvars
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+_WorkItem = Tuple[Future, Callable[..., Any], tuple, Dict[str, Any]]
+
+
+class CancelToken:
+    """Stop a running ability, the ability adds the callbacks stopping its
+    work like killing its command and they are called once on cancel"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self._started = False
+        self._cancelled = False
+        self._stopped = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def start(self) -> bool:
+        """Mark the ability as running, False when it was canceled before
+        so it must not run"""
+        with self._lock:
+            self._started = True
+            return not self._cancelled
+
+    def add(self, callback: Callable[[], None]):
+        """Call back on cancel, at once when it is already canceled"""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove(self, callback: Callable[[], None]):
+        """Forget a callback once the work it stops is done"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self) -> bool:
+        """Cancel the ability, returns False when it is running without a
+        way to stop it so it keeps running in the background"""
+        with self._lock:
+            if self._cancelled:
+                return self._stopped
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+            self._stopped = not self._started or len(callbacks) > 0
+
+        for callback in callbacks:
+            callback()
+        return self._stopped
+
+
+# the cancel token of the ability running in this thread or task
+_current_token: "contextvars.ContextVar[Optional[CancelToken]]" = \
+    contextvars.ContextVar("cancel_token", default=None)
+
+
+def cancel_token() -> Optional[CancelToken]:
+    """The cancel token of the running ability, None out of an assistant"""
+    return _current_token.get()
+
+
+class AbilityExecutor(Executor):
+    """A thread pool for the abilities where the worker of an ability that
+    timed out is given up and replaced by a new one, so the stuck abilities
+    never take all the workers, the given up worker exits when its ability
+    returns
+
+    The workers are daemon threads so a stuck ability never holds the exit"""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "ability"):
+        self._max_workers = max_workers
+        self._prefix = thread_name_prefix
+        self._queue: "queue.SimpleQueue[Optional[_WorkItem]]" = \
+            queue.SimpleQueue()
+        self._idle = threading.Semaphore(0)
+        self._lock = threading.Lock()
+        # the workers that are not given up
+        self._workers = 0
+        self._threads: Set[threading.Thread] = set()
+        # the given up futures and the threads still running them
+        self._stuck: Dict[Future, threading.Thread] = {}
+        self._running: Dict[Future, threading.Thread] = {}
+        self._started = 0
+        self._shutdown = False
+
+    @property
+    def stuck(self) -> int:
+        """The number of workers running an ability that was given up"""
+        with self._lock:
+            return len(self._stuck)
+
+    def submit(self, fn: Callable[..., Any], /, *args, **kwargs) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError(
+                    "cannot schedule new futures after shutdown")
+            self._queue.put((future, fn, args, kwargs))
+            self._adjust()
+        return future
+
+    def _adjust(self):
+        # called with the lock held, an idle worker takes the item
+        if self._idle.acquire(blocking=False):
+            return
+        if self._workers < self._max_workers:
+            self._workers += 1
+            self._started += 1
+            thread = threading.Thread(
+                target=self._work, name=f"{self._prefix}_{self._started}",
+                daemon=True)
+            self._threads.add(thread)
+            thread.start()
+
+    def abandon(self, future: Future):
+        """Give up a future that timed out, it is canceled if it did not
+        start yet otherwise its worker is replaced by a new one"""
+        if future.cancel():
+            return
+        with self._lock:
+            thread = self._running.get(future)
+            if thread is None or future in self._stuck:
+                return
+            self._stuck[future] = thread
+            self._workers -= 1
+            if not self._shutdown and not self._queue.empty():
+                self._adjust()
+
+    def _work(self):
+        thread = threading.current_thread()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                future, fn, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    self._idle.release()
+                    continue
+
+                with self._lock:
+                    self._running[future] = thread
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+
+                with self._lock:
+                    del self._running[future]
+                    if self._stuck.pop(future, None) is not None:
+                        # it was replaced, it comes back only if there is
+                        # room for it
+                        if self._shutdown or \
+                                self._workers >= self._max_workers:
+                            return
+                        self._workers += 1
+                self._idle.release()
+        finally:
+            with self._lock:
+                self._threads.discard(thread)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        item[0].cancel()
+            threads = set(self._threads)
+            stuck = set(self._stuck.values())
+            for _ in threads:
+                self._queue.put(None)
+
+        if wait:
+            # the stuck workers may never return
+            for thread in threads - stuck:
+                thread.join()